@@ -0,0 +1,331 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from random import Random
+from time import perf_counter, sleep
+
+import requests
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, 'src')
+sys.path.append(SRC_DIR)
+
+from seed.coremetadata import address, customer, engine  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+SAMPLE_SIZE = 1000
+
+# The uvicorn application and extra environment of every target.
+TARGETS = {
+    'app': ('main:app', {'DB_MODE': 'sync'}),
+    'app-async': ('main:app', {'DB_MODE': 'async'}),
+    # main_core imports its neighbours as top level modules.
+    'core': ('core.main_core:app', {'PYTHONPATH': os.pathsep.join(
+        [SRC_DIR, os.path.join(SRC_DIR, 'seed'), os.path.join(SRC_DIR, 'models')])}),
+}
+
+
+def new_customer(rng):
+    return {'first_name': 'Bench', 'last_name': f'Customer{rng.randint(0, 10 ** 6)}',
+            'age': rng.randint(1, 99), 'height': 170.0, 'weight': 70.0}
+
+
+def list_customers(client, ids, rng):
+    return client.get('/customers/', params={'limit': 100})
+
+
+def get_customer(client, ids, rng):
+    return client.get(f'/customers/{rng.choice(ids["customer"])}')
+
+
+def list_addresses(client, ids, rng):
+    return client.get('/addresses/', params={'limit': 100})
+
+
+def get_address(client, ids, rng):
+    return client.get(f'/addresses/{rng.choice(ids["address"])}')
+
+
+def search_customers(client, ids, rng):
+    return client.get('/customers/search', params={'q': rng.choice(ids['name'])[:4]})
+
+
+def add_customer(client, ids, rng):
+    return client.post('/customers/', json=new_customer(rng))
+
+
+def update_customer(client, ids, rng):
+    return client.patch(f'/customers/{rng.choice(ids["customer"])}', json={'age': rng.randint(1, 99)})
+
+
+# The Core variant has no list limit and only takes complete customers.
+def core_list_customers(client, ids, rng):
+    return client.get('/customers')
+
+
+def core_add_customer(client, ids, rng):
+    return client.post('/customers', json=new_customer(rng))
+
+
+def core_update_customer(client, ids, rng):
+    return client.patch(f'/customers/{rng.choice(ids["customer"])}', json=new_customer(rng))
+
+
+def mixed(read, update, insert):
+    def scenario(client, ids, rng):
+        roll = rng.random()
+        if roll < 0.8:
+            return read(client, ids, rng)
+        if roll < 0.9:
+            return update(client, ids, rng)
+        return insert(client, ids, rng)
+    return scenario
+
+
+APP_SCENARIOS = {
+    'list_customers': list_customers,
+    'get_customer': get_customer,
+    'list_addresses': list_addresses,
+    'get_address': get_address,
+    'search_customers': search_customers,
+    'mixed': mixed(get_customer, update_customer, add_customer),
+}
+
+# Writes run last so the read scenarios see exactly the seeded data.
+SCENARIOS = {
+    'app': APP_SCENARIOS,
+    'app-async': {k: v for (k, v) in APP_SCENARIOS.items() if k != 'search_customers'},
+    'core': {
+        'list_customers': core_list_customers,
+        'get_customer': get_customer,
+        'mixed': mixed(get_customer, core_update_customer, core_add_customer),
+    },
+}
+
+
+class Client:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.local = threading.local()
+
+    @property
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def get(self, path, **kwargs):
+        return self.session.get(self.base_url + path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.session.post(self.base_url + path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.session.patch(self.base_url + path, **kwargs)
+
+
+def percentile(ordered, p):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def summarize(latencies, errors, elapsed):
+    ordered = sorted(latencies)
+    ms = [v * 1000 for v in ordered]
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'throughput': len(ordered) / elapsed if elapsed else 0.0,
+        'mean_ms': sum(ms) / len(ms) if ms else None,
+        'p50_ms': percentile(ms, 50),
+        'p95_ms': percentile(ms, 95),
+        'p99_ms': percentile(ms, 99),
+    }
+
+
+def run_scenario(client, scenario, ids, seed, concurrency, duration, warmup):
+    start = perf_counter()
+    measure_from, deadline = start + warmup, start + warmup + duration
+    results = []
+
+    def worker(n):
+        rng = Random(f'{seed}:{n}')
+        latencies, errors = [], 0
+        while True:
+            began = perf_counter()
+            if began >= deadline:
+                break
+            try:
+                ok = scenario(client, ids, rng).status_code < 400
+            except requests.RequestException:
+                ok = False
+            if began >= measure_from:
+                latencies.append(perf_counter() - began)
+                errors += not ok
+        results.append((latencies, errors))
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return summarize([v for (l, _) in results for v in l], sum(e for (_, e) in results), duration)
+
+
+def seed_database(size, seed):
+    subprocess.run([sys.executable, '-m', 'seed.seeddb', '--customers', str(size),
+                    '--seed', str(seed)], cwd=SRC_DIR, check=True)
+
+
+def sample_ids(seed):
+    with engine.connect() as connection:
+        connection.execute(select([func.setseed(((seed % 1000) / 1000.0))]))
+        sample = select([customer.c.id, customer.c.first_name]).\
+            order_by(func.random()).limit(SAMPLE_SIZE)
+        customers = connection.execute(sample).fetchall()
+        addresses = connection.execute(select([address.c.id]).order_by(func.random()).
+                                       limit(SAMPLE_SIZE)).fetchall()
+    return {'customer': [str(r[0]) for r in customers],
+            'name': [r[1] for r in customers],
+            'address': [str(r[0]) for r in addresses]}
+
+
+class Server:
+    def __init__(self, target, port, workers):
+        self.app, self.env = TARGETS[target]
+        self.port = port
+        self.workers = workers
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', self.app, '--port', str(self.port),
+             '--workers', str(self.workers), '--log-level', 'warning'],
+            cwd=SRC_DIR, env={**os.environ, **self.env})
+        client = Client(f'http://127.0.0.1:{self.port}')
+        for _ in range(300):
+            try:
+                if client.get('/').status_code == 200:
+                    return client
+            except requests.ConnectionError:
+                pass
+            if self.process.poll() is not None:
+                break
+            sleep(0.1)
+        self.__exit__()
+        raise RuntimeError(f"{self.app} did not start")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.wait()
+
+
+def run(args):
+    results = {}
+    for size in args.sizes:
+        for target in args.targets:
+            scenarios = {k: v for (k, v) in SCENARIOS[target].items()
+                         if not args.scenarios or k in args.scenarios}
+            if not scenarios:
+                continue
+            # Reseeded for every target, the previous one's writes included.
+            seed_database(size, args.seed)
+            ids = sample_ids(args.seed)
+            with Server(target, args.port, args.server_workers) as client:
+                for (name, scenario) in scenarios.items():
+                    key = f'{size}/{target}/{name}'
+                    results[key] = run_scenario(client, scenario, ids, args.seed,
+                                                args.concurrency, args.duration, args.warmup)
+                    print(format_result(key, results[key]), flush=True)
+    return results
+
+
+def format_result(key, result):
+    def ms(value):
+        return '-' if value is None else f'{value:.1f}'
+
+    return f"{key:<40} {result['throughput']:>9.1f} req/s  p50 {ms(result['p50_ms']):>7}" \
+        f"  p95 {ms(result['p95_ms']):>7}  p99 {ms(result['p99_ms']):>7}  errors {result['errors']}"
+
+
+# A regression is a slower p95 or lower throughput than the baseline allows,
+# or errors where the baseline had none.
+def compare(results, baseline, tolerance):
+    regressions = []
+    for (key, base) in baseline.items():
+        result = results.get(key)
+        if result is None:
+            continue
+        if base['p95_ms'] is not None and result['p95_ms'] is not None and \
+                result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{key}: p95 {result['p95_ms']:.1f}ms, "
+                               f"baseline {base['p95_ms']:.1f}ms")
+        if result['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{key}: {result['throughput']:.1f} req/s, "
+                               f"baseline {base['throughput']:.1f} req/s")
+        if result['errors'] and not base['errors']:
+            regressions.append(f"{key}: {result['errors']} errors")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the API endpoints against a real, seeded database.")
+    parser.add_argument('--sizes', type=lambda v: [int(s) for s in v.split(',')],
+                        default=[1000, 100000], help="comma separated customer counts")
+    parser.add_argument('--targets', type=lambda v: v.split(','), default=list(TARGETS))
+    parser.add_argument('--scenarios', type=lambda v: v.split(','), default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds measured")
+    parser.add_argument('--warmup', type=float, default=2.0, help="seconds not measured")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--server-workers', type=int, default=1)
+    parser.add_argument('--output', default=os.path.join(BENCH_DIR, 'results.json'))
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed relative slowdown before a result is a regression")
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args(argv)
+    unknown = set(args.targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    report = {
+        'time': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'settings': {k: getattr(args, k) for k in ('sizes', 'seed', 'concurrency', 'duration',
+                                                   'warmup', 'server_workers')},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, nothing to compare against")
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f)['results'], args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
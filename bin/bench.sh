@@ -0,0 +1,4 @@
+#!/usr/bin/env bash
+
+# Fails when a result regressed past the stored baseline, see bench/bench.py --help.
+python bench/bench.py "$@"
@@ -1,15 +1,46 @@
 #!/usr/bin/env bash
 
-cd src
+# SERVER_MODE=production runs WEB_CONCURRENCY workers, one per CPU unless set,
+# on uvloop and httptools; otherwise one reloading development server.
+# Migrating and seeding the database first are opt in, with MIGRATE=true and
+# SEED=true, so that they run once rather than in every worker.
+
+set -e
 
-echo "MIGRATING DATABASE..."
+cd src
 
-alembic upgrade head
+if [ "$MIGRATE" = "true" ]; then
+    echo "MIGRATING DATABASE..."
+    alembic upgrade head
+fi
 
-echo "SEEDING DATABASE..."
+if [ "$SEED" = "true" ]; then
+    echo "SEEDING DATABASE..."
+    python -m seed.seeddb --skip-if-exists
+fi
 
-python seed/seeddb.py
+if [ "$SERVER_MODE" = "production" ]; then
+    WEB_CONCURRENCY=${WEB_CONCURRENCY:-$(nproc)}
+    # Where the workers leave their counts for /metrics to sum; emptied so
+    # that a restart starts the counters from zero.
+    export METRICS_DIR=${METRICS_DIR:-/tmp/metrics}
+    rm -rf "$METRICS_DIR"
+    echo "STARTING UVICORN SERVER WITH $WEB_CONCURRENCY WORKERS..."
+    # On SIGTERM uvicorn stops accepting connections, finishes the requests
+    # in flight and runs the shutdown handlers. Its 0.13 parent process only
+    # waits for the workers though, so the signal goes to the whole process
+    # group. --lifespan on makes a failed startup fatal.
+    uvicorn main:app --host 0.0.0.0 --workers "$WEB_CONCURRENCY" \
+        --loop uvloop --http httptools --lifespan on &
+    pid=$!
+    trap 'trap "" TERM INT; kill -TERM 0' TERM INT
+    status=0
+    while kill -0 "$pid" 2>/dev/null; do
+        wait "$pid" && status=0 || status=$?
+    done
+    exit $status
+fi
 
 echo "STARING UVICORN SERVER..."
 
-uvicorn main:app --host 0.0.0.0 --reload
+exec uvicorn main:app --host 0.0.0.0 --reload
@@ -0,0 +1,48 @@
+"""add audit history indexes
+
+Changing the type of audit.time rewrites the whole audit table under an
+ACCESS EXCLUSIVE lock, blocking every audit write and read until it is
+done. Run this upgrade in a maintenance window sized to the audit table.
+The downgrade rewrites it the same way. Only the index builds avoid
+blocking the writers.
+
+Revision ID: 3c5e2a9d41b7
+Revises: 10781f5837eb
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c5e2a9d41b7'
+down_revision = '10781f5837eb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # audit.time only ever stored the time of day, so existing rows cannot be
+    # ordered or range filtered; they are kept on the epoch date. This rewrites
+    # the table and blocks the audit writers until it is done.
+    op.alter_column('audit', 'time', type_=sa.DateTime, existing_type=sa.Time,
+                    postgresql_using="date '1970-01-01' + \"time\"")
+    # The audit table is append-heavy and large, so at least build the indexes
+    # without blocking the writers again.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_audit_item_id_time', 'audit', ['item_id', 'time', 'id'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_audit_table_time', 'audit', ['table', 'time', 'id'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_audit_time', 'audit', ['time', 'id'],
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_audit_time', 'audit', postgresql_concurrently=True)
+        op.drop_index('ix_audit_table_time', 'audit', postgresql_concurrently=True)
+        op.drop_index('ix_audit_item_id_time', 'audit', postgresql_concurrently=True)
+    op.alter_column('audit', 'time', type_=sa.Time, existing_type=sa.DateTime,
+                    postgresql_using='"time"::time')
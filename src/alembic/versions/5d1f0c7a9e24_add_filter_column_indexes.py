@@ -0,0 +1,38 @@
+"""add filter column indexes
+
+Revision ID: 5d1f0c7a9e24
+Revises: 3c5e2a9d41b7
+Create Date: 2026-10-18 14:41:07.518263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d1f0c7a9e24'
+down_revision = '3c5e2a9d41b7'
+branch_labels = None
+depends_on = None
+
+# Every column the list endpoints filter on, paired with id so the index
+# also serves the keyset ORDER BY (col, id).
+INDEXES = {
+    'customer': ['first_name', 'middle_name', 'last_name', 'age', 'married', 'height', 'weight'],
+    'address': ['customer_id', 'street', 'city', 'country'],
+}
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for (table, columns) in INDEXES.items():
+            for column in columns:
+                op.create_index(f'ix_{table}_{column}', table, [column, 'id'],
+                                postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for (table, columns) in INDEXES.items():
+            for column in columns:
+                op.drop_index(f'ix_{table}_{column}', table, postgresql_concurrently=True)
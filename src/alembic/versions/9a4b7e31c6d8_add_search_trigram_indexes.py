@@ -0,0 +1,41 @@
+"""add search trigram indexes
+
+Revision ID: 9a4b7e31c6d8
+Revises: 5d1f0c7a9e24
+Create Date: 2026-10-18 16:05:52.871390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4b7e31c6d8'
+down_revision = '5d1f0c7a9e24'
+branch_labels = None
+depends_on = None
+
+# The columns /customers/search matches against; trigram indexes serve both
+# the ILIKE prefix match and the typo tolerant %> word similarity match.
+INDEXES = {
+    'customer': ['first_name', 'middle_name', 'last_name'],
+    'address': ['street', 'city'],
+}
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    with op.get_context().autocommit_block():
+        for (table, columns) in INDEXES.items():
+            for column in columns:
+                op.create_index(f'ix_{table}_{column}_trgm', table, [column],
+                                postgresql_using='gin',
+                                postgresql_ops={column: 'gin_trgm_ops'},
+                                postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for (table, columns) in INDEXES.items():
+            for column in columns:
+                op.drop_index(f'ix_{table}_{column}_trgm', table, postgresql_concurrently=True)
@@ -0,0 +1,61 @@
+"""add customer stats view
+
+Revision ID: b3d81f6e2a57
+Revises: 9a4b7e31c6d8
+Create Date: 2026-10-18 18:22:40.512963
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d81f6e2a57'
+down_revision = '9a4b7e31c6d8'
+branch_labels = None
+depends_on = None
+
+# The location columns each branch groups on, and the rolled_up bits of
+# those it does not (country 8, city 4, married 2, age_bucket 1). A customer
+# with several addresses in one place is only counted once, which a single
+# CUBE over the address join could not do.
+LOCATIONS = [
+    ((), 0b1100),
+    (('country',), 0b0100),
+    (('city',), 0b1000),
+    (('country', 'city'), 0b0000),
+]
+
+
+def branch(location, rolled_up):
+    columns = ', '.join(f'{c}' if c in location else f'NULL::varchar(50) AS {c}'
+                        for c in ('country', 'city'))
+    located = ''.join(f', a.{c}' for c in location)
+    join = ' LEFT JOIN address a ON a.customer_id = c.id' if location else ''
+    group_by = ''.join(f'{c}, ' for c in location)
+    return f'''
+        SELECT GROUPING(married, age_bucket) | {rolled_up} AS rolled_up, {columns},
+               married, age_bucket, count(*) AS customers, avg(age)::float8 AS avg_age,
+               avg(height) AS avg_height, avg(weight) AS avg_weight
+        FROM (SELECT DISTINCT c.id, c.married, c.age / 10 * 10 AS age_bucket,
+                     c.age, c.height, c.weight{located}
+              FROM customer c{join}) AS located
+        GROUP BY {group_by}CUBE (married, age_bucket)'''
+
+
+def upgrade():
+    op.create_table('stats_refresh',
+    sa.Column('view', sa.String(length=63), nullable=False),
+    sa.Column('refreshed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('view')
+    )
+    op.execute('CREATE MATERIALIZED VIEW customer_stats AS' +
+               ' UNION ALL'.join(branch(*location) for location in LOCATIONS))
+    # REFRESH ... CONCURRENTLY needs a unique index over every row.
+    op.create_index('ix_customer_stats', 'customer_stats',
+                    ['rolled_up', 'country', 'city', 'married', 'age_bucket'], unique=True)
+
+
+def downgrade():
+    op.execute('DROP MATERIALIZED VIEW customer_stats')
+    op.drop_table('stats_refresh')
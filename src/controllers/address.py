@@ -1,9 +1,21 @@
-from typing import List
+from typing import Any, List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from controllers.audit import get_history
+from controllers.dependencies import (ChangeParams, HistoryParams, PageParams,
+                                      get_session)
+from controllers.responses import (batch_response, change_where,
+                                   conditional_get, conditional_page,
+                                   ndjson_response, wants_ndjson)
+from fastapi import (APIRouter, Body, Depends, Header, HTTPException, Response,
+                     status)
 from models.address import Address
-from models.pydanticmodels import AddressIn, AddressInPatch, AddressOut
+from models.pagination import PaginationError
+from models.pydanticmodels import (AddressBatchOut, AddressBulkIn, AddressIn,
+                                   AddressInPatch, AddressOut, AuditOut,
+                                   BatchGetIn, BulkItemError, BulkResult,
+                                   ChangeResult, parse_items)
+from sqlalchemy.orm import Session
 from sqlalchemy.orm.exc import NoResultFound
 
 router = APIRouter(
@@ -13,35 +25,94 @@ router = APIRouter(
 
 
 @router.get("/", response_model=List[AddressOut], status_code=status.HTTP_200_OK)
-def get(address_in: AddressInPatch = Depends()):
-    return Address().get_all(**address_in.dict())
+def get(response: Response,
+        address_in: AddressInPatch = Depends(),
+        page: PageParams = Depends(),
+        stream: bool = False,
+        accept: Optional[str] = Header(None),
+        if_none_match: Optional[str] = Header(None),
+        session: Session = Depends(get_session)):
+    if wants_ndjson(stream, accept):
+        rows = Address(session).stream(**address_in.dict(exclude_none=True))
+        return ndjson_response(AddressOut, rows)
+    try:
+        items, next_cursor = Address(session).get_page(
+            **page.dict(), **address_in.dict(exclude_none=True))
+    except PaginationError as e:
+        raise HTTPException(400, str(e))
+    return conditional_page(Address, AddressOut, items, next_cursor, if_none_match, response)
 
 
 @router.get("/{address_id}", response_model=AddressOut, status_code=status.HTTP_200_OK)
-def get_address(address_id: UUID):
+def get_address(address_id: UUID,
+                response: Response,
+                if_none_match: Optional[str] = Header(None),
+                session: Session = Depends(get_session)):
     try:
-        return Address().get(id=address_id)
+        return conditional_get(Address(session), AddressOut, address_id, if_none_match, response)
     except NoResultFound:
         raise HTTPException(404, f"Address with id: {address_id} not found")
 
 
+@router.get("/{address_id}/history", response_model=List[AuditOut], status_code=status.HTTP_200_OK)
+def get_address_history(address_id: UUID,
+                        response: Response,
+                        params: HistoryParams = Depends(),
+                        session: Session = Depends(get_session)):
+    return get_history(response, session, params, table=Address.__tablename__, item_id=address_id)
+
+
 @router.post("/", response_model=AddressOut, status_code=status.HTTP_201_CREATED)
-def add_address(address_in: AddressIn):
+def add_address(address_in: AddressIn, session: Session = Depends(get_session)):
+
+    return Address(session).insert(**address_in.dict())
+
+
+@router.post("/batch-get", response_model=AddressBatchOut, status_code=status.HTTP_200_OK)
+def batch_get_addresses(batch: BatchGetIn, response: Response, session: Session = Depends(get_session)):
+    ids = list(dict.fromkeys(batch.ids))
+    return batch_response(AddressBatchOut, ids, Address(session).get_many(ids), response)
+
+
+@router.post("/bulk", response_model=BulkResult, status_code=status.HTTP_200_OK)
+def bulk_upsert_addresses(items: List[Any] = Body(...), session: Session = Depends(get_session)):
+    parsed, errors = parse_items(AddressBulkIn, items)
+    ids, failed = Address(session).bulk_upsert([item.dict() for (_, item) in parsed])
+    errors += [BulkItemError(index=parsed[i][0], detail=detail) for (i, detail) in failed.items()]
+    return BulkResult(upserted=ids, errors=sorted(errors, key=lambda e: e.index))
+
+
+@router.patch("/", response_model=ChangeResult, status_code=status.HTTP_200_OK)
+def update_addresses(patch: AddressInPatch,
+                     address_in: AddressInPatch = Depends(),
+                     change: ChangeParams = Depends(),
+                     session: Session = Depends(get_session)):
+    values = patch.dict(exclude_unset=True)
+    if not values:
+        raise HTTPException(400, "No fields to update")
+    return change_where(Address(session), change, 'update_where', values,
+                        **address_in.dict(exclude_none=True))
+
 
-    return Address().insert(**address_in.dict())
+@router.delete("/", response_model=ChangeResult, status_code=status.HTTP_200_OK)
+def delete_addresses(address_in: AddressInPatch = Depends(),
+                     change: ChangeParams = Depends(),
+                     session: Session = Depends(get_session)):
+    return change_where(Address(session), change, 'delete_where',
+                        **address_in.dict(exclude_none=True))
 
 
 @router.patch("/{address_id}", response_model=AddressOut, status_code=status.HTTP_200_OK)
-def update_address(address_id: UUID, address_in: AddressInPatch):
+def update_address(address_id: UUID, address_in: AddressInPatch, session: Session = Depends(get_session)):
     try:
-        return Address().update(address_id, **address_in.dict(exclude_unset=True))
+        return Address(session).update(address_id, **address_in.dict(exclude_unset=True))
     except NoResultFound:
         raise HTTPException(404, f"Address with id: {address_id} not found")
 
 
 @router.delete("/{address_id}", response_model=AddressOut, status_code=status.HTTP_200_OK)
-def delete_address(address_id: UUID):
+def delete_address(address_id: UUID, session: Session = Depends(get_session)):
     try:
-        return Address().delete(address_id)
+        return Address(session).delete(address_id)
     except NoResultFound:
         raise HTTPException(404, f"Address with id: {address_id} not found")
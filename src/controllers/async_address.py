@@ -0,0 +1,92 @@
+from typing import List, Optional
+from uuid import UUID
+
+from controllers.dependencies import ChangeParams, PageParams
+from controllers.responses import (async_change_where, async_conditional_get,
+                                   async_ndjson_response, batch_response,
+                                   conditional_page, wants_ndjson)
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from models.address import AsyncAddress
+from models.pagination import PaginationError
+from models.pydanticmodels import (AddressBatchOut, AddressIn, AddressInPatch,
+                                   AddressOut, BatchGetIn, ChangeResult)
+from sqlalchemy.orm.exc import NoResultFound
+
+router = APIRouter(
+    prefix="/addresses",
+    tags=["addresses"]
+)
+
+
+@router.get("/", response_model=List[AddressOut], status_code=status.HTTP_200_OK)
+async def get(response: Response,
+              address_in: AddressInPatch = Depends(),
+              page: PageParams = Depends(),
+              stream: bool = False,
+              accept: Optional[str] = Header(None),
+              if_none_match: Optional[str] = Header(None)):
+    if wants_ndjson(stream, accept):
+        rows = AsyncAddress().stream(**address_in.dict(exclude_none=True))
+        return async_ndjson_response(AddressOut, rows)
+    try:
+        items, next_cursor = await AsyncAddress().get_page(
+            **page.dict(), **address_in.dict(exclude_none=True))
+    except PaginationError as e:
+        raise HTTPException(400, str(e))
+    return conditional_page(AsyncAddress(), AddressOut, items, next_cursor, if_none_match, response)
+
+
+@router.get("/{address_id}", response_model=AddressOut, status_code=status.HTTP_200_OK)
+async def get_address(address_id: UUID,
+                      response: Response,
+                      if_none_match: Optional[str] = Header(None)):
+    try:
+        return await async_conditional_get(AsyncAddress(), AddressOut, address_id,
+                                           if_none_match, response)
+    except NoResultFound:
+        raise HTTPException(404, f"Address with id: {address_id} not found")
+
+
+@router.post("/", response_model=AddressOut, status_code=status.HTTP_201_CREATED)
+async def add_address(address_in: AddressIn):
+
+    return await AsyncAddress().insert(**address_in.dict())
+
+
+@router.post("/batch-get", response_model=AddressBatchOut, status_code=status.HTTP_200_OK)
+async def batch_get_addresses(batch: BatchGetIn, response: Response):
+    ids = list(dict.fromkeys(batch.ids))
+    return batch_response(AddressBatchOut, ids, await AsyncAddress().get_many(ids), response)
+
+
+@router.patch("/", response_model=ChangeResult, status_code=status.HTTP_200_OK)
+async def update_addresses(patch: AddressInPatch,
+                           address_in: AddressInPatch = Depends(),
+                           change: ChangeParams = Depends()):
+    values = patch.dict(exclude_unset=True)
+    if not values:
+        raise HTTPException(400, "No fields to update")
+    return await async_change_where(AsyncAddress(), change, 'update_where', values,
+                                    **address_in.dict(exclude_none=True))
+
+
+@router.delete("/", response_model=ChangeResult, status_code=status.HTTP_200_OK)
+async def delete_addresses(address_in: AddressInPatch = Depends(), change: ChangeParams = Depends()):
+    return await async_change_where(AsyncAddress(), change, 'delete_where',
+                                    **address_in.dict(exclude_none=True))
+
+
+@router.patch("/{address_id}", response_model=AddressOut, status_code=status.HTTP_200_OK)
+async def update_address(address_id: UUID, address_in: AddressInPatch):
+    try:
+        return await AsyncAddress().update(address_id, **address_in.dict(exclude_unset=True))
+    except NoResultFound:
+        raise HTTPException(404, f"Address with id: {address_id} not found")
+
+
+@router.delete("/{address_id}", response_model=AddressOut, status_code=status.HTTP_200_OK)
+async def delete_address(address_id: UUID):
+    try:
+        return await AsyncAddress().delete(address_id)
+    except NoResultFound:
+        raise HTTPException(404, f"Address with id: {address_id} not found")
@@ -0,0 +1,111 @@
+from typing import List, Optional
+from uuid import UUID
+
+from controllers.customer import selected_customer_out
+from controllers.dependencies import (ChangeParams, FieldParams, PageParams,
+                                      SearchParams)
+from controllers.responses import (async_change_where, async_conditional_get,
+                                   async_ndjson_response, batch_response,
+                                   conditional_page, wants_ndjson)
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from models.customer import AsyncCustomer
+from models.pagination import PaginationError
+from models.pydanticmodels import (BatchGetIn, ChangeResult, CustomerBatchOut,
+                                   CustomerIn, CustomerInPatch, CustomerOut)
+from sqlalchemy.orm.exc import NoResultFound
+
+router = APIRouter(
+    prefix="/customers",
+    tags=["customers"]
+)
+
+
+@router.get("/", response_model=List[CustomerOut], status_code=status.HTTP_200_OK)
+async def get_customers(response: Response,
+                        customer_in: CustomerInPatch = Depends(),
+                        page: PageParams = Depends(),
+                        selection: FieldParams = Depends(),
+                        stream: bool = False,
+                        accept: Optional[str] = Header(None),
+                        if_none_match: Optional[str] = Header(None)):
+    out = selected_customer_out(selection)
+    if wants_ndjson(stream, accept):
+        rows = AsyncCustomer().stream(**customer_in.dict(exclude_none=True))
+        return async_ndjson_response(out, rows)
+    try:
+        items, next_cursor = await AsyncCustomer().get_page(
+            **page.dict(), **selection.dict(), **customer_in.dict(exclude_none=True))
+    except PaginationError as e:
+        raise HTTPException(400, str(e))
+    return conditional_page(AsyncCustomer(), out, items, next_cursor, if_none_match, response)
+
+
+# Declared ahead of /{customer_id}, which would otherwise take "search" for an id.
+@router.get("/search", response_model=List[CustomerOut], status_code=status.HTTP_200_OK)
+async def search_customers(response: Response,
+                           params: SearchParams = Depends(),
+                           if_none_match: Optional[str] = Header(None)):
+    try:
+        items, next_cursor = await AsyncCustomer().search(**params.dict())
+    except PaginationError as e:
+        raise HTTPException(400, str(e))
+    return conditional_page(AsyncCustomer(), CustomerOut, items, next_cursor,
+                            if_none_match, response)
+
+
+@router.get("/{customer_id}", response_model=CustomerOut, status_code=status.HTTP_200_OK)
+async def get_customer(customer_id: UUID,
+                       response: Response,
+                       selection: FieldParams = Depends(),
+                       if_none_match: Optional[str] = Header(None)):
+    out = selected_customer_out(selection)
+    try:
+        return await async_conditional_get(AsyncCustomer(), out, customer_id, if_none_match,
+                                           response, **selection.dict())
+    except NoResultFound:
+        raise HTTPException(404, f"Customer with id: {customer_id} not found")
+
+
+@router.post("/", response_model=CustomerOut, status_code=status.HTTP_201_CREATED)
+async def add_customer(customer_in: CustomerIn):
+
+    return await AsyncCustomer().insert(**customer_in.dict())
+
+
+@router.post("/batch-get", response_model=CustomerBatchOut, status_code=status.HTTP_200_OK)
+async def batch_get_customers(batch: BatchGetIn, response: Response):
+    ids = list(dict.fromkeys(batch.ids))
+    return batch_response(CustomerBatchOut, ids, await AsyncCustomer().get_many(ids), response)
+
+
+@router.patch("/", response_model=ChangeResult, status_code=status.HTTP_200_OK)
+async def update_customers(patch: CustomerInPatch,
+                           customer_in: CustomerInPatch = Depends(),
+                           change: ChangeParams = Depends()):
+    values = patch.dict(exclude_unset=True)
+    if not values:
+        raise HTTPException(400, "No fields to update")
+    return await async_change_where(AsyncCustomer(), change, 'update_where', values,
+                                    **customer_in.dict(exclude_none=True))
+
+
+@router.delete("/", response_model=ChangeResult, status_code=status.HTTP_200_OK)
+async def delete_customers(customer_in: CustomerInPatch = Depends(), change: ChangeParams = Depends()):
+    return await async_change_where(AsyncCustomer(), change, 'delete_where',
+                                    **customer_in.dict(exclude_none=True))
+
+
+@router.patch("/{customer_id}", response_model=CustomerOut, status_code=status.HTTP_200_OK)
+async def update_customer(customer_id: UUID, customer_in: CustomerInPatch):
+    try:
+        return await AsyncCustomer().update(customer_id, **customer_in.dict(exclude_unset=True))
+    except NoResultFound:
+        raise HTTPException(404, f"Customer with id: {customer_id} not found")
+
+
+@router.delete("/{customer_id}", response_model=CustomerOut, status_code=status.HTTP_200_OK)
+async def delete_customer(customer_id: UUID):
+    try:
+        return await AsyncCustomer().delete(customer_id)
+    except NoResultFound:
+        raise HTTPException(404, f"Customer with id: {customer_id} not found")
@@ -0,0 +1,35 @@
+from typing import List, Optional
+from uuid import UUID
+
+from controllers.dependencies import HistoryParams, get_session
+from controllers.responses import render
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from models.audit_entry import AuditEntry
+from models.pagination import PaginationError
+from models.pydanticmodels import AuditOut
+from sqlalchemy.orm import Session
+
+router = APIRouter(
+    prefix="/audit",
+    tags=["audit"]
+)
+
+
+def get_history(response, session, params, **criteria):
+    try:
+        items, next_cursor = AuditEntry(session).history(**params.dict(), **criteria)
+    except PaginationError as e:
+        raise HTTPException(400, str(e))
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return render(AuditOut, items, response)
+
+
+@router.get("/", response_model=List[AuditOut], status_code=status.HTTP_200_OK)
+def get_audit(response: Response,
+              table: Optional[str] = None,
+              item_id: Optional[UUID] = None,
+              params: HistoryParams = Depends(),
+              session: Session = Depends(get_session)):
+    criteria = {k: v for (k, v) in dict(table=table, item_id=item_id).items() if v is not None}
+    return get_history(response, session, params, **criteria)
@@ -1,9 +1,21 @@
-from typing import List
+from typing import Any, List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from controllers.audit import get_history
+from controllers.dependencies import (ChangeParams, FieldParams, HistoryParams,
+                                      PageParams, SearchParams, get_session)
+from controllers.responses import (batch_response, change_where,
+                                   conditional_get, conditional_page,
+                                   ndjson_response, wants_ndjson)
+from fastapi import (APIRouter, Body, Depends, Header, HTTPException, Response,
+                     status)
 from models.customer import Customer
-from models.pydanticmodels import CustomerIn, CustomerInPatch, CustomerOut
+from models.pagination import PaginationError
+from models.pydanticmodels import (AuditOut, BatchGetIn, BulkItemError,
+                                   BulkResult, ChangeResult, CustomerBatchOut,
+                                   CustomerBulkIn, CustomerIn, CustomerInPatch,
+                                   CustomerOut, customer_out, parse_items)
+from sqlalchemy.orm import Session
 from sqlalchemy.orm.exc import NoResultFound
 
 router = APIRouter(
@@ -13,35 +25,118 @@ router = APIRouter(
 
 
 @router.get("/", response_model=List[CustomerOut], status_code=status.HTTP_200_OK)
-def get_customers(customer_in: CustomerInPatch = Depends()):
-    return Customer().get_all(**customer_in.dict())
+def get_customers(response: Response,
+                  customer_in: CustomerInPatch = Depends(),
+                  page: PageParams = Depends(),
+                  selection: FieldParams = Depends(),
+                  stream: bool = False,
+                  accept: Optional[str] = Header(None),
+                  if_none_match: Optional[str] = Header(None),
+                  session: Session = Depends(get_session)):
+    out = selected_customer_out(selection)
+    if wants_ndjson(stream, accept):
+        rows = Customer(session).stream(**customer_in.dict(exclude_none=True))
+        return ndjson_response(out, rows)
+    try:
+        items, next_cursor = Customer(session).get_page(
+            **page.dict(), **selection.dict(), **customer_in.dict(exclude_none=True))
+    except PaginationError as e:
+        raise HTTPException(400, str(e))
+    return conditional_page(Customer, out, items, next_cursor, if_none_match, response)
+
+
+def selected_customer_out(selection):
+    try:
+        return customer_out(**selection.dict())
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+@router.get("/search", response_model=List[CustomerOut], status_code=status.HTTP_200_OK)
+def search_customers(response: Response,
+                     params: SearchParams = Depends(),
+                     if_none_match: Optional[str] = Header(None),
+                     session: Session = Depends(get_session)):
+    try:
+        items, next_cursor = Customer(session).search(**params.dict())
+    except PaginationError as e:
+        raise HTTPException(400, str(e))
+    return conditional_page(Customer, CustomerOut, items, next_cursor, if_none_match, response)
 
 
 @router.get("/{customer_id}", response_model=CustomerOut, status_code=status.HTTP_200_OK)
-def get_customer(customer_id: UUID):
+def get_customer(customer_id: UUID,
+                 response: Response,
+                 selection: FieldParams = Depends(),
+                 if_none_match: Optional[str] = Header(None),
+                 session: Session = Depends(get_session)):
+    out = selected_customer_out(selection)
     try:
-        return Customer().get(id=customer_id)
+        return conditional_get(Customer(session), out, customer_id, if_none_match, response,
+                               **selection.dict())
     except NoResultFound:
         raise HTTPException(404, f"Customer with id: {customer_id} not found")
 
 
+@router.get("/{customer_id}/history", response_model=List[AuditOut], status_code=status.HTTP_200_OK)
+def get_customer_history(customer_id: UUID,
+                       response: Response,
+                       params: HistoryParams = Depends(),
+                       session: Session = Depends(get_session)):
+    return get_history(response, session, params, table=Customer.__tablename__, item_id=customer_id)
+
+
 @router.post("/", response_model=CustomerOut, status_code=status.HTTP_201_CREATED)
-def add_customer(customer_in: CustomerIn):
+def add_customer(customer_in: CustomerIn, session: Session = Depends(get_session)):
+
+    return Customer(session).insert(**customer_in.dict())
+
+
+@router.post("/batch-get", response_model=CustomerBatchOut, status_code=status.HTTP_200_OK)
+def batch_get_customers(batch: BatchGetIn, response: Response, session: Session = Depends(get_session)):
+    ids = list(dict.fromkeys(batch.ids))
+    return batch_response(CustomerBatchOut, ids, Customer(session).get_many(ids), response)
+
+
+@router.post("/bulk", response_model=BulkResult, status_code=status.HTTP_200_OK)
+def bulk_upsert_customers(items: List[Any] = Body(...), session: Session = Depends(get_session)):
+    parsed, errors = parse_items(CustomerBulkIn, items)
+    ids, failed = Customer(session).bulk_upsert([item.dict() for (_, item) in parsed])
+    errors += [BulkItemError(index=parsed[i][0], detail=detail) for (i, detail) in failed.items()]
+    return BulkResult(upserted=ids, errors=sorted(errors, key=lambda e: e.index))
+
+
+@router.patch("/", response_model=ChangeResult, status_code=status.HTTP_200_OK)
+def update_customers(patch: CustomerInPatch,
+                     customer_in: CustomerInPatch = Depends(),
+                     change: ChangeParams = Depends(),
+                     session: Session = Depends(get_session)):
+    values = patch.dict(exclude_unset=True)
+    if not values:
+        raise HTTPException(400, "No fields to update")
+    return change_where(Customer(session), change, 'update_where', values,
+                        **customer_in.dict(exclude_none=True))
+
 
-    return Customer().insert(**customer_in.dict())
+@router.delete("/", response_model=ChangeResult, status_code=status.HTTP_200_OK)
+def delete_customers(customer_in: CustomerInPatch = Depends(),
+                     change: ChangeParams = Depends(),
+                     session: Session = Depends(get_session)):
+    return change_where(Customer(session), change, 'delete_where',
+                        **customer_in.dict(exclude_none=True))
 
 
 @router.patch("/{customer_id}", response_model=CustomerOut, status_code=status.HTTP_200_OK)
-def update_customer(customer_id: UUID, customer_in: CustomerInPatch):
+def update_customer(customer_id: UUID, customer_in: CustomerInPatch, session: Session = Depends(get_session)):
     try:
-        return Customer().update(customer_id, **customer_in.dict(exclude_unset=True))
+        return Customer(session).update(customer_id, **customer_in.dict(exclude_unset=True))
     except NoResultFound:
         raise HTTPException(404, f"Customer with id: {customer_id} not found")
 
 
 @router.delete("/{customer_id}", response_model=CustomerOut, status_code=status.HTTP_200_OK)
-def delete_customer(customer_id: UUID):
+def delete_customer(customer_id: UUID, session: Session = Depends(get_session)):
     try:
-        return Customer().delete(customer_id)
+        return Customer(session).delete(customer_id)
     except NoResultFound:
         raise HTTPException(404, f"Customer with id: {customer_id} not found")
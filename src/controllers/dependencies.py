@@ -0,0 +1,85 @@
+from datetime import datetime
+from typing import Optional
+
+from fastapi import Query
+from models import Session
+from models.base_model import MAX_CHANGED_ROWS
+from models.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from models.pydanticmodels import Operation
+
+
+def get_session():
+    session = Session()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+class PageParams:
+    def __init__(self,
+                 limit: int = Query(DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE),
+                 cursor: Optional[str] = None,
+                 order_by: str = 'id'):
+        self.limit = limit
+        self.cursor = cursor
+        self.order_by = order_by
+
+    def dict(self):
+        return dict(limit=self.limit, cursor=self.cursor, order_by=self.order_by)
+
+
+# fields=first_name,last_name projects the columns, include=addresses embeds
+# the addresses; with neither, the whole customer is returned.
+class FieldParams:
+    def __init__(self,
+                 fields: Optional[str] = Query(None, regex=r'^\w+(,\w+)*$'),
+                 include: Optional[str] = Query(None, regex=r'^(addresses)?$')):
+        self.selected = fields is not None or include is not None
+        self.fields = None if fields is None else tuple(sorted(set(fields.split(','))))
+        self.addresses = include == 'addresses' if self.selected else True
+
+    # Empty without a selection, leaving the models' whole customer defaults.
+    def dict(self):
+        return dict(fields=self.fields, addresses=self.addresses) if self.selected else {}
+
+
+class ChangeParams:
+    def __init__(self,
+                 dry_run: bool = False,
+                 max_rows: int = Query(MAX_CHANGED_ROWS, gt=0)):
+        self.dry_run = dry_run
+        self.max_rows = max_rows
+
+
+class SearchParams:
+    def __init__(self,
+                 q: str = Query(..., min_length=1, max_length=100),
+                 limit: int = Query(DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE),
+                 cursor: Optional[str] = None):
+        self.q = q
+        self.limit = limit
+        self.cursor = cursor
+
+    def dict(self):
+        return dict(q=self.q, limit=self.limit, cursor=self.cursor)
+
+
+class HistoryParams(PageParams):
+    def __init__(self,
+                 limit: int = Query(DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE),
+                 cursor: Optional[str] = None,
+                 order_by: str = 'time',
+                 operation: Optional[Operation] = None,
+                 since: Optional[datetime] = None,
+                 until: Optional[datetime] = None):
+        super().__init__(limit, cursor, order_by)
+        self.operation = operation
+        self.since = since
+        self.until = until
+
+    def dict(self):
+        params = dict(super().dict(), since=self.since, until=self.until)
+        if self.operation:
+            params['operation'] = self.operation.value
+        return params
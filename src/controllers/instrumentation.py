@@ -0,0 +1,96 @@
+import asyncio
+import json
+import logging
+import sys
+from time import perf_counter
+
+from models.metrics import observe_request, threadpool
+from models.query_stats import track_queries
+
+logger = logging.getLogger(__name__)
+
+
+# Plain ASGI rather than @app.middleware, which would run every request in an
+# extra task and buffer streamed bodies. Statements run while a body streams
+# are logged but miss the header, which has already gone out.
+class QueryTimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        started = perf_counter()
+        status = None
+        with track_queries() as stats:
+            async def send_with_timing(message):
+                nonlocal status
+                if message['type'] == 'http.response.start':
+                    status = message['status']
+                    timing = stats.server_timing() + \
+                        [f'app;dur={(perf_counter() - started) * 1000:.2f}']
+                    message['headers'] = list(message.get('headers', [])) + \
+                        [(b'server-timing', ', '.join(timing).encode())]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                logger.info(json.dumps({
+                    'method': scope['method'],
+                    'path': scope['path'],
+                    'status': status,
+                    'duration_ms': round((perf_counter() - started) * 1000, 2),
+                    **stats.as_json()
+                }))
+
+
+# Uvicorn's logging config leaves the app's loggers at WARNING, which would
+# drop every request's line; they are written one JSON object per line to
+# stdout, alongside uvicorn's access log.
+def configure_request_log():
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def use_threadpool():
+    asyncio.get_event_loop().set_default_executor(threadpool)
+
+
+# Labels requests with the route's path template, not the raw path, so the
+# number of series stays bounded.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.routes = None
+
+    def route(self, scope):
+        if self.routes is None:
+            self.routes = {r.endpoint: r.path for r in scope['app'].routes
+                           if hasattr(r, 'endpoint')}
+        return self.routes.get(scope.get('endpoint'), 'unmatched')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        started = perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            observe_request(scope['method'], self.route(scope), status, perf_counter() - started)
@@ -0,0 +1,94 @@
+from fastapi import APIRouter, Response, status
+from fastapi.responses import PlainTextResponse
+from models.cache import entity_cache
+from models.lifecycle import database_available, lifecycle
+from models.metrics import metrics_store, request_latency
+
+router = APIRouter(
+    prefix="/monitoring",
+    tags=["monitoring"]
+)
+
+metrics_router = APIRouter(
+    tags=["monitoring"]
+)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+# Answers 503 until the worker has started, once it is stopping, and while
+# the database is out of reach, so load balancers route around it.
+@metrics_router.get("/health", status_code=status.HTTP_200_OK)
+def get_health(response: Response):
+    health = lifecycle.as_json()
+    health['database'] = 'ok' if database_available() else 'unavailable'
+    if health['status'] != 'ready' or health['database'] != 'ok':
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return health
+
+
+@router.get("/cache", status_code=status.HTTP_200_OK)
+def get_cache_stats():
+    return entity_cache.as_json()
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    return '{' + ','.join(f'{k}="{escape(v)}"' for (k, v) in labels.items()) + '}'
+
+
+def _metric(name, kind, help, samples):
+    return [f'# HELP {name} {help}', f'# TYPE {name} {kind}'] + \
+        [f'{name}{suffix}{labels} {value}' for (suffix, labels, value) in samples]
+
+
+def _histogram(name, help, histogram, values, label_names):
+    samples = []
+    for (labels, (counts, total)) in sorted(histogram.collect(values).items()):
+        labels = dict(zip(label_names, labels))
+        bounds = [str(b) for b in histogram.buckets] + ['+Inf']
+        samples += [('_bucket', _labels(**labels, le=le), count)
+                    for (le, count) in zip(bounds, counts)]
+        samples += [('_sum', _labels(**labels), total), ('_count', _labels(**labels), counts[-1])]
+    return _metric(name, 'histogram', help, samples)
+
+
+# Renders the metrics summed across the workers, see MetricsStore.
+def render_metrics(metrics):
+    pool, executor, checkout = metrics['pool'], metrics['threadpool'], metrics['checkout']
+    lines = _metric('http_requests_total', 'counter', "Requests served.", [
+        ('', _labels(method=m, route=r, status=s), v)
+        for ((m, r, s), v) in sorted(metrics['requests'].items())])
+    lines += _metric('http_request_errors_total', 'counter', "Requests answered with a 5xx.", [
+        ('', _labels(method=m, route=r), v)
+        for ((m, r), v) in sorted(metrics['errors'].items())])
+    lines += _histogram('http_request_duration_seconds', "Time to serve a request.",
+                        request_latency, metrics['latency'], ('method', 'route'))
+    lines += _metric('db_pool_size', 'gauge', "Connections the pool keeps.",
+                     [('', '', pool['size'])])
+    lines += _metric('db_pool_checked_out', 'gauge', "Connections in use.",
+                     [('', '', pool['checked_out'])])
+    lines += _metric('db_pool_overflow', 'gauge', "Connections open beyond the pool size.",
+                     [('', '', pool['overflow'])])
+    lines += _metric('db_pool_checkout_wait_seconds', 'summary',
+                     "Time requests waited for a connection.",
+                     [('_sum', '', checkout['total']), ('_count', '', checkout['count'])])
+    lines += _metric('db_pool_checkout_wait_seconds_max', 'gauge',
+                     "Longest wait for a connection.", [('', '', checkout['max'])])
+    lines += _metric('threadpool_max_workers', 'gauge', "Threads for sync endpoints.",
+                     [('', '', executor['max_workers'])])
+    lines += _metric('threadpool_active', 'gauge', "Threads running a task.",
+                     [('', '', executor['active'])])
+    lines += _metric('threadpool_queued', 'gauge', "Tasks waiting for a thread.",
+                     [('', '', executor['queued'])])
+    lines += _metric('threadpool_saturation', 'gauge', "Share of the threads running a task.",
+                     [('', '', executor['active'] / executor['max_workers'])])
+    return '\n'.join(lines) + '\n'
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse, status_code=status.HTTP_200_OK)
+def get_metrics():
+    return PlainTextResponse(render_metrics(metrics_store.collect()),
+                             media_type=PROMETHEUS_CONTENT_TYPE)
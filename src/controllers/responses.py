@@ -0,0 +1,221 @@
+import asyncio
+from collections.abc import Mapping
+from datetime import date, datetime, time
+from enum import Enum
+from functools import lru_cache
+from os import environ
+from typing import List
+from uuid import UUID
+
+import orjson
+from fastapi import HTTPException, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from models.base_model import TooManyRowsError
+from models.etag import make_etag
+from models.pydanticmodels import ChangeResult, SparseModel
+from pydantic import BaseModel, parse_obj_as
+from pydantic.fields import SHAPE_LIST
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+serialization_mode = environ.get('SERIALIZATION_MODE', 'fast')
+
+
+class NDJSONResponse(StreamingResponse):
+    media_type = NDJSON_MEDIA_TYPE
+
+    # Same as StreamingResponse.__call__, but wraps the coroutines in tasks:
+    # starlette's run_until_first_complete passes bare coroutines to
+    # asyncio.wait, which Python 3.11 no longer accepts.
+    async def __call__(self, scope, receive, send):
+        tasks = [asyncio.ensure_future(self.stream_response(send)),
+                 asyncio.ensure_future(self.listen_for_disconnect(receive))]
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            task.result()
+
+        if self.background is not None:
+            await self.background()
+
+
+def wants_ndjson(stream, accept):
+    return stream or NDJSON_MEDIA_TYPE in (accept or '')
+
+
+def ndjson_response(model, rows):
+    return NDJSONResponse(model(**row).json() + '\n' for row in rows)
+
+
+def async_ndjson_response(model, rows):
+    async def lines():
+        async for row in rows:
+            yield model(**row).json() + '\n'
+    return NDJSONResponse(lines())
+
+
+class NotPortable(ValueError):
+    pass
+
+
+def _float(value):
+    value = float(value)
+    # repr() switches to exponent notation outside this range, and writes it
+    # differently from orjson; non-finite values are rejected by json.dumps.
+    if value and not 1e-4 <= abs(value) < 1e16:
+        raise NotPortable(value)
+    return value
+
+
+# Checked in order, since bool is an int; constrained types subclass these.
+_ENCODERS = ((bool, bool), (int, int), (float, _float), (UUID, str))
+
+
+def _field_encoder(field):
+    type_ = field.type_
+    if isinstance(type_, type) and issubclass(type_, BaseModel):
+        encode = compile_encoder(type_)
+    elif isinstance(type_, type) and issubclass(type_, Enum):
+        def encode(value):
+            return type_(value).value
+    elif type_ in (datetime, date, time):
+        def encode(value):
+            return value.isoformat()
+    else:
+        encode = next((encode for (base, encode) in _ENCODERS
+                       if isinstance(type_, type) and issubclass(type_, base)), lambda value: value)
+
+    if field.shape == SHAPE_LIST:
+        return lambda value: None if value is None else [encode(v) for v in value]
+    # Only Dict and Mapping fields have a key_field.
+    if field.key_field is not None:
+        encode_key = _field_encoder(field.key_field)
+        return lambda value: None if value is None else \
+            {encode_key(k): encode(v) for (k, v) in value.items()}
+    return lambda value: None if value is None else encode(value)
+
+
+# Builds the same primitives response_model validation followed by
+# jsonable_encoder would, straight from the trusted as_json() dicts.
+@lru_cache(maxsize=None)
+def compile_encoder(model):
+    fields = [(name, field.default, _field_encoder(field))
+              for (name, field) in model.__fields__.items()]
+
+    def encode(obj):
+        if isinstance(obj, Mapping):
+            return {name: encode(obj.get(name, default)) for (name, default, encode) in fields}
+        return {name: encode(getattr(obj, name, default)) for (name, default, encode) in fields}
+    return encode
+
+
+# Left to FastAPI to validate against the route's response_model, except for
+# sparse models, which are narrower and so are validated the same way here.
+def unrendered(model, content, response):
+    if not issubclass(model, SparseModel):
+        return content
+    type_ = List[model] if isinstance(content, list) else model
+    validated = JSONResponse(jsonable_encoder(parse_obj_as(type_, content)))
+    validated.headers.raw.extend(response.headers.raw)
+    return validated
+
+
+# Returns a pre-rendered response, which FastAPI sends without validating it
+# against response_model again. Anything that cannot be encoded exactly like
+# json.dumps would goes back through the regular path.
+def render(model, content, response):
+    if serialization_mode != 'fast':
+        return unrendered(model, content, response)
+    encode = compile_encoder(model)
+    try:
+        body = orjson.dumps([encode(item) for item in content] if isinstance(content, list)
+                            else encode(content))
+    except (AttributeError, TypeError, ValueError):
+        return unrendered(model, content, response)
+    rendered = Response(body, media_type='application/json')
+    rendered.headers.raw.extend(response.headers.raw)
+    return rendered
+
+
+def _opaque(tag):
+    tag = tag.strip()
+    return tag[2:] if tag.startswith('W/') else tag
+
+
+def etag_matches(if_none_match, etag):
+    return if_none_match.strip() == '*' or \
+        _opaque(etag) in {_opaque(tag) for tag in if_none_match.split(',')}
+
+
+def not_modified(headers):
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+
+# The If-None-Match check only costs a timestamp query (or a cache lookup);
+# the entity is loaded when the client's copy is stale.
+def conditional_get(model, out, id, if_none_match, response, **options):
+    if if_none_match:
+        etag = model.etag(id, **options)
+        if etag_matches(if_none_match, etag):
+            return not_modified({'ETag': etag})
+    value = model.get(id=id, **options)
+    response.headers['ETag'] = make_etag(model.versions(value))
+    return render(out, value, response)
+
+
+async def async_conditional_get(model, out, id, if_none_match, response, **options):
+    if if_none_match:
+        etag = await model.etag(id, **options)
+        if etag_matches(if_none_match, etag):
+            return not_modified({'ETag': etag})
+    value = await model.get(id=id, **options)
+    response.headers['ETag'] = make_etag(model.versions(value))
+    return render(out, value, response)
+
+
+# The values of ids that were found, by id, and the ids that were not, both in
+# the order asked for.
+def batch_response(out, ids, found, response):
+    content = {'items': {id: found[id] for id in ids if id in found},
+               'not_found': [id for id in ids if id not in found]}
+    return render(out, content, response)
+
+
+def conditional_page(model, out, items, next_cursor, if_none_match, response):
+    headers = {'ETag': make_etag([v for item in items for v in model.versions(item)] +
+                                 [(next_cursor,)])}
+    if next_cursor:
+        headers['X-Next-Cursor'] = next_cursor
+    if if_none_match and etag_matches(if_none_match, headers['ETag']):
+        return not_modified(headers)
+    response.headers.update(headers)
+    return render(out, items, response)
+
+
+def check_filters(criteria):
+    if not criteria:
+        raise HTTPException(400, "At least one filter is required")
+
+
+# Bulk changes by filter criteria; a dry run only counts the matching rows.
+def change_where(model, change, operation, *args, **criteria):
+    check_filters(criteria)
+    if change.dry_run:
+        return ChangeResult(count=model.count_where(**criteria), dry_run=True)
+    try:
+        ids = getattr(model, operation)(*args, max_rows=change.max_rows, **criteria)
+    except TooManyRowsError as e:
+        raise HTTPException(400, str(e))
+    return ChangeResult(count=len(ids), ids=ids)
+
+
+async def async_change_where(model, change, operation, *args, **criteria):
+    check_filters(criteria)
+    if change.dry_run:
+        return ChangeResult(count=await model.count_where(**criteria), dry_run=True)
+    try:
+        ids = await getattr(model, operation)(*args, max_rows=change.max_rows, **criteria)
+    except TooManyRowsError as e:
+        raise HTTPException(400, str(e))
+    return ChangeResult(count=len(ids), ids=ids)
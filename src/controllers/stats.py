@@ -0,0 +1,32 @@
+from datetime import datetime
+from typing import Optional
+
+from controllers.dependencies import get_session
+from fastapi import APIRouter, Depends, Query, status
+from models.pydanticmodels import CustomerStatsOut
+from models.stats import DIMENSIONS, CustomerStats
+from sqlalchemy.orm import Session
+
+router = APIRouter(
+    prefix="/stats",
+    tags=["stats"]
+)
+
+DIMENSION = '|'.join(DIMENSIONS)
+
+
+# Read from the customer_stats materialized view, never the base tables; it
+# is as old as age_seconds, and refreshed every STATS_REFRESH_INTERVAL.
+@router.get("/customers", response_model=CustomerStatsOut, response_model_exclude_unset=True,
+            status_code=status.HTTP_200_OK)
+def get_customer_stats(group_by: Optional[str] = Query(
+                           None, regex=rf'^({DIMENSION})(,({DIMENSION}))*$'),
+                       session: Session = Depends(get_session)):
+    stats = CustomerStats(session)
+    refreshed_at = stats.refreshed_at()
+    return {
+        'refreshed_at': refreshed_at,
+        'age_seconds': None if refreshed_at is None else
+        (datetime.now() - refreshed_at).total_seconds(),
+        'groups': stats.get(set(group_by.split(',')) if group_by else ())
+    }
@@ -1,5 +1,5 @@
-import re
-from datetime import datetime
+import os
+import sys
 from typing import List
 from uuid import UUID, uuid4
 
@@ -11,29 +11,37 @@ from pydanticmodels import (AddressIn, AddressInPatch, AddressOut, CustomerIn,
 from sqlalchemy import *
 from sqlalchemy import event
 
-app = FastAPI()
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+
+from controllers.instrumentation import QueryTimingMiddleware  # noqa: E402
+from models.audit import AuditWriter, statement_events  # noqa: E402
 
+app = FastAPI()
+app.add_middleware(QueryTimingMiddleware)
 
-@event.listens_for(engine, 'after_cursor_execute')
-def log_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-    if context.isupdate or context.isinsert or context.isdelete:
+audit_writer = AuditWriter(engine, audit)
+app.add_event_handler('startup', audit_writer.start)
+app.add_event_handler('shutdown', audit_writer.stop)
 
-        table = re.search(r"(?<=\bUPDATE\s)(\w+)", statement).group() if context.isupdate\
-            else re.search(r"(?<=\bINTO\s)(\w+)", statement).group() if context.isinsert\
-            else re.search(r"(?<=\bFROM\s)(\w+)", statement).group()
 
-        item_id = parameters['id_1'] if context.isdelete else parameters['id']
+# Listens on the engine itself; engine is only the proxy that creates it.
+@event.listens_for(engine.get(), 'after_execute')
+def audit_after_execute(conn, clauseelement, multiparams, params, result):
+    context = result.context
+    # A statement that matched no row changed nothing worth auditing.
+    if (context.isinsert or context.isupdate or context.isdelete) and result.rowcount != 0:
+        audit_writer.submit(statement_events(context))
 
-        operation = "UPDATE" if context.isupdate else "INSERT" if context.isinsert else "DELETE"
 
-        if table != 'audit':
-            audit.insert().\
-                values(id=uuid4(),
-                       table=table,
-                       item_id=item_id,
-                       operation=operation,
-                       time=datetime.now()
-                       ).execute()
+# One UPDATE ... RETURNING of only the given columns, which matches the row
+# only when one of them differs; None when the row is missing or unchanged.
+def update_row(table, id, values):
+    if not values:
+        return None
+    changed = or_(*[table.c[k].is_distinct_from(v) for (k, v) in values.items()])
+    return table.update().where(and_(table.c.id == id, changed)).\
+        values(**values).returning(*table.c).execute().first()
 
 
 @app.get("/")
@@ -44,12 +52,18 @@ def root():
 @app.get("/customers", response_model=List[CustomerOut])
 def get_customers():
     customers = select([customer]).execute().fetchall()
+
+    addresses = {c.id: [] for c in customers}
+    if addresses:
+        for a in select([address]).\
+                where(address.c.customer_id.in_(list(addresses))).\
+                execute().fetchall():
+            addresses[a.customer_id].append(a)
+
     result = []
     for c in customers:
         d = dict(c.items())
-        d['addresses'] = jsonable_encoder(select([address]).
-                                          where(address.c.customer_id == c.id).
-                                          execute().fetchall())
+        d['addresses'] = jsonable_encoder(addresses[c.id])
         result.append(d)
     return result
 
@@ -81,24 +95,13 @@ def add_customer(customer_in: CustomerIn):
 
 @app.patch("/customers/{customer_id}", response_model=CustomerOut)
 def update_customer(customer_id: UUID, customer_in: CustomerIn):
-    currentCustomer = jsonable_encoder(customer.select().where(
-        customer.c.id == customer_id).execute().first())
+    currentCustomer = update_row(customer, customer_id, customer_in.dict(exclude_unset=True)) or \
+        customer.select().where(customer.c.id == customer_id).execute().first()
 
     if not currentCustomer:
         raise HTTPException(404, "Customer not found")
 
-    customer_in = DBCustomer(
-        **customer_in.dict(exclude_unset=True), id=customer_id)
-    currentCustomer.update(customer_in)
-
-    currentCustomer = DBCustomer(**dict(currentCustomer))
-
-    customer.update().\
-        where(customer.c.id == customer_id).\
-        values(**currentCustomer.dict()).\
-        execute()
-
-    result = currentCustomer.dict()
+    result = dict(currentCustomer.items())
     result['addresses'] = jsonable_encoder(select([address]).
                                            where(address.c.customer_id == customer_id).
                                            execute().fetchall())
@@ -130,23 +133,12 @@ def add_address(address_in: AddressIn):
 
 @app.patch("/adresses/{address_id}", response_model=AddressOut)
 def update_address(address_id: UUID, address_in: AddressInPatch):
-    currentAddress = jsonable_encoder(address.select().where(
-        address.c.id == address_id).execute().first())
+    currentAddress = update_row(address, address_id, address_in.dict(exclude_unset=True)) or \
+        address.select().where(address.c.id == address_id).execute().first()
 
     if not currentAddress:
         raise HTTPException(404, "address not found")
 
-    address_in = DBAddress(**address_in.dict(exclude_unset=True),
-                           id=address_id, customer_id=currentAddress["customer_id"])
-    currentAddress.update(address_in)
-
-    currentAddress = DBAddress(**dict(currentAddress))
-
-    address.update().\
-        where(address.c.id == address_id).\
-        values(**currentAddress.dict()).\
-        execute()
-
     return currentAddress
 
 
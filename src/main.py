@@ -1,11 +1,50 @@
 from fastapi import FastAPI
 
-from controllers import address, customer
+from controllers import (address, async_address, async_customer, audit,
+                         customer, monitoring, stats)
+from controllers.instrumentation import (MetricsMiddleware,
+                                         QueryTimingMiddleware,
+                                         configure_request_log, use_threadpool)
+from models import db_mode, engine
+from models.async_base_model import database
+from models.audit import audit_writer
+from models.cache import cache_listener
+from models.lifecycle import lifecycle, warm_up
+from models.metrics import metrics_store
+from models.stats import stats_refresher
 
 app = FastAPI()
+app.add_middleware(QueryTimingMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_event_handler('shutdown', lifecycle.stop)
+app.add_event_handler('startup', configure_request_log)
+app.add_event_handler('startup', use_threadpool)
+app.add_event_handler('startup', warm_up)
+app.add_event_handler('startup', audit_writer.start)
+app.add_event_handler('shutdown', audit_writer.stop)
+app.add_event_handler('startup', cache_listener.start)
+app.add_event_handler('shutdown', cache_listener.stop)
+app.add_event_handler('startup', stats_refresher.start)
+app.add_event_handler('shutdown', stats_refresher.stop)
+app.add_event_handler('startup', metrics_store.start)
+app.add_event_handler('shutdown', metrics_store.stop)
+
+if db_mode == 'async':
+    app.add_event_handler('startup', database.connect)
+    app.add_event_handler('shutdown', database.disconnect)
+    app.include_router(async_customer.router)
+    app.include_router(async_address.router)
+
+# Uvicorn only accepts connections once every startup handler has run.
+app.add_event_handler('startup', lifecycle.ready)
+app.add_event_handler('shutdown', engine.dispose)
 
 app.include_router(customer.router)
 app.include_router(address.router)
+app.include_router(audit.router)
+app.include_router(stats.router)
+app.include_router(monitoring.router)
+app.include_router(monitoring.metrics_router)
 
 
 @app.get('/')
@@ -1,14 +1,134 @@
 from os import environ
+from threading import Lock
+from time import perf_counter
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
 
 db_username = environ.get('DB_USERNAME')
 db_password = environ.get('DB_PASSWORD')
 db_hostname = environ.get('DB_HOSTNAME')
+db_port = environ.get('DB_PORT', '5432')
 db_name = environ.get('DB_NAME')
 
-engine = create_engine(
-    f'postgresql://{db_username}:{db_password}@{db_hostname}/{db_name}')
+# DATABASE_URL takes precedence over the DB_* parts, e.g. sqlite:// for an
+# in-memory database.
+db_url = environ.get('DATABASE_URL') or \
+    f'postgresql://{db_username}:{db_password}@{db_hostname}:{db_port}/{db_name}'
+db_mode = environ.get('DB_MODE', 'sync')
+db_pool_size = int(environ.get('DB_POOL_SIZE', 5))
+db_max_overflow = int(environ.get('DB_MAX_OVERFLOW', 10))
 
-Session = sessionmaker(bind=engine)
+
+def is_sqlite(url):
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+# Enforces the foreign keys, which ON DELETE CASCADE needs, and leaves BEGIN
+# to SQLAlchemy rather than pysqlite, which otherwise breaks SAVEPOINT.
+def _sqlite_connect(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+    dbapi_connection.execute('PRAGMA foreign_keys=ON')
+
+
+def _sqlite_begin(connection):
+    connection.connection.execute('BEGIN')
+
+
+def make_engine(url):
+    if is_sqlite(url):
+        # Every thread shares the one connection, and so the one in-memory
+        # database, as SQLite has no server to share it through.
+        engine = create_engine(url, poolclass=StaticPool,
+                               connect_args={'check_same_thread': False})
+        event.listen(engine, 'connect', _sqlite_connect)
+        event.listen(engine, 'begin', _sqlite_begin)
+        return engine
+    return create_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=db_pool_size,
+        max_overflow=db_max_overflow,
+        pool_timeout=int(environ.get('DB_POOL_TIMEOUT', 30)),
+        pool_recycle=int(environ.get('DB_POOL_RECYCLE', -1)),
+        pool_pre_ping=environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true')
+
+
+# Created on first use rather than on import, so that importing the models
+# neither needs the database driver nor fixes the URL before tests set it.
+class Lazy:
+    def __init__(self, factory):
+        self.factory = factory
+        self.value = None
+        self.lock = Lock()
+
+    def get(self):
+        if self.value is None:
+            with self.lock:
+                if self.value is None:
+                    self.value = self.factory()
+        return self.value
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+class LazyEngine(Lazy):
+    def dispose(self):
+        if self.value is not None:
+            self.value.dispose()
+
+
+engine = LazyEngine(lambda: make_engine(db_url))
+
+
+# Binds every session not given another bind to the engine as it is created;
+# sessions bound to the proxy itself would not recognise their connections.
+class LazySessionmaker(sessionmaker):
+    def __call__(self, **local_kw):
+        if local_kw.get('bind', self.kw['bind']) is None:
+            local_kw['bind'] = engine.get()
+        return super().__call__(**local_kw)
+
+
+Session = LazySessionmaker()
+
+Base = declarative_base()
+
+
+class CheckoutStats:
+    def __init__(self):
+        self.lock = Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def as_json(self):
+        return {
+            'count': self.count,
+            'total_seconds': self.total,
+            'max_seconds': self.max,
+            'mean_seconds': self.total / self.count if self.count else 0.0
+        }
+
+
+checkout_stats = CheckoutStats()
+
+
+# Times the wait for a pooled connection, or for opening one, as a session
+# first needs it; a request that never touches the database never waits.
+class TimedQueuePool(QueuePool):
+    def _do_get(self):
+        start = perf_counter()
+        connection = super()._do_get()
+        checkout_stats.observe(perf_counter() - start)
+        return connection
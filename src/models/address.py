@@ -1,18 +1,30 @@
 from datetime import datetime
 from uuid import uuid4
 
-from sqlalchemy import Column, DateTime, ForeignKey, String
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, DateTime, ForeignKey, Index, String
 from sqlalchemy.orm import relationship
 
+from models.async_base_model import AsyncBaseModel
 from models.base_model import BaseModel
+from models.types import GUID
 
 
 class Address(BaseModel):
     __tablename__ = 'address'
-
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
-    customer_id = Column(UUID(as_uuid=True), ForeignKey(
+    __sortable__ = ('id', 'customer_id')
+    __table_args__ = (
+        Index('ix_address_customer_id', 'customer_id', 'id'),
+        Index('ix_address_street', 'street', 'id'),
+        Index('ix_address_city', 'city', 'id'),
+        Index('ix_address_country', 'country', 'id'),
+        Index('ix_address_street_trgm', 'street', postgresql_using='gin',
+              postgresql_ops={'street': 'gin_trgm_ops'}),
+        Index('ix_address_city_trgm', 'city', postgresql_using='gin',
+              postgresql_ops={'city': 'gin_trgm_ops'}),
+    )
+
+    id = Column(GUID, primary_key=True, default=uuid4)
+    customer_id = Column(GUID, ForeignKey(
         "customer.id", onupdate='CASCADE', ondelete='CASCADE'), nullable=False)
     street = Column(String(50))
     city = Column(String(50))
@@ -35,11 +47,6 @@ class Address(BaseModel):
         }
 
 
-# audit = Table(
-#     'audit', Base.metadata,
-#     Column('id', UUID(as_uuid=True), primary_key=True, default=uuid4),
-#     Column('table', String(50)),
-#     Column('item_id', UUID(as_uuid=True)),
-#     Column('operation', Enum("INSERT", "UPDATE", "DELETE", name="operation_enum")),
-#     Column('time', Time)
-# )
+class AsyncAddress(AsyncBaseModel):
+    model = Address
+
@@ -0,0 +1,215 @@
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from databases import Database
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm.exc import NoResultFound
+
+from models import Lazy, db_max_overflow, db_pool_size, db_url, is_sqlite
+from models.audit import audit, audit_event, audit_mode, audit_writer
+from models.base_model import STREAM_BATCH_SIZE, check_criteria, check_max_rows
+from models.cache import (cache_key, cached, entity_cache, entity_keys,
+                          notify_statements)
+from models.etag import make_etag
+from models.pagination import Keyset
+
+
+def make_database(url):
+    if is_sqlite(url):
+        return Database(url)
+    return Database(url, min_size=db_pool_size, max_size=db_pool_size + db_max_overflow)
+
+
+# Created on first use, as the backend's driver is imported with it; a
+# database never connected needs no disconnecting.
+class LazyDatabase(Lazy):
+    async def connect(self):
+        await self.get().connect()
+
+    async def disconnect(self):
+        if self.value is not None:
+            await self.value.disconnect()
+
+
+database = LazyDatabase(lambda: make_database(db_url))
+
+
+def as_dict(record):
+    # Record.values() skips the SQLAlchemy result processors, which cannot
+    # handle the UUID objects asyncpg already returns.
+    return dict(zip(record, record.values()))
+
+
+class AsyncBaseModel:
+    model = None
+
+    def __init__(self, db=None):
+        self.db = db or database
+
+    @property
+    def table(self):
+        return self.model.__table__
+
+    def where(self, **criteria):
+        return and_(*[self.table.c[k] == v for (k, v) in criteria.items()])
+
+    def defaults(self, attr):
+        values = dict(attr)
+        for column in self.table.c:
+            if column.key not in values and column.default is not None:
+                default = column.default
+                values[column.key] = default.arg(None) if default.is_callable else default.arg
+        return values
+
+    def audit(self, events, operation, ids, table=None):
+        if audit_mode != 'off':
+            events.extend(audit_event(table or self.table.name, id, operation) for id in ids)
+
+    @asynccontextmanager
+    async def write_transaction(self):
+        events = []
+        async with self.db.transaction():
+            yield events
+            if events and audit_mode == 'transaction':
+                await self.db.execute(audit.insert().values(events))
+        if events and audit_mode != 'transaction':
+            await audit_writer.submit_async(events)
+
+    async def invalidate(self, rows, table=None):
+        table = self.table if table is None else table
+        keys = [key for row in rows for key in entity_keys(table, row)]
+        entity_cache.invalidate(keys)
+        if self.db.url.dialect in ('postgresql', 'postgres'):
+            for statement in notify_statements(keys):
+                await self.db.execute(statement)
+
+    async def get_page(self, limit, cursor=None, order_by='id', fields=None, **criteria):
+        keyset = Keyset(self.model, order_by, cursor)
+        columns = [self.table] if fields is None else self.model.columns((*fields, *keyset.keys))
+        rows = await self.db.fetch_all(select(columns).
+                                       where(and_(self.where(**criteria), *keyset.where)).
+                                       order_by(*keyset.order_by).
+                                       limit(limit + 1))
+        rows = [as_dict(r) for r in rows]
+        items = rows[:limit] if fields is not None else await self.as_json(rows[:limit])
+        return items, keyset.next_cursor(rows, limit)
+
+    # Pages through the rows by keyset rather than holding a cursor open,
+    # which would keep the connection from the other queries as_json runs.
+    async def stream(self, batch_size=STREAM_BATCH_SIZE, **criteria):
+        cursor = None
+        while True:
+            items, cursor = await self.get_page(batch_size, cursor, **criteria)
+            for item in items:
+                yield item
+            if cursor is None:
+                return
+
+    async def get(self, id, fields=None):
+        key = cache_key(self.table.name, id)
+        value = entity_cache.get(key)
+        if value is None and fields is not None:
+            row = await self.db.fetch_one(select(self.model.columns(fields)).
+                                          where(self.table.c.id == id))
+            if row is None:
+                raise NoResultFound()
+            return as_dict(row)
+        if value is None:
+            generation = entity_cache.generation
+            value = await self.load(id)
+            entity_cache.set(key, value, generation, self.model.cache_dependencies(value))
+        return value if fields is None else self.model.project(value, fields)
+
+    async def get_many(self, ids):
+        found, missing = cached(self.table.name, ids)
+        if missing:
+            generation = entity_cache.generation
+            rows = await self.db.fetch_all(select([self.table]).where(self.table.c.id.in_(missing)))
+            for value in await self.as_json([as_dict(r) for r in rows]):
+                entity_cache.set(cache_key(self.table.name, value['id']), value, generation,
+                                 self.model.cache_dependencies(value))
+                found[value['id']] = value
+        return found
+
+    async def get_versions(self, id):
+        row = await self.db.fetch_one(select([self.table.c.id, self.table.c.last_updated]).
+                                      where(self.table.c.id == id))
+        if row is None:
+            raise NoResultFound()
+        return [tuple(row.values())]
+
+    def versions(self, value):
+        return self.model.versions(value)
+
+    async def etag(self, id):
+        value = entity_cache.get(cache_key(self.table.name, id))
+        return make_etag(await self.get_versions(id) if value is None else self.versions(value))
+
+    async def load(self, id):
+        row = await self.db.fetch_one(select([self.table]).where(self.table.c.id == id))
+        if row is None:
+            raise NoResultFound()
+        return (await self.as_json([as_dict(row)]))[0]
+
+    async def insert(self, **attr):
+        values = self.defaults(attr)
+        async with self.write_transaction() as events:
+            await self.db.execute(self.table.insert().values(**values))
+            self.audit(events, 'INSERT', [values['id']])
+        await self.invalidate([values])
+        return (await self.as_json([values]))[0]
+
+    async def update(self, id, **attr):
+        row = None
+        if attr:
+            async with self.write_transaction() as events:
+                row = await self.db.fetch_one(self.model.update_row_statement(id, attr).
+                                              values(last_updated=datetime.now()))
+                self.audit(events, 'UPDATE', [] if row is None else [id])
+        if row is None:
+            return await self.get(id)
+        row = as_dict(row)
+        await self.invalidate([row])
+        return (await self.as_json([row]))[0]
+
+    async def delete(self, id):
+        async with self.write_transaction() as events:
+            row = await self.db.fetch_one(self.model.delete_row_statement(id))
+            if row is None:
+                raise NoResultFound()
+            row = as_dict(row)
+            self.record_changes(events, 'DELETE', [row])
+        await self.invalidate_changes('DELETE', [row])
+        return row
+
+    async def count_where(self, **criteria):
+        return await self.db.fetch_val(select([func.count()]).select_from(self.table).
+                                       where(self.where(**criteria)))
+
+    async def update_where(self, values, max_rows, **criteria):
+        check_criteria(criteria)
+        statement = self.model.update_statement(self.model.limited(self.where(**criteria), max_rows),
+                                                {**values, 'last_updated': datetime.now()})
+        return await self.change_where(statement, 'UPDATE', max_rows)
+
+    async def delete_where(self, max_rows, **criteria):
+        check_criteria(criteria)
+        where = self.model.limited(self.where(**criteria), max_rows)
+        return await self.change_where(self.model.delete_statement(where), 'DELETE', max_rows)
+
+    async def change_where(self, statement, operation, max_rows):
+        async with self.write_transaction() as events:
+            rows = [as_dict(r) for r in await self.db.fetch_all(statement)]
+            check_max_rows(rows, max_rows)
+            self.record_changes(events, operation, rows)
+        await self.invalidate_changes(operation, rows)
+        return [row['id'] for row in rows]
+
+    def record_changes(self, events, operation, rows):
+        self.audit(events, operation, [row['id'] for row in rows])
+
+    async def invalidate_changes(self, operation, rows):
+        await self.invalidate(rows)
+
+    async def as_json(self, rows):
+        return rows
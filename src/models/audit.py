@@ -0,0 +1,170 @@
+import asyncio
+import logging
+from datetime import datetime
+from os import environ
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from uuid import uuid4
+
+from sqlalchemy import Column, DateTime, Enum, Index, String, Table, event
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter
+from sqlalchemy.sql.operators import eq, in_op
+
+from models import Base, Session, engine
+from models.types import GUID
+
+logger = logging.getLogger(__name__)
+
+audit_mode = environ.get('AUDIT_MODE', 'async')
+
+audit = Table(
+    'audit', Base.metadata,
+    Column('id', GUID, primary_key=True, default=uuid4),
+    Column('table', String(50)),
+    Column('item_id', GUID),
+    Column('operation', Enum("INSERT", "UPDATE", "DELETE", name="operation_enum")),
+    Column('time', DateTime),
+    Index('ix_audit_item_id_time', 'item_id', 'time', 'id'),
+    Index('ix_audit_table_time', 'table', 'time', 'id'),
+    Index('ix_audit_time', 'time', 'id')
+)
+
+
+def audit_event(table, item_id, operation):
+    return {'id': uuid4(), 'table': table, 'item_id': item_id,
+            'operation': operation, 'time': datetime.now()}
+
+
+class AuditWriter:
+    def __init__(self, engine, table,
+                 max_queue=int(environ.get('AUDIT_QUEUE_SIZE', 10000)),
+                 batch_size=int(environ.get('AUDIT_BATCH_SIZE', 500)),
+                 flush_interval=float(environ.get('AUDIT_FLUSH_INTERVAL', 1.0))):
+        self.engine = engine
+        self.table = table
+        self.queue = Queue(max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stopping = Event()
+        self.thread = None
+        self.dropped = 0
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if not self.running:
+            self.stopping.clear()
+            self.thread = Thread(target=self.run, name='audit-writer', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.running:
+            self.stopping.set()
+            self.thread.join()
+        self.thread = None
+
+    # Never waits for room in the queue, so a backlog of audit writes cannot
+    # stall the request that submits more; what does not fit is dropped.
+    def submit(self, events):
+        if not events:
+            return
+        if not self.running:
+            self.write(events)
+            return
+        for (i, e) in enumerate(events):
+            try:
+                self.queue.put_nowait(e)
+            except Full:
+                self.dropped += len(events) - i
+                logger.error("Audit queue full, dropped %d events", len(events) - i)
+                return
+
+    # submit for the event loop, where writing inline, with the writer not
+    # running, is left to the default executor.
+    async def submit_async(self, events):
+        if events and not self.running:
+            await asyncio.get_running_loop().run_in_executor(None, self.write, events)
+        else:
+            self.submit(events)
+
+    def run(self):
+        while not (self.stopping.is_set() and self.queue.empty()):
+            batch = self.take(self.batch_size)
+            if batch:
+                self.write(batch)
+
+    def take(self, size):
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except Empty:
+            return []
+        while len(batch) < size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def write(self, events):
+        try:
+            self.engine.execute(self.table.insert().values(events))
+        except Exception:
+            logger.exception("Failed to write %d audit events", len(events))
+
+
+audit_writer = AuditWriter(engine, audit)
+
+
+def record(session, events):
+    if audit_mode == 'transaction':
+        if events:
+            session.connection().execute(audit.insert().values(events))
+    elif audit_mode != 'off':
+        session.info.setdefault('audit', []).extend(events)
+
+
+@event.listens_for(Session, 'after_flush')
+def audit_after_flush(session, flush_context):
+    events = [audit_event(obj.__tablename__, obj.id, 'INSERT') for obj in session.new] + \
+        [audit_event(obj.__tablename__, obj.id, 'UPDATE') for obj in session.dirty
+         if session.is_modified(obj, include_collections=False)] + \
+        [audit_event(obj.__tablename__, obj.id, 'DELETE') for obj in session.deleted]
+    record(session, events)
+
+
+@event.listens_for(Session, 'after_commit')
+def audit_after_commit(session):
+    audit_writer.submit(session.info.pop('audit', []))
+
+
+@event.listens_for(Session, 'after_rollback')
+def audit_after_rollback(session):
+    session.info.pop('audit', None)
+
+
+def _where_ids(statement):
+    id_column = statement.table.c.id
+    ids = []
+    for element in visitors.iterate(statement._whereclause, {}):
+        if isinstance(element, BinaryExpression) and element.left is id_column and \
+                element.operator in (eq, in_op):
+            ids.extend(b.effective_value for b in visitors.iterate(element.right, {})
+                       if isinstance(b, BindParameter))
+    return ids
+
+
+def statement_events(context):
+    statement = context.compiled.statement
+    table = statement.table.name
+    if table == 'audit':
+        return []
+    if context.isinsert:
+        return [audit_event(table, p['id'], 'INSERT') for p in context.compiled_parameters]
+    operation = 'UPDATE' if context.isupdate else 'DELETE'
+    ids = [p['id'] for p in context.compiled_parameters if p.get('id')] \
+        if context.isupdate else []
+    return [audit_event(table, item_id, operation)
+            for item_id in ids or _where_ids(statement)]
@@ -0,0 +1,21 @@
+from models.audit import audit
+from models.base_model import BaseModel
+
+
+class AuditEntry(BaseModel):
+    __table__ = audit
+    __sortable__ = ('time',)
+
+    def history(self, limit, cursor=None, order_by='time', since=None, until=None, **criteria):
+        where = ([audit.c.time >= since] if since else []) + \
+            ([audit.c.time < until] if until else [])
+        return self.get_page(limit, cursor, order_by, where, **criteria)
+
+    def as_json(self):
+        return {
+            'id': self.id,
+            'table': self.table,
+            'item_id': self.item_id,
+            'operation': self.operation,
+            'time': self.time
+        }
@@ -1,22 +1,127 @@
-from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime
+from uuid import uuid4
 
-from models import Session
+from sqlalchemy import and_, func, literal_column, or_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm.exc import NoResultFound
 
-Base = declarative_base()
+from models import Base, Session
+from models.audit import audit_event, record
+from models.cache import (cache_key, cached, entity_cache, entity_keys,
+                          invalidate)
+from models.etag import make_etag
+from models.pagination import Keyset
+
+BULK_CHUNK_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
+MAX_CHANGED_ROWS = 1000
+
+
+class TooManyRowsError(Exception):
+    pass
+
+
+def check_max_rows(rows, max_rows):
+    if len(rows) > max_rows:
+        raise TooManyRowsError(f"More than max_rows={max_rows} rows match")
+
+
+# Changing rows by criteria without any would change the whole table.
+def check_criteria(criteria):
+    if not criteria:
+        raise TooManyRowsError("No filter criteria given, which would match every row")
 
 
 class BaseModel(Base):
     __abstract__ = True
+    __sortable__ = ('id',)
 
-    def __init__(self, **kwargs):
+    def __init__(self, session=None, **kwargs):
         super().__init__(**kwargs)
-        self.session = Session()
+        self._session = session
+
+    @property
+    def session(self):
+        if getattr(self, '_session', None) is None:
+            self._session = Session()
+        return self._session
+
+    # Whether writes can return the rows they changed. SQLite cannot, as far
+    # as this SQLAlchemy goes, so there the rows are read in the same
+    # transaction instead, and upserts take a SELECT and an INSERT or UPDATE.
+    @property
+    def returning(self):
+        return self.session.get_bind().dialect.name != 'sqlite'
+
+    # A projection on fields, plus what keyset pagination and ETags read.
+    @classmethod
+    def columns(cls, fields):
+        return [cls.__table__.c[name] for name in dict.fromkeys(('id', 'last_updated', *fields))]
+
+    @classmethod
+    def project(cls, value, fields):
+        return {c.key: value[c.key] for c in cls.columns(fields)}
+
+    def get_page(self, limit, cursor=None, order_by='id', where=(), fields=None, **criteria):
+        keyset = Keyset(self.__class__, order_by, cursor)
+        query = self.session.query(self.__class__) if fields is None else \
+            self.session.query(*self.columns((*fields, *keyset.keys))).select_from(self.__class__)
+        objs = query.filter_by(**criteria).\
+            filter(*where, *keyset.where).\
+            order_by(*keyset.order_by).\
+            limit(limit + 1).all()
+        items = [obj.as_json() if fields is None else obj._asdict() for obj in objs[:limit]]
+        return items, keyset.next_cursor(objs, limit)
 
-    def get_all(self, **criteria):
-        return [obj.as_json() for obj in self.session.query(self.__class__).filter_by(**criteria).all()]
+    def stream(self, batch_size=STREAM_BATCH_SIZE, **criteria):
+        query = self.session.query(self.__class__).filter_by(**criteria).\
+            order_by(self.__class__.id).\
+            execution_options(stream_results=True).\
+            yield_per(batch_size)
+        return (obj.as_json() for obj in query)
 
-    def get(self, id):
-        return self.session.query(self.__class__).filter_by(id=id).one().as_json()
+    # Only whole entities are cached; a projection is cut from a cached one
+    # or queried on its own.
+    def get(self, id, fields=None):
+        key = cache_key(self.__tablename__, id)
+        value = entity_cache.get(key)
+        if value is None and fields is not None:
+            return self.session.query(*self.columns(fields)).filter(self.__class__.id == id).\
+                one()._asdict()
+        if value is None:
+            generation = entity_cache.generation
+            value = self.session.query(self.__class__).filter_by(id=id).one().as_json()
+            entity_cache.set(key, value, generation, self.cache_dependencies(value))
+        return value if fields is None else self.project(value, fields)
+
+    # One IN query for every id not cached, relationships loaded in batches.
+    def get_many(self, ids):
+        found, missing = cached(self.__tablename__, ids)
+        if missing:
+            generation = entity_cache.generation
+            for obj in self.session.query(self.__class__).filter(self.__class__.id.in_(missing)):
+                value = obj.as_json()
+                entity_cache.set(cache_key(self.__tablename__, obj.id), value, generation,
+                                 self.cache_dependencies(value))
+                found[obj.id] = value
+        return found
+
+    @staticmethod
+    def cache_dependencies(value):
+        return []
+
+    @staticmethod
+    def versions(value):
+        return [(value['id'], value.get('last_updated'))]
+
+    def get_versions(self, id):
+        return [self.session.query(self.__class__.id, self.__class__.last_updated).
+                filter_by(id=id).one()]
+
+    def etag(self, id):
+        value = entity_cache.get(cache_key(self.__tablename__, id))
+        return make_etag(self.get_versions(id) if value is None else self.versions(value))
 
     def insert(self, **attr):
         obj = self.__class__(**attr)
@@ -24,18 +129,203 @@ class BaseModel(Base):
         self.session.commit()
         return obj.as_json()
 
+    def bulk_upsert(self, rows, chunk_size=BULK_CHUNK_SIZE):
+        now = datetime.now()
+        rows = [{**row, 'id': row.get('id') or uuid4(), 'created_at': now, 'last_updated': now}
+                for row in rows]
+
+        seen, errors = set(), {}
+        for (index, row) in enumerate(rows):
+            if row['id'] in seen:
+                errors[index] = f"Duplicate id: {row['id']}"
+            seen.add(row['id'])
+
+        for start in range(0, len(rows), chunk_size):
+            chunk = [(i, row) for (i, row) in enumerate(rows[start:start + chunk_size], start)
+                     if i not in errors]
+            if not chunk:
+                continue
+            try:
+                self.upsert([row for (_, row) in chunk])
+            except DBAPIError:
+                self.session.rollback()
+                for (i, row) in chunk:
+                    try:
+                        with self.session.begin_nested():
+                            self.upsert([row])
+                    except DBAPIError as e:
+                        errors[i] = str(e.orig).strip()
+            self.session.commit()
+
+        return [row['id'] for (i, row) in enumerate(rows) if i not in errors], errors
+
+    def upsert(self, rows):
+        upserted = self.upsert_returning(rows) if self.returning else self.upsert_selecting(rows)
+        record(self.session, [audit_event(self.__tablename__, id, 'INSERT' if inserted else 'UPDATE')
+                              for (id, inserted) in upserted])
+        invalidate(self.session, [key for row in rows for key in entity_keys(self.__table__, row)])
+
+    def upsert_returning(self, rows):
+        statement = insert(self.__table__).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=[self.__table__.c.id],
+            set_={k: statement.excluded[k] for k in rows[0] if k not in ('id', 'created_at')}).\
+            returning(self.__table__.c.id, literal_column('xmax = 0').label('inserted'))
+        return self.session.execute(statement)
+
+    def upsert_selecting(self, rows):
+        table = self.__table__
+        existing = {id for (id,) in self.session.execute(
+            select([table.c.id]).where(table.c.id.in_([row['id'] for row in rows])))}
+        for row in rows:
+            if row['id'] in existing:
+                self.session.execute(table.update().where(table.c.id == row['id']).values(
+                    {k: v for (k, v) in row.items() if k not in ('id', 'created_at')}))
+            else:
+                self.session.execute(table.insert().values(row))
+        return [(row['id'], row['id'] not in existing) for row in rows]
+
+    # Only matches the row when one of values differs from what is stored,
+    # so an update that would change nothing writes nothing.
+    @classmethod
+    def row_changed(cls, id, values):
+        table = cls.__table__
+        return and_(table.c.id == id,
+                    or_(*[table.c[k].is_distinct_from(v) for (k, v) in values.items()]))
+
+    @classmethod
+    def update_row_statement(cls, id, values):
+        table = cls.__table__
+        return table.update().where(cls.row_changed(id, values)).\
+            values(**values).returning(*table.c)
+
+    # A single UPDATE ... RETURNING; only when it returns no row, the row being
+    # missing or unchanged, is it read, which raises NoResultFound if missing.
     def update(self, id, **attr):
-        obj = self.session.query(self.__class__).filter_by(id=id).one()
-        for (k, v) in attr.items():
-            setattr(obj, k, v)
+        row = self.update_row(id, attr) if attr else None
+        if row is None:
+            return self.get(id)
+        [value] = self.from_rows([dict(row)])
+        self.record_changes('UPDATE', [value])
         self.session.commit()
-        return obj.as_json()
+        return value
+
+    def update_row(self, id, values):
+        if self.returning:
+            return self.session.execute(self.update_row_statement(id, values)).first()
+        table = self.__table__
+        if not self.session.execute(table.update().where(self.row_changed(id, values)).
+                                    values(**values)).rowcount:
+            return None
+        return self.session.execute(table.select().where(table.c.id == id)).first()
+
+    # Completes rows of the table's columns into what as_json returns.
+    def from_rows(self, rows):
+        return rows
 
+    @classmethod
+    def delete_row_statement(cls, id):
+        table = cls.__table__
+        return table.delete().where(table.c.id == id).returning(*table.c)
+
+    # A single DELETE ... RETURNING, nothing loaded into the session first.
     def delete(self, id):
-        obj = self.session.query(self.__class__).filter_by(id=id).one()
-        self.session.delete(obj)
+        row = self.delete_row(id)
+        if row is None:
+            raise NoResultFound()
+        value = dict(row)
+        self.record_changes('DELETE', [value])
         self.session.commit()
-        return obj.as_json()
+        return value
+
+    def delete_row(self, id):
+        if self.returning:
+            return self.session.execute(self.delete_row_statement(id)).first()
+        table = self.__table__
+        row = self.session.execute(table.select().where(table.c.id == id)).first()
+        if row is not None:
+            self.session.execute(table.delete().where(table.c.id == id))
+        return row
+
+    @classmethod
+    def matching(cls, **criteria):
+        return and_(*[cls.__table__.c[k] == v for (k, v) in criteria.items()])
+
+    # What auditing a changed row and invalidating its cache entries take.
+    @classmethod
+    def key_columns(cls):
+        return [cls.__table__.c.id] + [fk.parent for fk in cls.__table__.foreign_keys]
+
+    # At most max_rows + 1 of the rows where matches, so that a change
+    # matching too many writes a single row more than allowed before it is
+    # rolled back, not every row matched.
+    @classmethod
+    def limited(cls, where, max_rows):
+        table = cls.__table__
+        return table.c.id.in_(select([table.c.id]).where(where).limit(max_rows + 1))
+
+    @classmethod
+    def update_statement(cls, where, values):
+        return cls.__table__.update().where(where).values(**values).returning(*cls.key_columns())
+
+    @classmethod
+    def delete_statement(cls, where):
+        return cls.__table__.delete().where(where).returning(*cls.key_columns())
+
+    def count_where(self, **criteria):
+        return self.session.execute(select([func.count()]).select_from(self.__table__).
+                                    where(self.matching(**criteria))).scalar()
+
+    def update_where(self, values, max_rows, **criteria):
+        check_criteria(criteria)
+        return self.change_where(self.matching(**criteria), max_rows, 'UPDATE', values)
+
+    def delete_where(self, max_rows, **criteria):
+        check_criteria(criteria)
+        return self.change_where(self.matching(**criteria), max_rows, 'DELETE')
+
+    # A single UPDATE/DELETE ... RETURNING, rolled back when it matched more
+    # than max_rows rows.
+    def change_where(self, where, max_rows, operation, values=None):
+        try:
+            rows = self.change_rows(where, max_rows, operation, values)
+            check_max_rows(rows, max_rows)
+        except TooManyRowsError:
+            self.session.rollback()
+            raise
+        self.record_changes(operation, rows)
+        self.session.commit()
+        return [row['id'] for row in rows]
+
+    # Without RETURNING, the ids matched are read first, so that nothing is
+    # written when there are too many, and the keys after an update or
+    # before a delete.
+    def change_rows(self, where, max_rows, operation, values):
+        if self.returning:
+            where = self.limited(where, max_rows)
+            statement = self.update_statement(where, values) if operation == 'UPDATE' else \
+                self.delete_statement(where)
+            return self.session.execute(statement).fetchall()
+        table = self.__table__
+        ids = [id for (id,) in self.session.execute(select([table.c.id]).where(where).
+                                                    limit(max_rows + 1))]
+        check_max_rows(ids, max_rows)
+        where = table.c.id.in_(ids)
+        if operation == 'UPDATE':
+            self.session.execute(table.update().where(where).values(**values))
+            return self.key_rows(where)
+        rows = self.key_rows(where)
+        self.session.execute(table.delete().where(where))
+        return rows
+
+    # What update_statement and delete_statement return, read with a SELECT.
+    def key_rows(self, where):
+        return self.session.execute(select(self.key_columns()).where(where)).fetchall()
+
+    def record_changes(self, operation, rows):
+        record(self.session, [audit_event(self.__tablename__, row['id'], operation)
+                              for row in rows])
+        invalidate(self.session, [key for row in rows for key in entity_keys(self.__table__, row)])
 
     def as_json(self):
         raise Exception("Please override me")
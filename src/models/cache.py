@@ -0,0 +1,224 @@
+import logging
+from collections import OrderedDict
+from collections.abc import Mapping
+from os import environ
+from select import select as wait_readable
+from threading import Event, Lock, Thread
+from time import monotonic
+
+from sqlalchemy import event, func, select
+
+from models import Session, engine
+
+logger = logging.getLogger(__name__)
+
+CACHE_CHANNEL = 'entity_cache'
+# NOTIFY payloads are capped at 8000 bytes, a key is at most ~60.
+NOTIFY_BATCH_SIZE = 100
+
+
+def cache_key(table, id):
+    return f'{table}:{id}'
+
+
+def entity_keys(table, row):
+    def get(key):
+        return row.get(key) if isinstance(row, Mapping) else getattr(row, key)
+
+    return [cache_key(table.name, get('id'))] + \
+        [cache_key(fk.column.table.name, get(fk.parent.key))
+         for fk in table.foreign_keys if get(fk.parent.key) is not None]
+
+
+def notify_statements(keys):
+    keys = sorted(set(keys))
+    return [select([func.pg_notify(CACHE_CHANNEL, ','.join(keys[i:i + NOTIFY_BATCH_SIZE]))])
+            for i in range(0, len(keys), NOTIFY_BATCH_SIZE)]
+
+
+class EntityCache:
+    def __init__(self,
+                 max_size=int(environ.get('CACHE_SIZE', 10000)),
+                 ttl=float(environ.get('CACHE_TTL', 60))):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = Lock()
+        self.entries = OrderedDict()
+        self.dependents = {}
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    # generation is read before loading the value; anything invalidated in the
+    # meantime may have raced the load, so the value is not stored.
+    def set(self, key, value, generation, depends=()):
+        if not self.enabled:
+            return
+        with self.lock:
+            if generation != self.generation:
+                return
+            self._remove(key)
+            self.entries[key] = (monotonic() + self.ttl, value, tuple(depends))
+            for dependency in depends:
+                self.dependents.setdefault(dependency, set()).add(key)
+            while len(self.entries) > self.max_size:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, keys):
+        with self.lock:
+            self.generation += 1
+            for key in keys:
+                for dependent in self.dependents.pop(key, ()):
+                    self._remove(dependent)
+                if self._remove(key):
+                    self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.dependents.clear()
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        for dependency in entry[2]:
+            keys = self.dependents.get(dependency)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.dependents[dependency]
+        return True
+
+    def as_json(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
+
+
+entity_cache = EntityCache()
+
+
+# Splits ids into the cached values, by id, and the ids still to be loaded.
+def cached(table, ids):
+    found, missing = {}, []
+    for id in ids:
+        value = entity_cache.get(cache_key(table, id))
+        if value is None:
+            missing.append(id)
+        else:
+            found[id] = value
+    return found, missing
+
+
+# Applies the invalidations other workers publish with NOTIFY. Whatever was
+# published while the connection was down is unknown, so every (re)connect
+# starts from an empty cache.
+class CacheListener:
+    def __init__(self, engine, cache, channel=CACHE_CHANNEL,
+                 poll_interval=float(environ.get('CACHE_POLL_INTERVAL', 1.0))):
+        self.engine = engine
+        self.cache = cache
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.stopping = Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    # LISTEN is PostgreSQL's; on SQLite there are no other processes to hear.
+    def start(self):
+        if self.cache.enabled and self.engine.dialect.name == 'postgresql' and not self.running:
+            self.stopping.clear()
+            self.thread = Thread(target=self.run, name='cache-listener', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.running:
+            self.stopping.set()
+            self.thread.join()
+        self.thread = None
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                self.listen()
+            except Exception:
+                logger.exception("Cache invalidation listener failed, reconnecting")
+                self.stopping.wait(self.poll_interval)
+
+    def listen(self):
+        # Only imported here, so that the models import without psycopg2.
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+        connection = self.engine.raw_connection()
+        connection.detach()
+        try:
+            dbapi_connection = connection.connection
+            dbapi_connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            dbapi_connection.cursor().execute(f'LISTEN {self.channel}')
+            self.cache.clear()
+            while not self.stopping.is_set():
+                if wait_readable([dbapi_connection], [], [], self.poll_interval)[0]:
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        self.cache.invalidate(dbapi_connection.notifies.pop(0).payload.split(','))
+        finally:
+            connection.close()
+
+
+cache_listener = CacheListener(engine, entity_cache)
+
+
+def invalidate(session, keys):
+    if keys:
+        connection = session.connection()
+        if connection.dialect.name == 'postgresql':
+            for statement in notify_statements(keys):
+                connection.execute(statement)
+        session.info.setdefault('cache', set()).update(keys)
+
+
+@event.listens_for(Session, 'after_flush')
+def cache_after_flush(session, flush_context):
+    invalidate(session, [key for obj in (*session.new, *session.dirty, *session.deleted)
+                         for key in entity_keys(obj.__table__, obj)])
+
+
+@event.listens_for(Session, 'after_commit')
+def cache_after_commit(session):
+    entity_cache.invalidate(session.info.pop('cache', ()))
+
+
+@event.listens_for(Session, 'after_rollback')
+def cache_after_rollback(session):
+    session.info.pop('cache', None)
@@ -2,17 +2,78 @@ from datetime import datetime
 from uuid import uuid4
 
 from sqlalchemy import (Boolean, CheckConstraint, Column, DateTime, Float,
-                        Integer, String)
-from sqlalchemy.dialects.postgresql import UUID
+                        Index, Integer, String, and_, cast, func, or_, select,
+                        union)
 from sqlalchemy.orm import relationship
+from sqlalchemy.orm.exc import NoResultFound
 
+from models.address import Address
+from models.async_base_model import AsyncBaseModel, as_dict
+from models.audit import audit_event, record
 from models.base_model import BaseModel
+from models.cache import cache_key, entity_cache, invalidate
+from models.etag import make_etag
+from models.pagination import RankedKeyset
+from models.types import GUID
+
+
+def _prefix(q):
+    return q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+# column %> q is pg_trgm's typo tolerant word match, written this way round so
+# the trigram index applies; the % is doubled as both drivers use pyformat.
+# A prefix match ranks above any fuzzy one.
+def _matches(column, q):
+    return or_(column.op('%%>')(q), column.ilike(_prefix(q)))
+
+
+def _score(column, q):
+    return func.word_similarity(q, column) + cast(column.ilike(_prefix(q)), Integer)
+
+
+def search_clauses(q):
+    customer, address = Customer.__table__, Address.__table__
+    names = (customer.c.first_name, customer.c.middle_name, customer.c.last_name)
+    places = (address.c.city, address.c.street)
+    # A UNION rather than an OR, so each side can use its own indexes.
+    matches = union(select([customer.c.id]).where(or_(*[_matches(c, q) for c in names])),
+                    select([address.c.customer_id]).where(or_(*[_matches(c, q) for c in places])))
+    places_rank = select([func.max(func.greatest(*[_score(c, q) for c in places]))]).\
+        where(address.c.customer_id == customer.c.id).as_scalar()
+    rank = cast(func.greatest(*[_score(c, q) for c in names], places_rank), Float).label('rank')
+    return customer.c.id.in_(matches), rank
+
+
+def deleted_address_ids(rows):
+    return [id for row in rows for id in row['address_ids'] or ()]
+
+
+# What a bulk delete returns for a customer deleted on its own.
+def deleted_keys(value):
+    return {'id': value['id'], 'address_ids': [a['id'] for a in value['addresses']]}
 
 
 class Customer(BaseModel):
     __tablename__ = 'customer'
+    __sortable__ = ('id', 'first_name', 'last_name')
+    __table_args__ = (
+        Index('ix_customer_first_name', 'first_name', 'id'),
+        Index('ix_customer_middle_name', 'middle_name', 'id'),
+        Index('ix_customer_last_name', 'last_name', 'id'),
+        Index('ix_customer_age', 'age', 'id'),
+        Index('ix_customer_married', 'married', 'id'),
+        Index('ix_customer_height', 'height', 'id'),
+        Index('ix_customer_weight', 'weight', 'id'),
+        Index('ix_customer_first_name_trgm', 'first_name', postgresql_using='gin',
+              postgresql_ops={'first_name': 'gin_trgm_ops'}),
+        Index('ix_customer_middle_name_trgm', 'middle_name', postgresql_using='gin',
+              postgresql_ops={'middle_name': 'gin_trgm_ops'}),
+        Index('ix_customer_last_name_trgm', 'last_name', postgresql_using='gin',
+              postgresql_ops={'last_name': 'gin_trgm_ops'}),
+    )
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    id = Column(GUID, primary_key=True, default=uuid4)
     first_name = Column(String(50), nullable=False)
     middle_name = Column(String(50))
     last_name = Column(String(50), nullable=False)
@@ -25,7 +86,8 @@ class Customer(BaseModel):
     created_at = Column(DateTime, default=datetime.now)
 
     addresses = relationship(
-        "Address", back_populates="customer", cascade="all, delete, delete-orphan")
+        "Address", back_populates="customer", cascade="all, delete, delete-orphan",
+        passive_deletes=True, lazy="selectin")
 
     def as_json(self):
         return {
@@ -41,3 +103,224 @@ class Customer(BaseModel):
             'created_at': self.created_at,
             'addresses': [a.as_json() for a in self.addresses]
         }
+
+    @staticmethod
+    def cache_dependencies(value):
+        return [cache_key(Address.__tablename__, a['id']) for a in value['addresses']]
+
+    @staticmethod
+    def fields(fields):
+        return tuple(Customer.__table__.c.keys()) if fields is None else fields
+
+    # fields=None selects every column; addresses=False skips loading them.
+    def get_page(self, limit, cursor=None, order_by='id', where=(), fields=None, addresses=True,
+                 **criteria):
+        if fields is None and addresses:
+            return super().get_page(limit, cursor, order_by, where, **criteria)
+        items, next_cursor = super().get_page(limit, cursor, order_by, where, self.fields(fields),
+                                              **criteria)
+        if addresses:
+            self.embed_addresses(items)
+        return items, next_cursor
+
+    def get(self, id, fields=None, addresses=True):
+        if fields is None and addresses:
+            return super().get(id)
+        value = super().get(id, self.fields(fields))
+        if addresses:
+            self.embed_addresses([value])
+        return value
+
+    def from_rows(self, rows):
+        self.embed_addresses(rows)
+        return rows
+
+    def embed_addresses(self, items):
+        addresses = {item['id']: [] for item in items}
+        if addresses:
+            for address in self.session.query(Address).\
+                    filter(Address.customer_id.in_(list(addresses))):
+                addresses[address.customer_id].append(address.as_json())
+        for item in items:
+            item['addresses'] = addresses[item['id']]
+
+    def etag(self, id, fields=None, addresses=True):
+        if addresses:
+            return super().etag(id)
+        value = entity_cache.get(cache_key(self.__tablename__, id))
+        return make_etag(super().get_versions(id) if value is None else
+                         self.versions(self.project(value, ())))
+
+    # Addresses are deleted by the foreign key's ON DELETE CASCADE, which runs
+    # after the statement; the statement itself still sees them, so returns
+    # the ids for the audit.
+    @classmethod
+    def delete_statement(cls, where):
+        address = Address.__table__
+        return cls.__table__.delete().where(where).returning(
+            *cls.key_columns(),
+            select([func.array_agg(address.c.id)]).
+            where(address.c.customer_id == cls.id).label('address_ids'))
+
+    # delete_statement's address_ids, where there is no RETURNING to get them.
+    def key_rows(self, where):
+        rows = [dict(row) for row in super().key_rows(where)]
+        address_ids = {row['id']: [] for row in rows}
+        if address_ids:
+            address = Address.__table__
+            for (id, customer_id) in self.session.execute(
+                    select([address.c.id, address.c.customer_id]).
+                    where(address.c.customer_id.in_(list(address_ids)))):
+                address_ids[customer_id].append(id)
+        return [{**row, 'address_ids': address_ids[row['id']]} for row in rows]
+
+    # One row for each of the customer's addresses, or a single row with them
+    # NULL.
+    @staticmethod
+    def with_addresses(customer):
+        address = Address.__table__
+        return select([*customer.c, *[c.label(f'address_{c.key}') for c in address.c]]).\
+            select_from(customer.outerjoin(address, address.c.customer_id == customer.c.id))
+
+    @classmethod
+    def delete_row_statement(cls, id):
+        customer = cls.__table__
+        return cls.with_addresses(customer.delete().where(customer.c.id == id).
+                                  returning(*customer.c).cte('deleted_customer'))
+
+    @classmethod
+    def from_deleted_rows(cls, rows):
+        value = {c.key: rows[0][c.key] for c in cls.__table__.c}
+        value['addresses'] = [{c.key: row[f'address_{c.key}'] for c in Address.__table__.c}
+                              for row in rows if row['address_id'] is not None]
+        return value
+
+    def delete(self, id):
+        rows = self.delete_rows(id)
+        if not rows:
+            raise NoResultFound()
+        value = self.from_deleted_rows(rows)
+        self.record_changes('DELETE', [deleted_keys(value)])
+        self.session.commit()
+        return value
+
+    def delete_rows(self, id):
+        if self.returning:
+            return self.session.execute(self.delete_row_statement(id)).fetchall()
+        customer = self.__table__
+        rows = self.session.execute(self.with_addresses(customer).
+                                    where(customer.c.id == id)).fetchall()
+        if rows:
+            self.session.execute(customer.delete().where(customer.c.id == id))
+        return rows
+
+    def record_changes(self, operation, rows):
+        super().record_changes(operation, rows)
+        if operation == 'DELETE':
+            address_ids = deleted_address_ids(rows)
+            record(self.session, [audit_event(Address.__tablename__, id, 'DELETE')
+                                  for id in address_ids])
+            invalidate(self.session, [cache_key(Address.__tablename__, id) for id in address_ids])
+
+    def search(self, q, limit, cursor=None):
+        matches, rank = search_clauses(q)
+        keyset = RankedKeyset(rank, Customer.id, cursor)
+        rows = self.session.query(Customer, rank).filter(matches, *keyset.where).\
+            order_by(*keyset.order_by).\
+            limit(limit + 1).all()
+        return [c.as_json() for (c, _) in rows[:limit]], \
+            keyset.next_cursor([{'id': c.id, 'rank': r} for (c, r) in rows], limit)
+
+    @staticmethod
+    def versions(value):
+        return [(value['id'], value.get('last_updated'))] + \
+            sorted((a['id'], a.get('last_updated')) for a in value.get('addresses', ()))
+
+    def get_versions(self, id):
+        rows = self.session.query(Customer.id, Customer.last_updated, Address.id, Address.last_updated).\
+            outerjoin(Customer.addresses).\
+            filter(Customer.id == id).all()
+        if not rows:
+            raise NoResultFound()
+        return [tuple(rows[0][:2])] + sorted((r[2], r[3]) for r in rows if r[2] is not None)
+
+
+class AsyncCustomer(AsyncBaseModel):
+    model = Customer
+
+    async def as_json(self, rows):
+        addresses = {row['id']: [] for row in rows}
+        if addresses:
+            table = Address.__table__
+            for address in await self.db.fetch_all(select([table]).where(
+                    table.c.customer_id.in_(list(addresses)))):
+                address = as_dict(address)
+                addresses[address['customer_id']].append(address)
+        return [{**row, 'addresses': addresses[row['id']]} for row in rows]
+
+    async def get_page(self, limit, cursor=None, order_by='id', fields=None, addresses=True,
+                       **criteria):
+        if fields is None and addresses:
+            return await super().get_page(limit, cursor, order_by, **criteria)
+        items, next_cursor = await super().get_page(limit, cursor, order_by,
+                                                    Customer.fields(fields), **criteria)
+        return (await self.as_json(items) if addresses else items), next_cursor
+
+    async def get(self, id, fields=None, addresses=True):
+        if fields is None and addresses:
+            return await super().get(id)
+        value = await super().get(id, Customer.fields(fields))
+        return (await self.as_json([value]))[0] if addresses else value
+
+    async def etag(self, id, fields=None, addresses=True):
+        if addresses:
+            return await super().etag(id)
+        value = entity_cache.get(cache_key(self.table.name, id))
+        return make_etag(await super().get_versions(id) if value is None else
+                         self.versions(Customer.project(value, ())))
+
+    async def search(self, q, limit, cursor=None):
+        matches, rank = search_clauses(q)
+        keyset = RankedKeyset(rank, self.table.c.id, cursor)
+        rows = await self.db.fetch_all(select([self.table, rank]).
+                                       where(and_(matches, *keyset.where)).
+                                       order_by(*keyset.order_by).
+                                       limit(limit + 1))
+        rows = [as_dict(r) for r in rows]
+        items = await self.as_json([{k: v for (k, v) in r.items() if k != 'rank'}
+                                    for r in rows[:limit]])
+        return items, keyset.next_cursor(rows, limit)
+
+    async def get_versions(self, id):
+        customer, address = self.table, Address.__table__
+        rows = await self.db.fetch_all(select([customer.c.id, customer.c.last_updated,
+                                               address.c.id, address.c.last_updated]).
+                                       select_from(customer.outerjoin(address)).
+                                       where(customer.c.id == id))
+        if not rows:
+            raise NoResultFound()
+        rows = [tuple(r.values()) for r in rows]
+        return [rows[0][:2]] + sorted((r[2], r[3]) for r in rows if r[2] is not None)
+
+    def record_changes(self, events, operation, rows):
+        super().record_changes(events, operation, rows)
+        if operation == 'DELETE':
+            self.audit(events, 'DELETE', deleted_address_ids(rows), Address.__tablename__)
+
+    async def invalidate_changes(self, operation, rows):
+        await super().invalidate_changes(operation, rows)
+        if operation == 'DELETE':
+            await self.invalidate([{'id': id} for id in deleted_address_ids(rows)],
+                                  Address.__table__)
+
+    async def delete(self, id):
+        async with self.write_transaction() as events:
+            rows = [as_dict(r) for r in
+                    await self.db.fetch_all(Customer.delete_row_statement(id))]
+            if not rows:
+                raise NoResultFound()
+            value = Customer.from_deleted_rows(rows)
+            keys = [deleted_keys(value)]
+            self.record_changes(events, 'DELETE', keys)
+        await self.invalidate_changes('DELETE', keys)
+        return value
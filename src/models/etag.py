@@ -0,0 +1,9 @@
+from hashlib import sha1
+
+
+# Weak, because the tag tracks the row versions rather than the exact bytes
+# of a representation.
+def make_etag(versions):
+    digest = sha1('|'.join(','.join(str(part) for part in version)
+                           for version in versions).encode()).hexdigest()
+    return f'W/"{digest}"'
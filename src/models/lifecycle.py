@@ -0,0 +1,64 @@
+import logging
+from os import getpid
+from time import monotonic
+
+from sqlalchemy import select
+from sqlalchemy.orm import configure_mappers
+
+from models import db_pool_size, engine
+
+logger = logging.getLogger(__name__)
+
+
+# Startup is timed from when this module is imported, while the app is
+# being imported, to when the last startup handler has run.
+class Lifecycle:
+    def __init__(self):
+        self.started = monotonic()
+        self.ready_at = None
+        self.stopping = False
+
+    @property
+    def status(self):
+        if self.stopping:
+            return 'stopping'
+        return 'starting' if self.ready_at is None else 'ready'
+
+    def ready(self):
+        self.ready_at = monotonic()
+        logger.info("Worker %d ready in %.2fs", getpid(), self.ready_at - self.started)
+
+    def stop(self):
+        self.stopping = True
+
+    def as_json(self):
+        now = monotonic()
+        return {
+            'status': self.status,
+            'pid': getpid(),
+            'startup_seconds': None if self.ready_at is None else self.ready_at - self.started,
+            'uptime_seconds': now - self.started
+        }
+
+
+lifecycle = Lifecycle()
+
+
+# Configures the mappers, which SQLAlchemy otherwise does on the first query,
+# and opens the pool's connections, which the first requests would otherwise
+# wait for.
+def warm_up(engine=engine, size=db_pool_size):
+    configure_mappers()
+    connections = [engine.connect() for _ in range(size)]
+    for connection in connections:
+        connection.close()
+
+
+def database_available(engine=engine):
+    try:
+        with engine.connect() as connection:
+            connection.execute(select([1]))
+        return True
+    except Exception:
+        logger.exception("Health check could not reach the database")
+        return False
@@ -0,0 +1,256 @@
+import json
+import logging
+import os
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from os import environ, getpid
+from threading import Event, Lock, Thread, local
+
+from models import checkout_stats, engine
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# Every thread counts into a dict of its own, so recording takes no lock and
+# never contends; only reading sums the shards. A thread's shard outlives it,
+# keeping the totals monotonic.
+class ShardedCounter:
+    def __init__(self):
+        self.local = local()
+        self.lock = Lock()
+        self.shards = []
+
+    def _shard(self):
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = self.local.shard = {}
+            with self.lock:
+                self.shards.append(shard)
+        return shard
+
+    def add(self, key, amount=1):
+        shard = self._shard()
+        shard[key] = shard.get(key, 0) + amount
+
+    def values(self):
+        totals = {}
+        with self.lock:
+            shards = list(self.shards)
+        for shard in shards:
+            for (key, value) in dict(shard).items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counter = ShardedCounter()
+
+    def observe(self, labels, value):
+        shard = self.counter._shard()
+        bucket = (labels, bisect_left(self.buckets, value))
+        shard[bucket] = shard.get(bucket, 0) + 1
+        shard[(labels, 'sum')] = shard.get((labels, 'sum'), 0) + value
+
+    # {labels: ([cumulative count per bucket, +Inf last], sum)}, from this
+    # process's counts or from values summed across processes.
+    def collect(self, values=None):
+        values = self.counter.values() if values is None else values
+        series = {}
+        for ((labels, bucket), value) in values.items():
+            counts, total = series.get(labels, ([0] * (len(self.buckets) + 1), 0.0))
+            if bucket == 'sum':
+                total += value
+            else:
+                counts[bucket] += value
+            series[labels] = (counts, total)
+        for (counts, _) in series.values():
+            for i in range(1, len(counts)):
+                counts[i] += counts[i - 1]
+        return series
+
+
+request_counts = ShardedCounter()
+request_errors = ShardedCounter()
+request_latency = Histogram()
+
+
+def observe_request(method, route, status, seconds):
+    request_counts.add((method, route, status))
+    if status >= 500:
+        request_errors.add((method, route))
+    request_latency.observe((method, route), seconds)
+
+
+# The executor Starlette runs sync endpoints and dependencies in, counting
+# how many of its tasks wait for a thread and how many run.
+class InstrumentedThreadPool(ThreadPoolExecutor):
+    def __init__(self, max_workers):
+        super().__init__(max_workers=max_workers, thread_name_prefix='threadpool')
+        self.counter = ShardedCounter()
+
+    def submit(self, fn, *args, **kwargs):
+        self.counter.add('submitted')
+        return super().submit(self._run, fn, *args, **kwargs)
+
+    def _run(self, fn, *args, **kwargs):
+        self.counter.add('started')
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.counter.add('finished')
+
+    def as_json(self):
+        counts = self.counter.values()
+        submitted, started, finished = (counts.get(k, 0) for k in ('submitted', 'started', 'finished'))
+        return {
+            'max_workers': self._max_workers,
+            'active': started - finished,
+            'queued': submitted - started,
+            'completed': finished
+        }
+
+
+threadpool = InstrumentedThreadPool(
+    int(environ.get('THREADPOOL_SIZE', min(32, (os.cpu_count() or 1) + 4))))
+
+
+# StaticPool, which SQLite databases use, shares one connection it does not
+# count out.
+def pool_stats(pool):
+    if not hasattr(pool, 'size'):
+        return {'size': 1, 'checked_out': 0, 'overflow': 0}
+    return {
+        'size': pool.size(),
+        'checked_out': pool.checkedout(),
+        'overflow': max(pool.overflow(), 0)
+    }
+
+
+# Counters as [*key, value] rows, since JSON objects only take string keys.
+def _rows(values, flatten=lambda key: key):
+    return [[*flatten(key), value] for (key, value) in values.items()]
+
+
+def _values(rows, unflatten=lambda key: key):
+    return {unflatten(tuple(row[:-1])): row[-1] for row in rows}
+
+
+def worker_snapshot():
+    return {
+        'pid': getpid(),
+        'requests': _rows(request_counts.values()),
+        'errors': _rows(request_errors.values()),
+        'latency': _rows(request_latency.counter.values(),
+                         lambda key: (*key[0], key[1])),
+        'checkout': {'count': checkout_stats.count, 'total': checkout_stats.total,
+                     'max': checkout_stats.max},
+        'pool': pool_stats(engine.pool),
+        'threadpool': {k: v for (k, v) in threadpool.as_json().items() if k != 'completed'}
+    }
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# Sums what every worker counted. Counters include workers that have exited,
+# so the totals never go down; gauges only the workers still running.
+def merge(snapshots):
+    merged = {'requests': {}, 'errors': {}, 'latency': {},
+              'checkout': {'count': 0, 'total': 0.0, 'max': 0.0},
+              'pool': {'size': 0, 'checked_out': 0, 'overflow': 0},
+              'threadpool': {'max_workers': 0, 'active': 0, 'queued': 0}}
+    for snapshot in snapshots:
+        for (name, unflatten) in (('requests', tuple), ('errors', tuple),
+                                  ('latency', lambda key: (key[:-1], key[-1]))):
+            totals = merged[name]
+            for (key, value) in _values(snapshot[name], unflatten).items():
+                totals[key] = totals.get(key, 0) + value
+        checkout = merged['checkout']
+        checkout['count'] += snapshot['checkout']['count']
+        checkout['total'] += snapshot['checkout']['total']
+        checkout['max'] = max(checkout['max'], snapshot['checkout']['max'])
+        if snapshot['pid'] == getpid() or _alive(snapshot['pid']):
+            for gauges in ('pool', 'threadpool'):
+                for (key, value) in snapshot[gauges].items():
+                    merged[gauges][key] += value
+    return merged
+
+
+# Uvicorn's workers each count their own requests, and a scrape reaches any
+# one of them. With METRICS_DIR set, every worker writes what it counted to
+# <pid>.json in it every interval, and a scrape sums those files with the
+# scraped worker's own, current counts; without it, a worker only reports
+# its own.
+class MetricsStore:
+    def __init__(self, directory=environ.get('METRICS_DIR'),
+                 interval=float(environ.get('METRICS_WRITE_INTERVAL', 5))):
+        self.directory = directory
+        self.interval = interval
+        self.stopping = Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def path(self, pid):
+        return os.path.join(self.directory, f'{pid}.json')
+
+    def start(self):
+        if self.directory and not self.running:
+            os.makedirs(self.directory, exist_ok=True)
+            self.stopping.clear()
+            self.thread = Thread(target=self.run, name='metrics-store', daemon=True)
+            self.thread.start()
+
+    # Writes once more on the way out, so that an exiting worker's last
+    # counts stay in the totals.
+    def stop(self):
+        if self.running:
+            self.stopping.set()
+            self.thread.join()
+        self.thread = None
+
+    def run(self):
+        while True:
+            try:
+                self.write()
+            except Exception:
+                logger.exception("Writing the metrics to %s failed", self.directory)
+            if self.stopping.is_set():
+                return
+            self.stopping.wait(self.interval)
+
+    # Written to a temporary file and renamed, so readers never see half.
+    def write(self):
+        path = self.path(getpid())
+        with open(path + '.tmp', 'w') as file:
+            json.dump(worker_snapshot(), file)
+        os.replace(path + '.tmp', path)
+
+    def collect(self):
+        snapshots = [worker_snapshot()]
+        if self.directory and os.path.isdir(self.directory):
+            own = os.path.basename(self.path(getpid()))
+            for name in sorted(os.listdir(self.directory)):
+                if name.endswith('.json') and name != own:
+                    try:
+                        with open(os.path.join(self.directory, name)) as file:
+                            snapshots.append(json.load(file))
+                    except (OSError, ValueError):
+                        logger.exception("Reading the metrics in %s failed", name)
+        return merge(snapshots)
+
+
+metrics_store = MetricsStore()
@@ -0,0 +1,94 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections.abc import Mapping
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import DateTime, Float, literal, tuple_
+
+from models.types import GUID
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps([str(v) for v in values], separators=(',', ':'))
+    return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    try:
+        values = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        # encode_cursor writes strings only; anything else was tampered with.
+        if not isinstance(values, list) or len(values) != len(columns) or \
+                not all(isinstance(v, str) for v in values):
+            raise ValueError(cursor)
+        return [_coerce(column, value) for (column, value) in zip(columns, values)]
+    except ValueError:
+        raise PaginationError(f"Invalid cursor: {cursor}")
+
+
+def _coerce(column, value):
+    if isinstance(column.type, GUID):
+        return UUID(value)
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column.type, Float):
+        return float(value)
+    return value
+
+
+def _value(row, key):
+    if isinstance(row, Mapping):
+        return row[key]
+    return getattr(row, key)
+
+
+# Seeks past the last row with WHERE (col, id) > (:col, :id) instead of an
+# OFFSET, so every page costs the same no matter how deep it is.
+class Keyset:
+
+    def __init__(self, model, order_by='id', cursor=None):
+        descending = order_by.startswith('-')
+        name = order_by.lstrip('-')
+        if name not in model.__sortable__:
+            raise PaginationError(f"Cannot order by: {order_by}")
+
+        table = model.__table__
+        self.seek([table.c[name]] if name == 'id' else [table.c[name], table.c.id],
+                  descending, cursor)
+
+    def seek(self, columns, descending, cursor):
+        self.columns = columns
+        self.order_by = [c.desc() if descending else c.asc()
+                         for c in self.columns]
+        self.where = []
+
+        if cursor:
+            values = tuple_(*[literal(v, c.type) for (c, v) in zip(
+                self.columns, decode_cursor(cursor, self.columns))])
+            key = tuple_(*self.columns)
+            self.where.append(key < values if descending else key > values)
+
+    # What a projected page must select for next_cursor to read.
+    @property
+    def keys(self):
+        return [c.key for c in self.columns]
+
+    def next_cursor(self, rows, limit):
+        if len(rows) <= limit:
+            return None
+        last = rows[limit - 1]
+        return encode_cursor([_value(last, key) for key in self.keys])
+
+
+# Best match first: seeks on (rank, id), rank being a labelled expression.
+class RankedKeyset(Keyset):
+
+    def __init__(self, rank, id_column, cursor=None):
+        self.seek([rank, id_column], True, cursor)
@@ -1,7 +1,10 @@
-from typing import List, Optional
+from datetime import datetime
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
 from uuid import UUID, uuid4
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError, create_model
 
 
 class AddressIn(BaseModel):
@@ -11,6 +14,10 @@ class AddressIn(BaseModel):
     country: str
 
 
+class AddressBulkIn(AddressIn):
+    id: Optional[UUID] = None
+
+
 class AddressInPatch(BaseModel):
     street: Optional[str] = None
     city: Optional[str] = None
@@ -50,6 +57,10 @@ class CustomerIn(BaseModel):
     weight: float
 
 
+class CustomerBulkIn(CustomerIn):
+    id: Optional[UUID] = None
+
+
 class CustomerInPatch(BaseModel):
     first_name: Optional[str] = None
     middle_name: Optional[str] = None
@@ -81,3 +92,102 @@ class CustomerOut(BaseModel):
     height: float
     weight: float
     addresses: Optional[List[AddressOutEmbedded]] = None
+
+
+class SparseModel(BaseModel):
+    pass
+
+
+CUSTOMER_FIELDS = tuple(name for name in CustomerOut.__fields__ if name != 'addresses')
+
+
+# CustomerOut cut down to id, fields (every column when None) and, if asked
+# for, addresses; one class per selection, so its encoder is compiled once.
+@lru_cache(maxsize=None)
+def customer_out(fields=None, addresses=True):
+    if fields is None and addresses:
+        return CustomerOut
+    unknown = set(fields or ()) - set(CUSTOMER_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    selected = {'id', *(CUSTOMER_FIELDS if fields is None else fields)} | \
+        ({'addresses'} if addresses else set())
+    return create_model('CustomerOut', __base__=SparseModel, **{
+        name: (CustomerOut.__annotations__[name], field.field_info)
+        for (name, field) in CustomerOut.__fields__.items() if name in selected})
+
+
+class BulkItemError(BaseModel):
+    index: int
+    detail: Any
+
+
+class BulkResult(BaseModel):
+    upserted: List[UUID]
+    errors: List[BulkItemError]
+
+
+# ids is None for a dry run, which only counts the rows that would change.
+class ChangeResult(BaseModel):
+    count: int
+    ids: Optional[List[UUID]] = None
+    dry_run: bool = False
+
+
+MAX_BATCH_SIZE = 1000
+
+
+class BatchGetIn(BaseModel):
+    ids: List[UUID] = Field(..., max_items=MAX_BATCH_SIZE)
+
+
+class CustomerBatchOut(BaseModel):
+    items: Dict[UUID, CustomerOut]
+    not_found: List[UUID]
+
+
+class AddressBatchOut(BaseModel):
+    items: Dict[UUID, AddressOut]
+    not_found: List[UUID]
+
+
+class Operation(str, Enum):
+    INSERT = 'INSERT'
+    UPDATE = 'UPDATE'
+    DELETE = 'DELETE'
+
+
+class AuditOut(BaseModel):
+    id: UUID
+    table: str
+    item_id: UUID
+    operation: Operation
+    time: datetime
+
+
+# Only the dimensions grouped by are set; the others were summed over.
+class CustomerStatsGroup(BaseModel):
+    country: Optional[str]
+    city: Optional[str]
+    married: Optional[bool]
+    age_bucket: Optional[int]
+    customers: int
+    avg_age: Optional[float]
+    avg_height: Optional[float]
+    avg_weight: Optional[float]
+
+
+class CustomerStatsOut(BaseModel):
+    refreshed_at: Optional[datetime]
+    age_seconds: Optional[float]
+    groups: List[CustomerStatsGroup]
+
+
+def parse_items(model, items):
+    parsed, errors = [], []
+    for (index, item) in enumerate(items):
+        try:
+            parsed.append((index, model.parse_obj(item)))
+        except ValidationError as e:
+            errors.append(BulkItemError(index=index, detail=e.errors()))
+    return parsed, errors
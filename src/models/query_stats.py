@@ -0,0 +1,68 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Every tracker enclosing the code being run, e.g. a test's around a request's.
+# Threadpool workers run in a copy of the request's context, so they update
+# the same objects.
+current_query_stats = ContextVar('current_query_stats', default=())
+
+
+class QueryStats:
+    def __init__(self, record=False):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.slowest_statement = None
+        self.executed = [] if record else None
+
+    def observe(self, statement, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds >= self.slowest:
+            self.slowest = seconds
+            self.slowest_statement = statement
+        if self.executed is not None:
+            self.executed.append(statement)
+
+    def server_timing(self):
+        return [f'db;dur={self.total * 1000:.2f};desc="{self.count} statements"',
+                f'db-slowest;dur={self.slowest * 1000:.2f}']
+
+    def as_json(self):
+        return {
+            'db_statements': self.count,
+            'db_ms': round(self.total * 1000, 2),
+            'db_slowest_ms': round(self.slowest * 1000, 2),
+            'db_slowest_statement': self.slowest_statement
+        }
+
+
+@contextmanager
+def track_queries(record=False):
+    stats = QueryStats(record)
+    token = current_query_stats.set(current_query_stats.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        current_query_stats.reset(token)
+
+
+# Listening on Engine covers every engine, the audit writer's included; its
+# thread never runs in a request context, so its statements are not counted.
+@event.listens_for(Engine, 'before_cursor_execute')
+def query_started(conn, cursor, statement, parameters, context, executemany):
+    if current_query_stats.get():
+        conn.info['query_started'] = perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('query_started', None)
+    if started is not None:
+        seconds = perf_counter() - started
+        for stats in current_query_stats.get():
+            stats.observe(statement, seconds)
@@ -0,0 +1,131 @@
+import logging
+from datetime import datetime
+from os import environ
+from threading import Event, Thread
+
+from sqlalchemy import (Boolean, Column, DateTime, Float, Integer, MetaData,
+                        String, Table, func, select)
+from sqlalchemy.dialects.postgresql import insert
+
+from models import Base, engine
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ('country', 'city', 'married', 'age_bucket')
+# pg_advisory_xact_lock key held while refreshing, so that only one worker
+# of one process refreshes at a time.
+REFRESH_LOCK = 0x73746174
+
+# Materialized views are created by migrations, not create_all(), so they
+# live outside Base.metadata.
+views = MetaData()
+
+# Every combination of DIMENSIONS, as GROUP BY CUBE would compute it; the
+# rolled_up bitmask has the bit of every dimension summed over set, the first
+# dimension's highest. A customer counts once per group, however many of
+# their addresses fall in it.
+customer_stats = Table(
+    'customer_stats', views,
+    Column('rolled_up', Integer),
+    Column('country', String(50)),
+    Column('city', String(50)),
+    Column('married', Boolean),
+    Column('age_bucket', Integer),
+    Column('customers', Integer),
+    Column('avg_age', Float),
+    Column('avg_height', Float),
+    Column('avg_weight', Float)
+)
+
+stats_refresh = Table(
+    'stats_refresh', Base.metadata,
+    Column('view', String(63), primary_key=True),
+    Column('refreshed_at', DateTime)
+)
+
+
+def rolled_up(group_by):
+    return sum(1 << (len(DIMENSIONS) - 1 - i)
+               for (i, dimension) in enumerate(DIMENSIONS) if dimension not in group_by)
+
+
+class CustomerStats:
+    def __init__(self, session):
+        self.session = session
+
+    def get(self, group_by=()):
+        dimensions = [customer_stats.c[d] for d in DIMENSIONS if d in group_by]
+        measures = [customer_stats.c[m] for m in ('customers', 'avg_age', 'avg_height', 'avg_weight')]
+        rows = self.session.execute(select(dimensions + measures).
+                                    where(customer_stats.c.rolled_up == rolled_up(group_by)).
+                                    order_by(*dimensions))
+        return [dict(row) for row in rows]
+
+    def refreshed_at(self):
+        return self.session.execute(select([stats_refresh.c.refreshed_at]).
+                                    where(stats_refresh.c.view == customer_stats.name)).scalar()
+
+
+class StatsRefresher:
+    def __init__(self, engine, view=customer_stats,
+                 interval=float(environ.get('STATS_REFRESH_INTERVAL', 300))):
+        self.engine = engine
+        self.view = view
+        self.interval = interval
+        self.stopping = Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    # The view is PostgreSQL's; SQLite databases have none to refresh.
+    def start(self):
+        if self.interval > 0 and self.engine.dialect.name == 'postgresql' and not self.running:
+            self.stopping.clear()
+            self.thread = Thread(target=self.run, name='stats-refresher', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.running:
+            self.stopping.set()
+            self.thread.join()
+        self.thread = None
+
+    # Every process runs a refresher; they all read when the view was last
+    # refreshed, so between them it is refreshed about once per interval.
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                age = self.refresh_if_stale()
+            except Exception:
+                logger.exception("Refreshing %s failed", self.view.name)
+                age = 0.0
+            self.stopping.wait(max(self.interval - age, 1.0))
+
+    # Returns how many seconds old the view is afterwards.
+    def refresh_if_stale(self):
+        with self.engine.begin() as connection:
+            if not connection.execute(select([func.pg_try_advisory_xact_lock(REFRESH_LOCK)])).scalar():
+                return 0.0
+            refreshed_at = connection.execute(select([stats_refresh.c.refreshed_at]).
+                                              where(stats_refresh.c.view == self.view.name)).scalar()
+            if refreshed_at is not None:
+                age = (datetime.now() - refreshed_at).total_seconds()
+                if age < self.interval:
+                    return age
+            self.refresh(connection)
+        return 0.0
+
+    def refresh(self, connection):
+        started = datetime.now()
+        connection.execute(f'REFRESH MATERIALIZED VIEW CONCURRENTLY {self.view.name}')
+        upsert = insert(stats_refresh).values(view=self.view.name, refreshed_at=started)
+        connection.execute(upsert.on_conflict_do_update(
+            index_elements=[stats_refresh.c.view],
+            set_={'refreshed_at': upsert.excluded.refreshed_at}))
+        logger.info("Refreshed %s in %.1fs", self.view.name,
+                    (datetime.now() - started).total_seconds())
+
+
+stats_refresher = StatsRefresher(engine)
@@ -0,0 +1,25 @@
+from uuid import UUID
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.types import CHAR, TypeDecorator
+
+
+# PostgreSQL's native uuid, or its 36 character text form on databases
+# without one, such as SQLite. Values are uuid.UUID objects either way.
+class GUID(TypeDecorator):
+    impl = CHAR(36)
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=True))
+        return dialect.type_descriptor(CHAR(36))
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name == 'postgresql':
+            return value
+        return str(value if isinstance(value, UUID) else UUID(value))
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, UUID):
+            return value
+        return UUID(value)
@@ -1,24 +1,16 @@
 from datetime import datetime
-from os import environ
 from uuid import uuid4
 
+from models import engine
+from models.types import GUID
 from sqlalchemy import *
-from sqlalchemy.dialects.postgresql import UUID
-
-db_username = environ.get('DB_USERNAME')
-db_password = environ.get('DB_PASSWORD')
-db_hostname = environ.get('DB_HOSTNAME')
-db_name = environ.get('DB_NAME')
-
-engine = create_engine(
-    f'postgresql://{db_username}:{db_password}@{db_hostname}/{db_name}')
 
 metadata = MetaData(bind=engine)
 
 
 customer = Table(
     'customer', metadata,
-    Column('id', UUID(as_uuid=True), primary_key=True, default=uuid4),
+    Column('id', GUID, primary_key=True, default=uuid4),
     Column('first_name', String(50), nullable=False),
     Column('middle_name', String(50)),
     Column('last_name', String(50), nullable=False),
@@ -29,31 +21,61 @@ customer = Table(
     Column('weight', Float),
     Column('last_updated', DateTime,
            default=datetime.now, onupdate=datetime.now),
-    Column('created_at', DateTime, default=datetime.now)
+    Column('created_at', DateTime, default=datetime.now),
+    Index('ix_customer_first_name', 'first_name', 'id'),
+    Index('ix_customer_middle_name', 'middle_name', 'id'),
+    Index('ix_customer_last_name', 'last_name', 'id'),
+    Index('ix_customer_age', 'age', 'id'),
+    Index('ix_customer_married', 'married', 'id'),
+    Index('ix_customer_height', 'height', 'id'),
+    Index('ix_customer_weight', 'weight', 'id'),
+    Index('ix_customer_first_name_trgm', 'first_name', postgresql_using='gin',
+          postgresql_ops={'first_name': 'gin_trgm_ops'}),
+    Index('ix_customer_middle_name_trgm', 'middle_name', postgresql_using='gin',
+          postgresql_ops={'middle_name': 'gin_trgm_ops'}),
+    Index('ix_customer_last_name_trgm', 'last_name', postgresql_using='gin',
+          postgresql_ops={'last_name': 'gin_trgm_ops'})
 )
 
 
 address = Table(
     'address', metadata,
-    Column('id', UUID(as_uuid=True), primary_key=True, default=uuid4),
-    Column('customer_id', UUID(as_uuid=True), ForeignKey(
+    Column('id', GUID, primary_key=True, default=uuid4),
+    Column('customer_id', GUID, ForeignKey(
         "customer.id", onupdate='CASCADE', ondelete='CASCADE'), nullable=False),
     Column('street', String(50)),
     Column('city', String(50)),
     Column('country', String(50)),
     Column('last_updated', DateTime,
            default=datetime.now, onupdate=datetime.now),
-    Column('created_at', DateTime, default=datetime.now)
-
+    Column('created_at', DateTime, default=datetime.now),
+    Index('ix_address_customer_id', 'customer_id', 'id'),
+    Index('ix_address_street', 'street', 'id'),
+    Index('ix_address_city', 'city', 'id'),
+    Index('ix_address_country', 'country', 'id'),
+    Index('ix_address_street_trgm', 'street', postgresql_using='gin',
+          postgresql_ops={'street': 'gin_trgm_ops'}),
+    Index('ix_address_city_trgm', 'city', postgresql_using='gin',
+          postgresql_ops={'city': 'gin_trgm_ops'})
 )
 
 
 audit = Table(
     'audit', metadata,
-    Column('id', UUID(as_uuid=True), primary_key=True, default=uuid4),
+    Column('id', GUID, primary_key=True, default=uuid4),
     Column('table', String(50)),
-    Column('item_id', UUID(as_uuid=True)),
+    Column('item_id', GUID),
     Column('operation', Enum("INSERT", "UPDATE",
                              "DELETE", name="operation_enum")),
-    Column('time', Time)
+    Column('time', DateTime),
+    Index('ix_audit_item_id_time', 'item_id', 'time', 'id'),
+    Index('ix_audit_table_time', 'table', 'time', 'id'),
+    Index('ix_audit_time', 'time', 'id')
+)
+
+
+stats_refresh = Table(
+    'stats_refresh', metadata,
+    Column('view', String(63), primary_key=True),
+    Column('refreshed_at', DateTime)
 )
@@ -1,84 +1,184 @@
+import argparse
+import logging
 import os
-import sys
+from datetime import datetime
+from io import StringIO
+from multiprocessing import Pool
 from os import environ
-from random import randint
-from uuid import uuid4
-
-from models.pydanticmodels import DBAddress, DBCustomer
-from sqlalchemy import *
-
-from coremetadata import address, customer
-
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-sys.path.append(BASE_DIR)
-
-
-with open('seed/lists/names.txt') as f:
-    first_names = [l.strip() for l in f.readlines()]
-
-with open('seed/lists/lastnames.txt') as f:
-    last_names = [l.strip() for l in f.readlines()]
-
-with open('seed/lists/streets.txt') as f:
-    streets = [l.strip() for l in f.readlines()]
-
-with open('seed/lists/cities.txt') as f:
-    cities = [l.strip() for l in f.readlines()]
-
-with open('seed/lists/countries.txt') as f:
-    countries = [l.strip() for l in f.readlines()]
-
-
-db_username = environ.get('DB_USERNAME')
-db_password = environ.get('DB_PASSWORD')
-db_hostname = environ.get('DB_HOSTNAME')
-db_name = environ.get('DB_NAME')
-
-engine = create_engine(
-    f'postgresql://{db_username}:{db_password}@{db_hostname}/{db_name}')
-
-conn = engine.connect()
-conn.execute(customer.delete())
-conn.execute(address.delete())
-
-for i in range(100):
-    index1 = randint(0, 49)
-    index2 = randint(0, 49)
-
-    cId = str(uuid4())
-    aId1 = str(uuid4())
-    aId2 = str(uuid4())
-
-    customer_in = DBCustomer(
-        id=cId,
-        first_name=first_names[index1],
-        middle_name=None,
-        last_name=last_names[index2],
-        age=randint(1, 99),
-        married=randint(0, 1),
-        height=randint(100, 200),
-        weight=randint(60, 150)
-    )
-
-    address_in1 = DBAddress(
-        id=aId1,
-        customer_id=cId,
-        street=streets[index1],
-        city=cities[index1],
-        country=countries[index2]
-    )
-
-    address_in2 = DBAddress(
-        id=aId2,
-        customer_id=cId,
-        street=streets[index2],
-        city=cities[index2],
-        country=countries[index1]
-    )
-
-    ins1 = customer.insert().values(**customer_in.dict())
-    ins2 = address.insert().values(**address_in1.dict())
-    ins3 = address.insert().values(**address_in2.dict())
-    conn.execute(ins1)
-    conn.execute(ins2)
-    conn.execute(ins3)
+from random import Random
+from time import perf_counter
+from uuid import UUID
+
+from sqlalchemy import exists, select
+
+from seed.coremetadata import address, customer, engine
+
+logger = logging.getLogger(__name__)
+
+LISTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lists')
+
+
+def read_list(name):
+    with open(os.path.join(LISTS_DIR, name)) as f:
+        return [l.strip() for l in f.readlines() if l.strip()]
+
+
+first_names = read_list('names.txt')
+last_names = read_list('lastnames.txt')
+streets = read_list('streets.txt')
+cities = read_list('cities.txt')
+countries = read_list('countries.txt')
+
+CUSTOMER_COLUMNS = [c.name for c in customer.columns]
+ADDRESS_COLUMNS = [c.name for c in address.columns]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fill the database with generated customers.")
+    parser.add_argument('--customers', type=int,
+                        default=int(environ.get('SEED_CUSTOMERS', 100)))
+    parser.add_argument('--seed', type=int, default=int(environ.get('SEED_RANDOM_SEED', 0)),
+                        help="same seed and chunk size, same rows")
+    parser.add_argument('--min-addresses', type=int,
+                        default=int(environ.get('SEED_MIN_ADDRESSES', 2)))
+    parser.add_argument('--max-addresses', type=int,
+                        default=int(environ.get('SEED_MAX_ADDRESSES', 2)))
+    parser.add_argument('--chunk-size', type=int,
+                        default=int(environ.get('SEED_CHUNK_SIZE', 10000)),
+                        help="customers generated and loaded per transaction")
+    parser.add_argument('--workers', type=int,
+                        default=int(environ.get('SEED_WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('--method', choices=['copy', 'insert'],
+                        default=environ.get('SEED_METHOD', 'copy'))
+    parser.add_argument('--skip-if-exists', action='store_true',
+                        default=environ.get('SEED_SKIP_IF_EXISTS', 'false').lower() == 'true',
+                        help="leave the database alone if it already has customers")
+    args = parser.parse_args(argv)
+    if args.customers < 0 or args.chunk_size < 1 or args.workers < 1 or \
+            not 0 <= args.min_addresses <= args.max_addresses:
+        parser.error("invalid row counts")
+    return args
+
+
+def chunks(customers, chunk_size):
+    return [(start, min(chunk_size, customers - start))
+            for start in range(0, customers, chunk_size)]
+
+
+def _uuid(rng):
+    return UUID(int=rng.getrandbits(128), version=4)
+
+
+# Every chunk draws from its own generator seeded by (seed, start), so the
+# rows do not depend on how many workers there are or the order they run in.
+def generate_chunk(seed, start, count, min_addresses, max_addresses):
+    rng = Random(f'{seed}:{start}')
+    now = datetime.now()
+    customers, addresses = [], []
+    for _ in range(count):
+        customer_id = _uuid(rng)
+        customers.append({
+            'id': customer_id,
+            'first_name': rng.choice(first_names),
+            'middle_name': rng.choice(first_names) if rng.random() < 0.3 else None,
+            'last_name': rng.choice(last_names),
+            'age': rng.randint(1, 99),
+            'married': rng.random() < 0.5,
+            'height': round(rng.uniform(100, 200), 1),
+            'weight': round(rng.uniform(40, 150), 1),
+            'last_updated': now,
+            'created_at': now
+        })
+        for _ in range(rng.randint(min_addresses, max_addresses)):
+            addresses.append({
+                'id': _uuid(rng),
+                'customer_id': customer_id,
+                'street': rng.choice(streets),
+                'city': rng.choice(cities),
+                'country': rng.choice(countries),
+                'last_updated': now,
+                'created_at': now
+            })
+    return customers, addresses
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+def copy_rows(rows, columns):
+    buffer = StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_value(row[c]) for c in columns))
+        buffer.write('\n')
+    buffer.seek(0)
+    return buffer
+
+
+def load_copy(connection, table, rows, columns):
+    cursor = connection.connection.cursor()
+    quoted = ', '.join(f'"{c}"' for c in columns)
+    cursor.copy_expert(f'COPY {table.name} ({quoted}) FROM STDIN', copy_rows(rows, columns))
+
+
+def load_insert(connection, table, rows, columns):
+    # Bound to stay under the 65535 parameters a statement can carry.
+    size = 65535 // len(columns)
+    for i in range(0, len(rows), size):
+        connection.execute(table.insert().values(rows[i:i + size]))
+
+
+LOADERS = {'copy': load_copy, 'insert': load_insert}
+
+
+def load_chunk(args, chunk):
+    start, count = chunk
+    customers, addresses = generate_chunk(args.seed, start, count,
+                                          args.min_addresses, args.max_addresses)
+    load = LOADERS[args.method]
+    with engine.begin() as connection:
+        load(connection, customer, customers, CUSTOMER_COLUMNS)
+        load(connection, address, addresses, ADDRESS_COLUMNS)
+    return len(customers), len(addresses)
+
+
+def _load_chunk(job):
+    return load_chunk(*job)
+
+
+# Connections inherited across fork must not be shared with the parent.
+def _init_worker():
+    engine.dispose()
+
+
+def has_customers():
+    with engine.connect() as connection:
+        return connection.execute(select([exists().select_from(customer)])).scalar()
+
+
+def seed(args):
+    if args.skip_if_exists and has_customers():
+        logger.info("Customers already exist, skipping seeding")
+        return 0, 0
+    with engine.begin() as connection:
+        connection.execute(f'TRUNCATE {address.name}, {customer.name}')
+    engine.dispose()
+
+    started = perf_counter()
+    jobs = [(args, chunk) for chunk in chunks(args.customers, args.chunk_size)]
+    totals = [0, 0]
+    with Pool(min(args.workers, len(jobs) or 1), initializer=_init_worker) as pool:
+        for (customers, addresses) in pool.imap_unordered(_load_chunk, jobs):
+            totals[0] += customers
+            totals[1] += addresses
+            logger.info("Seeded %d/%d customers", totals[0], args.customers)
+    logger.info("Seeded %d customers and %d addresses in %.1fs",
+                totals[0], totals[1], perf_counter() - started)
+    return tuple(totals)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    seed(parse_args())
@@ -1,18 +1,53 @@
 import os
 import sys
 
-sys.path.append(os.path.join(os.path.dirname(
-    os.path.dirname(os.path.abspath(__file__))), 'src'))
-    
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.append(SRC_DIR)
+# Read when the engine is first used, so the app under test runs in-process
+# against in-memory SQLite.
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+
 import pytest
+from alembic import command
+from alembic.config import Config
+from controllers import async_address, async_customer
+from controllers.dependencies import get_session
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from main import app
+from models import engine, make_engine
+from models.address import Address
+from models.audit import audit
+from models.base_model import Base
+from models.cache import entity_cache
+from models.customer import Customer
+from models.query_stats import track_queries
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import sessionmaker
+
+
+@pytest.fixture(autouse=True)
+def clear_entity_cache():
+    entity_cache.clear()
 
 
 @pytest.fixture(scope='module')
 def client():
+    app.dependency_overrides[get_session] = lambda: MagicMock()
     client = TestClient(app)
     yield client
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture(scope='module')
+def async_client():
+    async_app = FastAPI()
+    async_app.include_router(async_customer.router)
+    async_app.include_router(async_address.router)
+    yield TestClient(async_app)
 
 
 @pytest.fixture(scope='module')
@@ -39,3 +74,136 @@ def mock_address_request_data():
         city="city name",
         country="country name"
     )
+
+
+@pytest.fixture
+def db_engine():
+    engine = make_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db_session(db_engine):
+    Session = sessionmaker(bind=db_engine)
+
+    def get_test_session():
+        session = Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    with patch.dict(app.dependency_overrides, {get_session: get_test_session}):
+        yield Session
+
+
+# The app's own engine and get_session, on the in-memory database DATABASE_URL
+# names above.
+@pytest.fixture
+def app_database():
+    Base.metadata.create_all(engine)
+    with patch.dict(app.dependency_overrides, clear=True):
+        yield engine
+    Base.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def statements(db_engine):
+    executed = []
+
+    @event.listens_for(db_engine, 'before_cursor_execute')
+    def count(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    return executed
+
+
+# Fails the block when it ran more than n statements, e.g. an N+1 in as_json.
+@pytest.fixture
+def assert_max_queries():
+    @contextmanager
+    def assert_max(n):
+        with track_queries(record=True) as stats:
+            yield stats
+        assert stats.count <= n, \
+            f"{stats.count} statements, expected at most {n}:\n" + '\n'.join(stats.executed)
+    return assert_max
+
+
+@pytest.fixture
+def make_customers(db_session):
+    def make(count, addresses=2):
+        session = db_session()
+        customers = [Customer(first_name=f"first name {i}", last_name="last name",
+                              age=30, married=False, height=170.5, weight=85.8,
+                              addresses=[Address(city="city name", country="country name")
+                                         for _ in range(addresses)])
+                     for i in range(count)]
+        session.add_all(customers)
+        session.commit()
+        ids = [c.id for c in customers]
+        session.close()
+        return ids
+    return make
+
+
+# A disposable Postgres database migrated to head, for what SQLite and
+# compiled SQL cannot show; the tests using it skip without one.
+@pytest.fixture(scope='session')
+def pg_engine():
+    database_url = os.environ.get('TEST_DATABASE_URL')
+    if not database_url:
+        pytest.skip("TEST_DATABASE_URL is not set to a disposable Postgres database")
+    config = Config(os.path.join(SRC_DIR, 'alembic.ini'))
+    config.set_main_option('script_location', os.path.join(SRC_DIR, 'alembic'))
+    config.set_main_option('sqlalchemy.url', database_url)
+    # alembic.ini's logging config would disable the app's loggers for the
+    # tests that follow.
+    with patch('logging.config.fileConfig'):
+        command.upgrade(config, 'head')
+    engine = create_engine(database_url)
+    yield engine
+    engine.dispose()
+
+
+# Audits in the write's transaction, so the audit rows land in Postgres too.
+@pytest.fixture
+def pg_session(pg_engine):
+    session = sessionmaker(bind=pg_engine)()
+    with patch('models.audit.audit_mode', 'transaction'):
+        yield session
+    session.close()
+
+
+# Customers with their addresses, all with the given values, deleted again
+# with whatever of them the test left.
+@pytest.fixture
+def pg_customers(pg_engine):
+    created = []
+
+    def make(count, addresses=2, **values):
+        values = dict(dict(first_name="first name", last_name="last name", age=30,
+                           married=False, height=170.5, weight=85.8), **values)
+        ids = []
+        for _ in range(count):
+            [id] = pg_engine.execute(Customer.__table__.insert().values(values)).inserted_primary_key
+            for _ in range(addresses):
+                pg_engine.execute(Address.__table__.insert().values(
+                    customer_id=id, city="city name", country="country name"))
+            ids.append(id)
+        created.extend(ids)
+        return ids
+
+    yield make
+    if created:
+        pg_engine.execute(Customer.__table__.delete().where(Customer.__table__.c.id.in_(created)))
+
+
+@pytest.fixture
+def pg_audited(pg_engine):
+    def audited(item_id):
+        return [operation for (operation,) in pg_engine.execute(
+            select([audit.c.operation]).where(audit.c.item_id == item_id).order_by(audit.c.time))]
+    return audited
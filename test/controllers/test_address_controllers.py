@@ -1,23 +1,26 @@
+import json
 from unittest.mock import patch
 from uuid import UUID
 
+from models.pagination import PaginationError
 from sqlalchemy.orm.exc import NoResultFound
 
 
-@patch("controllers.address.Address.get_all")
-def test_get_addresses(mock_get_all, client, mock_address_request_data):
-    mock_get_all.return_value = [mock_address_request_data.copy()]
+@patch("controllers.address.Address.get_page")
+def test_get_addresses(mock_get_page, client, mock_address_request_data):
+    mock_get_page.return_value = ([mock_address_request_data.copy()], None)
 
     response = client.get('/addresses')
 
-    mock_get_all.assert_called()
+    mock_get_page.assert_called_with(limit=100, cursor=None, order_by='id')
     assert response.json() == [mock_address_request_data]
+    assert 'X-Next-Cursor' not in response.headers
     assert response.status_code == 200
 
 
-@patch("controllers.address.Address.get_all")
-def test_get_addresses_with_query(mock_get_all, mock_address_request_data, client):
-    mock_get_all.return_value = [mock_address_request_data.copy()]
+@patch("controllers.address.Address.get_page")
+def test_get_addresses_with_query(mock_get_page, mock_address_request_data, client):
+    mock_get_page.return_value = ([mock_address_request_data.copy()], None)
     request_data = mock_address_request_data.copy()
     del request_data['id']
     del request_data['customer_id']
@@ -26,11 +29,47 @@ def test_get_addresses_with_query(mock_get_all, mock_address_request_data, clien
                           '&city=city%20name'
                           '&country=country%20name')
 
-    mock_get_all.assert_called_with(**request_data)
+    mock_get_page.assert_called_with(
+        limit=100, cursor=None, order_by='id', **request_data)
     assert response.json() == [mock_address_request_data]
     assert response.status_code == 200
 
 
+@patch("controllers.address.Address.get_page")
+def test_get_addresses_next_page(mock_get_page, mock_address_request_data, client):
+    mock_get_page.return_value = ([mock_address_request_data.copy()], 'next')
+
+    response = client.get('/addresses/?limit=1&cursor=current&order_by=customer_id')
+
+    mock_get_page.assert_called_with(
+        limit=1, cursor='current', order_by='customer_id')
+    assert response.headers['X-Next-Cursor'] == 'next'
+    assert response.json() == [mock_address_request_data]
+    assert response.status_code == 200
+
+
+@patch("controllers.address.Address.get_page")
+def test_get_addresses_invalid_page(mock_get_page, client):
+    mock_get_page.side_effect = PaginationError("Cannot order by: street")
+
+    response = client.get('/addresses/?order_by=street')
+
+    assert response.json() == {'detail': 'Cannot order by: street'}
+    assert response.status_code == 400
+
+
+@patch("controllers.address.Address.stream")
+def test_get_addresses_stream(mock_stream, mock_address_request_data, client):
+    mock_stream.return_value = iter([mock_address_request_data.copy()] * 2)
+
+    response = client.get('/addresses/?stream=true&city=city%20name')
+
+    mock_stream.assert_called_with(city='city name')
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        mock_address_request_data] * 2
+    assert response.status_code == 200
+
+
 @patch("controllers.address.Address.get")
 def test_get_address(mock_get, mock_address_request_data, client):
     mock_get.return_value = mock_address_request_data.copy()
@@ -56,6 +95,33 @@ def test_get_address_non_existent(mock_get, mock_address_request_data, client):
     assert response.status_code == 404
 
 
+@patch("controllers.audit.AuditEntry.history")
+def test_get_address_history(mock_history, client):
+    mock_history.return_value = ([], 'next')
+
+    response = client.get('/addresses/77e2c1f3-68f8-483b-bc30-fef0b1fe0d2a/history?order_by=-time')
+
+    mock_history.assert_called_with(limit=100, cursor=None, order_by='-time', since=None, until=None,
+                                    table='address',
+                                    item_id=UUID("77e2c1f3-68f8-483b-bc30-fef0b1fe0d2a"))
+    assert response.headers['X-Next-Cursor'] == 'next'
+    assert response.status_code == 200
+
+
+@patch("controllers.address.Address.get_many")
+def test_batch_get_addresses(mock_get_many, mock_address_request_data, client):
+    address_id = UUID(mock_address_request_data['id'])
+    mock_get_many.return_value = {address_id: mock_address_request_data}
+
+    response = client.post('/addresses/batch-get',
+                           json={'ids': [str(address_id), str(UUID(int=0)), str(address_id)]})
+
+    mock_get_many.assert_called_with([address_id, UUID(int=0)])
+    assert response.json() == {'items': {str(address_id): mock_address_request_data},
+                               'not_found': [str(UUID(int=0))]}
+    assert response.status_code == 200
+
+
 @patch("controllers.address.Address.insert")
 def test_add_address(mock_insert, mock_address_request_data, client):
     mock_insert.return_value = mock_address_request_data.copy()
@@ -71,6 +137,24 @@ def test_add_address(mock_insert, mock_address_request_data, client):
     assert response.status_code == 201
 
 
+@patch("controllers.address.Address.bulk_upsert")
+def test_bulk_upsert_addresses(mock_bulk_upsert, mock_address_request_data, client):
+    item = mock_address_request_data.copy()
+    invalid = item.copy()
+    del invalid['id']
+    del invalid['country']
+    mock_bulk_upsert.return_value = ([UUID(item['id'])], {1: 'duplicate'})
+
+    response = client.post('/addresses/bulk', json=[item, invalid, item])
+
+    [rows] = mock_bulk_upsert.call_args[0]
+    assert [row['id'] for row in rows] == [UUID(item['id'])] * 2
+    assert response.json()['upserted'] == [item['id']]
+    assert [e['index'] for e in response.json()['errors']] == [1, 2]
+    assert response.json()['errors'][1]['detail'] == 'duplicate'
+    assert response.status_code == 200
+
+
 @patch("controllers.address.Address.update")
 def test_update_address(mock_update, mock_address_request_data, client):
     mock_update.return_value = mock_address_request_data.copy()
@@ -122,3 +206,66 @@ def test_delete_address_non_existent(mock_delete, mock_address_request_data, cli
     assert response.json()[
         'detail'] == f"Address with id: {mock_address_request_data['id']} not found"
     assert response.status_code == 404
+
+
+@patch('controllers.address.Address.update_where')
+def test_update_addresses(mock_update_where, client):
+    mock_update_where.return_value = [UUID(int=1)]
+
+    response = client.patch('/addresses/?city=testCity', json={'country': 'testCountry'})
+
+    mock_update_where.assert_called_with({'country': 'testCountry'}, max_rows=1000, city='testCity')
+    assert response.json() == {'count': 1, 'ids': [str(UUID(int=1))], 'dry_run': False}
+    assert response.status_code == 200
+
+
+def test_update_addresses_without_changes(client):
+    response = client.patch('/addresses/', json={})
+
+    assert response.json()['detail'] == "No fields to update"
+    assert response.status_code == 400
+
+
+@patch('controllers.address.Address.delete_where')
+def test_delete_addresses(mock_delete_where, client):
+    mock_delete_where.return_value = []
+
+    response = client.delete('/addresses/?city=testCity&max_rows=10')
+
+    mock_delete_where.assert_called_with(max_rows=10, city='testCity')
+    assert response.json() == {'count': 0, 'ids': [], 'dry_run': False}
+    assert response.status_code == 200
+
+
+def test_change_addresses_in_process(app_database, mock_customer_request_data,
+                                     mock_address_request_data, client):
+    customer = client.post('/customers/', json=mock_customer_request_data).json()
+    data = dict(mock_address_request_data, customer_id=customer['id'], city="in process")
+    del data['id']
+    ids = [client.post('/addresses/', json=data).json()['id'] for _ in range(2)]
+
+    response = client.patch(f"/addresses/{ids[0]}", json={'street': "new street"})
+    assert response.status_code == 200
+    assert response.json()['street'] == "new street"
+    assert client.patch(f"/addresses/{UUID(int=0)}", json={'street': "new street"}).status_code == 404
+
+    # The row with a customer that does not exist fails on its own.
+    response = client.post('/addresses/bulk', json=[dict(data, id=ids[1], country="new country"),
+                                                    dict(data, customer_id=str(UUID(int=0))),
+                                                    data])
+    assert response.status_code == 200
+    assert len(response.json()['upserted']) == 2
+    assert [e['index'] for e in response.json()['errors']] == [1]
+    assert client.get(f"/addresses/{ids[1]}").json()['country'] == "new country"
+
+    assert client.patch('/addresses/?city=in%20process&max_rows=2',
+                        json={'country': "other"}).status_code == 400
+    assert client.patch('/addresses/?city=in%20process',
+                        json={'country': "other"}).json()['count'] == 3
+
+    assert client.delete(f"/addresses/{ids[0]}").json()['id'] == ids[0]
+    assert client.delete(f"/addresses/{ids[0]}").status_code == 404
+    assert client.delete('/addresses/?city=in%20process&max_rows=1').status_code == 400
+    assert client.delete('/addresses/?city=in%20process').json()['count'] == 2
+    assert [h['operation'] for h in client.get(f"/addresses/{ids[1]}/history").json()] == [
+        'INSERT', 'UPDATE', 'UPDATE', 'DELETE']
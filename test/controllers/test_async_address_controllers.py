@@ -0,0 +1,209 @@
+import json
+from unittest.mock import patch
+from uuid import UUID
+
+from models.pagination import PaginationError
+from sqlalchemy.orm.exc import NoResultFound
+
+
+@patch("controllers.async_address.AsyncAddress.get_page")
+def test_async_get_addresses(mock_get_page, async_client, mock_address_request_data):
+    mock_get_page.return_value = ([mock_address_request_data.copy()], None)
+
+    response = async_client.get('/addresses')
+
+    mock_get_page.assert_called_with(limit=100, cursor=None, order_by='id')
+    assert response.json() == [mock_address_request_data]
+    assert 'X-Next-Cursor' not in response.headers
+    assert response.status_code == 200
+
+
+@patch("controllers.async_address.AsyncAddress.stream")
+def test_async_get_addresses_stream(mock_stream, mock_address_request_data, async_client):
+    async def stream(**criteria):
+        yield mock_address_request_data
+
+    mock_stream.side_effect = stream
+
+    response = async_client.get('/addresses/?city=city%20name',
+                                headers={'Accept': 'application/x-ndjson'})
+
+    mock_stream.assert_called_with(city='city name')
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    assert [json.loads(line) for line in response.text.splitlines()] == [mock_address_request_data]
+    assert response.status_code == 200
+
+
+@patch("controllers.async_address.AsyncAddress.get_page")
+def test_async_get_addresses_with_query(mock_get_page, mock_address_request_data, async_client):
+    mock_get_page.return_value = ([mock_address_request_data.copy()], None)
+    request_data = mock_address_request_data.copy()
+    del request_data['id']
+    del request_data['customer_id']
+
+    response = async_client.get('/addresses/?street=street%20name'
+                          '&city=city%20name'
+                          '&country=country%20name')
+
+    mock_get_page.assert_called_with(
+        limit=100, cursor=None, order_by='id', **request_data)
+    assert response.json() == [mock_address_request_data]
+    assert response.status_code == 200
+
+
+@patch("controllers.async_address.AsyncAddress.get_page")
+def test_async_get_addresses_next_page(mock_get_page, mock_address_request_data, async_client):
+    mock_get_page.return_value = ([mock_address_request_data.copy()], 'next')
+
+    response = async_client.get('/addresses/?limit=1&cursor=current&order_by=customer_id')
+
+    mock_get_page.assert_called_with(
+        limit=1, cursor='current', order_by='customer_id')
+    assert response.headers['X-Next-Cursor'] == 'next'
+    assert response.json() == [mock_address_request_data]
+    assert response.status_code == 200
+
+
+@patch("controllers.async_address.AsyncAddress.get_page")
+def test_async_get_addresses_invalid_page(mock_get_page, async_client):
+    mock_get_page.side_effect = PaginationError("Cannot order by: street")
+
+    response = async_client.get('/addresses/?order_by=street')
+
+    assert response.json() == {'detail': 'Cannot order by: street'}
+    assert response.status_code == 400
+
+
+@patch("controllers.async_address.AsyncAddress.get")
+def test_async_get_address(mock_get, mock_address_request_data, async_client):
+    mock_get.return_value = mock_address_request_data.copy()
+
+    response = async_client.get('/addresses/77e2c1f3-68f8-483b-bc30-fef0b1fe0d2a')
+
+    mock_get.assert_called_with(
+        id=UUID("77e2c1f3-68f8-483b-bc30-fef0b1fe0d2a"))
+    assert response.json() == mock_address_request_data
+    assert response.status_code == 200
+
+
+@patch("controllers.async_address.AsyncAddress.get")
+def test_async_get_address_non_existent(mock_get, mock_address_request_data, async_client):
+    mock_get.side_effect = NoResultFound()
+
+    response = async_client.get('/addresses/77e2c1f3-68f8-483b-bc30-fef0b1fe0d2a')
+
+    mock_get.assert_called_with(
+        id=UUID("77e2c1f3-68f8-483b-bc30-fef0b1fe0d2a"))
+    assert response.json() == {
+        'detail': 'Address with id: 77e2c1f3-68f8-483b-bc30-fef0b1fe0d2a not found'}
+    assert response.status_code == 404
+
+
+@patch("controllers.async_address.AsyncAddress.get_many")
+def test_async_batch_get_addresses(mock_get_many, mock_address_request_data, async_client):
+    address_id = UUID(mock_address_request_data['id'])
+    mock_get_many.return_value = {address_id: mock_address_request_data}
+
+    response = async_client.post('/addresses/batch-get',
+                           json={'ids': [str(address_id), str(UUID(int=0)), str(address_id)]})
+
+    mock_get_many.assert_called_with([address_id, UUID(int=0)])
+    assert response.json() == {'items': {str(address_id): mock_address_request_data},
+                               'not_found': [str(UUID(int=0))]}
+    assert response.status_code == 200
+
+
+@patch("controllers.async_address.AsyncAddress.insert")
+def test_async_add_address(mock_insert, mock_address_request_data, async_client):
+    mock_insert.return_value = mock_address_request_data.copy()
+    request_data = mock_address_request_data.copy()
+    del request_data['id']
+
+    response = async_client.post('/addresses/', json=request_data)
+
+    request_data['customer_id'] = UUID(request_data['customer_id'])
+
+    mock_insert.assert_called_with(**request_data)
+    assert response.json() == mock_address_request_data
+    assert response.status_code == 201
+
+
+@patch("controllers.async_address.AsyncAddress.update")
+def test_async_update_address(mock_update, mock_address_request_data, async_client):
+    mock_update.return_value = mock_address_request_data.copy()
+
+    request_data = mock_address_request_data.copy()
+    del request_data['id']
+    del request_data['customer_id']
+
+    response = async_client.patch(
+        f'/addresses/{mock_address_request_data["id"]}', json=request_data)
+
+    mock_update.assert_called_with(
+        UUID(mock_address_request_data['id']), **request_data)
+    assert response.json() == mock_address_request_data
+    assert response.status_code == 200
+
+
+@patch("controllers.async_address.AsyncAddress.update")
+def test_async_update_address_non_existent(mock_update, mock_address_request_data, async_client):
+    mock_update.side_effect = NoResultFound()
+
+    response = async_client.patch(
+        f'/addresses/{mock_address_request_data["id"]}', json={})
+
+    mock_update.assert_called_with(UUID(mock_address_request_data['id']))
+    assert response.json()[
+        'detail'] == f"Address with id: {mock_address_request_data['id']} not found"
+    assert response.status_code == 404
+
+
+@patch("controllers.async_address.AsyncAddress.delete")
+def test_async_delete_address(mock_delete, mock_address_request_data, async_client):
+    mock_delete.return_value = mock_address_request_data.copy()
+
+    response = async_client.delete(f"/addresses/{mock_address_request_data['id']}")
+
+    mock_delete.assert_called_with(UUID(mock_address_request_data['id']))
+    assert response.json() == mock_address_request_data
+    assert response.status_code == 200
+
+
+@patch("controllers.async_address.AsyncAddress.delete")
+def test_async_delete_address_non_existent(mock_delete, mock_address_request_data, async_client):
+    mock_delete.side_effect = NoResultFound()
+
+    response = async_client.delete(f"/addresses/{mock_address_request_data['id']}")
+
+    mock_delete.assert_called_with(UUID(mock_address_request_data['id']))
+    assert response.json()[
+        'detail'] == f"Address with id: {mock_address_request_data['id']} not found"
+    assert response.status_code == 404
+
+
+@patch('controllers.async_address.AsyncAddress.update_where')
+def test_async_update_addresses(mock_update_where, async_client):
+    mock_update_where.return_value = [UUID(int=1)]
+
+    response = async_client.patch('/addresses/?city=testCity', json={'country': 'testCountry'})
+
+    mock_update_where.assert_called_with({'country': 'testCountry'}, max_rows=1000, city='testCity')
+    assert response.json() == {'count': 1, 'ids': [str(UUID(int=1))], 'dry_run': False}
+    assert response.status_code == 200
+
+
+def test_async_update_addresses_without_changes(async_client):
+    response = async_client.patch('/addresses/', json={})
+
+    assert response.status_code == 400
+
+
+@patch('controllers.async_address.AsyncAddress.delete_where')
+def test_async_delete_addresses(mock_delete_where, async_client):
+    mock_delete_where.return_value = []
+
+    response = async_client.delete('/addresses/?city=testCity')
+
+    mock_delete_where.assert_called_with(max_rows=1000, city='testCity')
+    assert response.json() == {'count': 0, 'ids': [], 'dry_run': False}
+    assert response.status_code == 200
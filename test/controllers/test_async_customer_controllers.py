@@ -0,0 +1,321 @@
+import json
+from unittest.mock import patch
+from uuid import UUID
+
+import pytest
+
+from models.base_model import TooManyRowsError
+from models.pagination import PaginationError
+from sqlalchemy.orm.exc import NoResultFound
+
+
+@patch('controllers.async_customer.AsyncCustomer.get_page')
+def test_async_get_customers(mock_get_page, async_client, mock_customer_request_data):
+    mock_get_page.return_value = ([mock_customer_request_data.copy()], None)
+
+    response = async_client.get('/customers')
+
+    mock_get_page.assert_called_with(limit=100, cursor=None, order_by='id')
+    assert response.json() == [mock_customer_request_data]
+    assert 'X-Next-Cursor' not in response.headers
+    assert response.status_code == 200
+
+
+def rows_of(*rows):
+    async def stream(**criteria):
+        for row in rows:
+            yield row
+    return stream
+
+
+@pytest.mark.parametrize('request_args', [
+    dict(params={'stream': 'true', 'married': 'true'}),
+    dict(params={'married': 'true'}, headers={'Accept': 'application/x-ndjson'})])
+@patch('controllers.async_customer.AsyncCustomer.get_page')
+@patch('controllers.async_customer.AsyncCustomer.stream')
+def test_async_get_customers_stream(mock_stream, mock_get_page, request_args, async_client,
+                                    mock_customer_request_data):
+    mock_stream.side_effect = rows_of(mock_customer_request_data, mock_customer_request_data)
+
+    response = async_client.get('/customers/', **request_args)
+
+    mock_stream.assert_called_with(married=True)
+    mock_get_page.assert_not_called()
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    assert [json.loads(line) for line in response.text.splitlines()] == \
+        [mock_customer_request_data] * 2
+    assert response.status_code == 200
+
+
+@patch('controllers.async_customer.AsyncCustomer.get_page')
+def test_async_get_customers_with_query(mock_get_page, async_client, mock_customer_request_data):
+    mock_get_page.return_value = ([mock_customer_request_data], None)
+
+    response = async_client.get('/customers/?first_name=testFirstName'
+                          '&middle_name=testMiddleName&last_name=testLastName&'
+                          'age=50&married=true&height=150.5&weight=150.8')
+
+    mock_get_page.assert_called_with(
+        limit=100,
+        cursor=None,
+        order_by='id',
+        first_name='testFirstName',
+        middle_name='testMiddleName',
+        last_name='testLastName',
+        age=50,
+        married=True,
+        height=150.5,
+        weight=150.8
+    )
+    assert response.json() == [mock_customer_request_data]
+    assert response.status_code == 200
+
+
+@patch('controllers.async_customer.AsyncCustomer.get_page')
+def test_async_get_customers_next_page(mock_get_page, async_client, mock_customer_request_data):
+    mock_get_page.return_value = ([mock_customer_request_data], 'next')
+
+    response = async_client.get('/customers/?limit=1&cursor=current&order_by=-last_name')
+
+    mock_get_page.assert_called_with(
+        limit=1, cursor='current', order_by='-last_name')
+    assert response.headers['X-Next-Cursor'] == 'next'
+    assert response.json() == [mock_customer_request_data]
+    assert response.status_code == 200
+
+
+@patch('controllers.async_customer.AsyncCustomer.get_page')
+def test_async_get_customers_invalid_page(mock_get_page, async_client):
+    mock_get_page.side_effect = PaginationError("Invalid cursor: current")
+
+    response = async_client.get('/customers/?cursor=current')
+
+    assert response.json() == {'detail': 'Invalid cursor: current'}
+    assert response.status_code == 400
+
+
+@patch('controllers.async_customer.AsyncCustomer.search')
+def test_async_search_customers(mock_search, async_client, mock_customer_request_data):
+    mock_search.return_value = ([mock_customer_request_data.copy()], None)
+
+    response = async_client.get('/customers/search?q=jon')
+
+    mock_search.assert_called_with(q='jon', limit=100, cursor=None)
+    assert response.json() == [mock_customer_request_data]
+    assert response.status_code == 200
+
+
+@patch('controllers.async_customer.AsyncCustomer.search')
+def test_async_search_customers_invalid_page(mock_search, async_client):
+    mock_search.side_effect = PaginationError("Invalid cursor: current")
+
+    response = async_client.get('/customers/search?q=jon&cursor=current')
+
+    assert response.status_code == 400
+
+
+def test_async_get_customers_limit_out_of_range(async_client):
+    response = async_client.get('/customers/?limit=0')
+
+    assert response.status_code == 422
+
+
+@patch('controllers.async_customer.AsyncCustomer.get')
+def test_async_get_customer(mock_get, mock_customer_request_data, async_client):
+    mock_get.return_value = mock_customer_request_data.copy()
+
+    response = async_client.get('/customers/47dd46aa-2668-4fe6-a8db-e6a47dd63cde')
+
+    mock_get.assert_called_with(
+        id=UUID("47dd46aa-2668-4fe6-a8db-e6a47dd63cde"))
+    assert response.json() == mock_customer_request_data
+    assert response.status_code == 200
+
+
+@patch('controllers.async_customer.AsyncCustomer.get')
+def test_async_get_customer_non_existent(mock_get, async_client):
+    mock_get.side_effect = NoResultFound()
+
+    response = async_client.get('/customers/47dd46aa-2668-4fe6-a8db-e6a47dd63cde')
+
+    mock_get.assert_called_with(
+        id=UUID("47dd46aa-2668-4fe6-a8db-e6a47dd63cde"))
+    assert response.json() == {
+        'detail': 'Customer with id: 47dd46aa-2668-4fe6-a8db-e6a47dd63cde not found'}
+    assert response.status_code == 404
+
+
+@patch('controllers.async_customer.AsyncCustomer.get_page')
+def test_async_get_customers_fields(mock_get_page, async_client, mock_customer_request_data):
+    mock_get_page.return_value = ([mock_customer_request_data.copy()], None)
+
+    response = async_client.get('/customers?fields=married,age,married')
+
+    mock_get_page.assert_called_with(limit=100, cursor=None, order_by='id',
+                                     fields=('age', 'married'), addresses=False)
+    assert response.json() == [{'id': mock_customer_request_data['id'], 'age': 30,
+                                'married': True}]
+    assert async_client.get('/customers?fields=street').status_code == 400
+
+
+@patch('controllers.async_customer.AsyncCustomer.get')
+def test_async_get_customer_fields(mock_get, mock_customer_request_data, async_client):
+    mock_get.return_value = mock_customer_request_data.copy()
+
+    response = async_client.get('/customers/47dd46aa-2668-4fe6-a8db-e6a47dd63cde'
+                                '?fields=age&include=addresses')
+
+    mock_get.assert_called_with(id=UUID("47dd46aa-2668-4fe6-a8db-e6a47dd63cde"),
+                                fields=('age',), addresses=True)
+    assert response.json() == {'id': mock_customer_request_data['id'], 'age': 30,
+                               'addresses': []}
+    assert async_client.get('/customers/47dd46aa-2668-4fe6-a8db-e6a47dd63cde?fields=x').\
+        status_code == 400
+
+
+@patch('controllers.async_customer.AsyncCustomer.get_many')
+def test_async_batch_get_customers(mock_get_many, mock_customer_request_data, async_client):
+    customer_id = UUID(mock_customer_request_data['id'])
+    mock_get_many.return_value = {customer_id: mock_customer_request_data}
+
+    response = async_client.post('/customers/batch-get',
+                                 json={'ids': [str(UUID(int=0)), str(customer_id)]})
+
+    mock_get_many.assert_called_with([UUID(int=0), customer_id])
+    assert response.json() == {'items': {str(customer_id): mock_customer_request_data},
+                               'not_found': [str(UUID(int=0))]}
+    assert response.status_code == 200
+
+
+@patch('controllers.async_customer.AsyncCustomer.insert')
+def test_async_add_customer(mock_insert, mock_customer_request_data, async_client):
+    mock_insert.return_value = mock_customer_request_data.copy()
+    request_data = mock_customer_request_data.copy()
+    del request_data['id']
+    del request_data['addresses']
+
+    response = async_client.post('/customers/', json=request_data)
+
+    mock_insert.assert_called_with(**request_data)
+    assert response.json() == mock_customer_request_data
+    assert response.status_code == 201
+
+
+@patch('controllers.async_customer.AsyncCustomer.update')
+def test_async_update_customer(mock_update, mock_customer_request_data, async_client):
+    mock_update.return_value = mock_customer_request_data.copy()
+
+    request_data = mock_customer_request_data.copy()
+    del request_data['id']
+    del request_data['addresses']
+
+    response = async_client.patch(
+        f"/customers/{mock_customer_request_data['id']}", json=request_data)
+
+    mock_update.assert_called_with(
+        UUID(mock_customer_request_data['id']), **request_data)
+    assert response.json() == mock_customer_request_data
+    assert response.status_code == 200
+
+
+@patch('controllers.async_customer.AsyncCustomer.update')
+def test_async_update_customer_non_existent(mock_update, mock_customer_request_data, async_client):
+    mock_update.side_effect = NoResultFound()
+
+    response = async_client.patch(
+        f"/customers/{mock_customer_request_data['id']}", json={})
+
+    mock_update.assert_called_with(UUID(mock_customer_request_data['id']))
+    assert response.json()[
+        'detail'] == f"Customer with id: {mock_customer_request_data['id']} not found"
+    assert response.status_code == 404
+
+
+@patch('controllers.async_customer.AsyncCustomer.delete')
+def test_async_delete_customer(mock_delete, mock_customer_request_data, async_client):
+    mock_delete.return_value = mock_customer_request_data.copy()
+
+    response = async_client.delete(f"/customers/{mock_customer_request_data['id']}")
+
+    mock_delete.assert_called_with(UUID(mock_customer_request_data['id']))
+    assert response.json() == mock_customer_request_data
+    assert response.status_code == 200
+
+
+@patch('controllers.async_customer.AsyncCustomer.delete')
+def test_async_delete_customer_non_existent(mock_delete, mock_customer_request_data, async_client):
+    mock_delete.side_effect = NoResultFound()
+
+    response = async_client.delete(f"/customers/{mock_customer_request_data['id']}")
+
+    mock_delete.assert_called_with(UUID(mock_customer_request_data['id']))
+    assert response.json()[
+        'detail'] == f"Customer with id: {mock_customer_request_data['id']} not found"
+    assert response.status_code == 404
+
+
+@patch('controllers.async_customer.AsyncCustomer.update_where')
+def test_async_update_customers(mock_update_where, async_client):
+    mock_update_where.return_value = [UUID(int=1)]
+
+    response = async_client.patch('/customers/?last_name=testLastName', json={'married': True})
+
+    mock_update_where.assert_called_with({'married': True}, max_rows=1000, last_name='testLastName')
+    assert response.json() == {'count': 1, 'ids': [str(UUID(int=1))], 'dry_run': False}
+    assert response.status_code == 200
+
+
+@patch('controllers.async_customer.AsyncCustomer.count_where')
+def test_async_update_customers_dry_run(mock_count_where, async_client):
+    mock_count_where.return_value = 3
+
+    response = async_client.patch('/customers/?dry_run=true&age=50', json={'married': True})
+
+    mock_count_where.assert_called_with(age=50)
+    assert response.json() == {'count': 3, 'ids': None, 'dry_run': True}
+    assert response.status_code == 200
+
+
+@patch('controllers.async_customer.AsyncCustomer.update_where')
+def test_async_update_customers_too_many_rows(mock_update_where, async_client):
+    mock_update_where.side_effect = TooManyRowsError("More than max_rows=1 rows match")
+
+    response = async_client.patch('/customers/?max_rows=1&age=50', json={'married': True})
+
+    assert response.json()['detail'] == "More than max_rows=1 rows match"
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('method', ['patch', 'delete'])
+@patch('controllers.async_customer.AsyncCustomer.count_where')
+@patch('controllers.async_customer.AsyncCustomer.delete_where')
+@patch('controllers.async_customer.AsyncCustomer.update_where')
+def test_async_change_customers_without_filters(mock_update_where, mock_delete_where,
+                                                mock_count_where, method, async_client):
+    kwargs = {'json': {'married': True}} if method == 'patch' else {}
+
+    response = getattr(async_client, method)('/customers/?dry_run=true', **kwargs)
+
+    assert response.json()['detail'] == "At least one filter is required"
+    assert response.status_code == 400
+    mock_update_where.assert_not_called()
+    mock_delete_where.assert_not_called()
+    mock_count_where.assert_not_called()
+
+
+def test_async_update_customers_without_changes(async_client):
+    response = async_client.patch('/customers/', json={})
+
+    assert response.json()['detail'] == "No fields to update"
+    assert response.status_code == 400
+
+
+@patch('controllers.async_customer.AsyncCustomer.delete_where')
+def test_async_delete_customers(mock_delete_where, async_client):
+    mock_delete_where.return_value = [UUID(int=1)]
+
+    response = async_client.delete('/customers/?married=false')
+
+    mock_delete_where.assert_called_with(max_rows=1000, married=False)
+    assert response.json() == {'count': 1, 'ids': [str(UUID(int=1))], 'dry_run': False}
+    assert response.status_code == 200
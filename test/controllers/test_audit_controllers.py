@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from uuid import UUID, uuid4
+
+import pytest
+from models.audit import audit
+from models.pagination import PaginationError
+
+ITEM_ID = "47dd46aa-2668-4fe6-a8db-e6a47dd63cde"
+
+
+@pytest.fixture(scope='module')
+def mock_audit_data():
+    return dict(
+        id="0b4d2c1e-4f6a-4f0e-9a43-2d1b7f4c9e11",
+        table="customer",
+        item_id=ITEM_ID,
+        operation="UPDATE",
+        time="2021-01-02T03:04:05"
+    )
+
+
+@patch("controllers.audit.AuditEntry.history")
+def test_get_audit(mock_history, mock_audit_data, client):
+    mock_history.return_value = ([mock_audit_data.copy()], None)
+
+    response = client.get('/audit')
+
+    mock_history.assert_called_with(limit=100, cursor=None, order_by='time',
+                                    since=None, until=None)
+    assert response.json() == [mock_audit_data]
+    assert 'X-Next-Cursor' not in response.headers
+    assert response.status_code == 200
+
+
+@patch("controllers.audit.AuditEntry.history")
+def test_get_audit_with_filters(mock_history, mock_audit_data, client):
+    mock_history.return_value = ([mock_audit_data.copy()], 'next')
+
+    response = client.get(f'/audit/?table=customer&item_id={ITEM_ID}&operation=UPDATE'
+                          '&since=2021-01-01T00:00:00&until=2021-02-01T00:00:00'
+                          '&limit=1&cursor=current&order_by=-time')
+
+    mock_history.assert_called_with(limit=1, cursor='current', order_by='-time',
+                                    since=datetime(2021, 1, 1), until=datetime(2021, 2, 1),
+                                    operation='UPDATE', table='customer', item_id=UUID(ITEM_ID))
+    assert response.headers['X-Next-Cursor'] == 'next'
+    assert response.status_code == 200
+
+
+@patch("controllers.audit.AuditEntry.history")
+def test_get_audit_invalid_page(mock_history, client):
+    mock_history.side_effect = PaginationError("Cannot order by: table")
+
+    response = client.get('/audit/?order_by=table')
+
+    assert response.json() == {'detail': 'Cannot order by: table'}
+    assert response.status_code == 400
+
+
+def test_get_audit_invalid_operation(client):
+    response = client.get('/audit/?operation=SELECT')
+
+    assert response.status_code == 422
+
+
+def test_get_customer_history_pages(db_engine, db_session, client):
+    start = datetime(2021, 1, 1)
+    events = [dict(id=uuid4(), table='customer', item_id=UUID(ITEM_ID),
+                   operation='UPDATE', time=start + timedelta(minutes=i)) for i in range(5)]
+    events.append(dict(id=uuid4(), table='customer', item_id=uuid4(),
+                       operation='INSERT', time=start))
+    db_engine.execute(audit.insert().values(events))
+
+    first = client.get(f'/customers/{ITEM_ID}/history?limit=2&since=2021-01-01T00:01:00')
+    second = client.get(f'/customers/{ITEM_ID}/history?limit=2&since=2021-01-01T00:01:00'
+                        f'&cursor={first.headers["X-Next-Cursor"]}')
+
+    assert [e['time'] for e in first.json() + second.json()] == [
+        (start + timedelta(minutes=i)).isoformat() for i in range(1, 5)]
+    assert 'X-Next-Cursor' not in second.headers
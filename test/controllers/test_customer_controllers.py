@@ -1,29 +1,40 @@
+import json
 from unittest.mock import patch
 from uuid import UUID
 
+import pytest
+
+from models.address import Address
+from models.base_model import TooManyRowsError
+from models.cache import entity_cache
+from models.pagination import PaginationError
 from sqlalchemy.orm.exc import NoResultFound
 
 
-@patch('controllers.customer.Customer.get_all')
-def test_get_customers(mock_get_all, client, mock_customer_request_data):
-    mock_get_all.return_value = [mock_customer_request_data.copy()]
+@patch('controllers.customer.Customer.get_page')
+def test_get_customers(mock_get_page, client, mock_customer_request_data):
+    mock_get_page.return_value = ([mock_customer_request_data.copy()], None)
 
     response = client.get('/customers')
 
-    mock_get_all.assert_called()
+    mock_get_page.assert_called_with(limit=100, cursor=None, order_by='id')
     assert response.json() == [mock_customer_request_data]
+    assert 'X-Next-Cursor' not in response.headers
     assert response.status_code == 200
 
 
-@patch('controllers.customer.Customer.get_all')
-def test_get_customers_with_query(mock_get_all, client, mock_customer_request_data):
-    mock_get_all.return_value = [mock_customer_request_data]
+@patch('controllers.customer.Customer.get_page')
+def test_get_customers_with_query(mock_get_page, client, mock_customer_request_data):
+    mock_get_page.return_value = ([mock_customer_request_data], None)
 
     response = client.get('/customers/?first_name=testFirstName'
                           '&middle_name=testMiddleName&last_name=testLastName&'
                           'age=50&married=true&height=150.5&weight=150.8')
 
-    mock_get_all.assert_called_with(
+    mock_get_page.assert_called_with(
+        limit=100,
+        cursor=None,
+        order_by='id',
         first_name='testFirstName',
         middle_name='testMiddleName',
         last_name='testLastName',
@@ -36,6 +47,100 @@ def test_get_customers_with_query(mock_get_all, client, mock_customer_request_da
     assert response.status_code == 200
 
 
+@patch('controllers.customer.Customer.get_page')
+def test_get_customers_next_page(mock_get_page, client, mock_customer_request_data):
+    mock_get_page.return_value = ([mock_customer_request_data], 'next')
+
+    response = client.get('/customers/?limit=1&cursor=current&order_by=-last_name')
+
+    mock_get_page.assert_called_with(
+        limit=1, cursor='current', order_by='-last_name')
+    assert response.headers['X-Next-Cursor'] == 'next'
+    assert response.json() == [mock_customer_request_data]
+    assert response.status_code == 200
+
+
+@patch('controllers.customer.Customer.get_page')
+def test_get_customers_invalid_page(mock_get_page, client):
+    mock_get_page.side_effect = PaginationError("Invalid cursor: current")
+
+    response = client.get('/customers/?cursor=current')
+
+    assert response.json() == {'detail': 'Invalid cursor: current'}
+    assert response.status_code == 400
+
+
+# A cursor of [1] instead of the id's string.
+def test_get_customers_tampered_cursor(make_customers, client):
+    make_customers(1)
+
+    response = client.get('/customers/?cursor=WzFd')
+
+    assert response.json() == {'detail': 'Invalid cursor: WzFd'}
+    assert response.status_code == 400
+
+
+@patch('controllers.customer.Customer.search')
+def test_search_customers(mock_search, client, mock_customer_request_data):
+    mock_search.return_value = ([mock_customer_request_data.copy()], 'next')
+
+    response = client.get('/customers/search?q=jon&limit=1')
+
+    mock_search.assert_called_with(q='jon', limit=1, cursor=None)
+    assert response.json() == [mock_customer_request_data]
+    assert response.headers['X-Next-Cursor'] == 'next'
+    assert response.status_code == 200
+
+
+@patch('controllers.customer.Customer.search')
+def test_search_customers_invalid_page(mock_search, client):
+    mock_search.side_effect = PaginationError("Invalid cursor: current")
+
+    response = client.get('/customers/search?q=jon&cursor=current')
+
+    assert response.json() == {'detail': 'Invalid cursor: current'}
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('query', ['', '?q=', '?q=' + 'a' * 101])
+def test_search_customers_invalid_query(query, client):
+    response = client.get('/customers/search' + query)
+
+    assert response.status_code == 422
+
+
+def test_get_customers_limit_out_of_range(client):
+    response = client.get('/customers/?limit=0')
+
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize('count', [1, 10])
+def test_get_customers_query_count(count, make_customers, assert_max_queries, client):
+    make_customers(count)
+
+    with assert_max_queries(2):
+        response = client.get('/customers')
+
+    assert len(response.json()) == count
+    assert all(len(c['addresses']) == 2 for c in response.json())
+
+
+@pytest.mark.parametrize('request_args', [
+    dict(params={'stream': 'true'}),
+    dict(headers={'Accept': 'application/x-ndjson'})])
+def test_get_customers_stream(request_args, make_customers, client):
+    ids = make_customers(3)
+
+    response = client.get('/customers', **request_args)
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    assert [c['id'] for c in lines] == sorted(str(i) for i in ids)
+    assert all(len(c['addresses']) == 2 for c in lines)
+    assert response.status_code == 200
+
+
 @patch('controllers.customer.Customer.get')
 def test_get_customer(mock_get, mock_customer_request_data, client):
     mock_get.return_value = mock_customer_request_data.copy()
@@ -61,6 +166,212 @@ def test_get_customer_non_existent(mock_get, client):
     assert response.status_code == 404
 
 
+@pytest.mark.parametrize('addresses', [0, 10])
+def test_get_customer_query_count(addresses, make_customers, assert_max_queries, client):
+    [customer_id] = make_customers(1, addresses)
+
+    with assert_max_queries(2):
+        response = client.get(f'/customers/{customer_id}')
+
+    assert len(response.json()['addresses']) == addresses
+
+
+@patch('controllers.audit.AuditEntry.history')
+def test_get_customer_history(mock_history, client):
+    mock_history.return_value = ([], None)
+
+    response = client.get('/customers/47dd46aa-2668-4fe6-a8db-e6a47dd63cde/history?operation=DELETE')
+
+    mock_history.assert_called_with(limit=100, cursor=None, order_by='time', since=None, until=None,
+                                    operation='DELETE', table='customer',
+                                    item_id=UUID("47dd46aa-2668-4fe6-a8db-e6a47dd63cde"))
+    assert response.json() == []
+    assert response.status_code == 200
+
+
+def test_get_customer_etag(db_session, make_customers, statements, client):
+    [customer_id] = make_customers(1)
+    response = client.get(f'/customers/{customer_id}')
+    etag = response.headers['ETag']
+    entity_cache.clear()
+    statements.clear()
+
+    not_modified = client.get(f'/customers/{customer_id}', headers={'If-None-Match': etag})
+
+    assert not_modified.status_code == 304
+    assert not_modified.headers['ETag'] == etag
+    assert len(statements) == 1
+    assert 'first_name' not in statements[0]
+
+    session = db_session()
+    session.query(Address).filter_by(customer_id=customer_id).first().city = "other city"
+    session.commit()
+    entity_cache.clear()
+
+    modified = client.get(f'/customers/{customer_id}', headers={'If-None-Match': etag})
+
+    assert modified.status_code == 200
+    assert modified.headers['ETag'] != etag
+
+
+def test_get_customer_etag_not_found(db_session, client):
+    response = client.get('/customers/47dd46aa-2668-4fe6-a8db-e6a47dd63cde',
+                          headers={'If-None-Match': 'W/"a"'})
+
+    assert response.status_code == 404
+
+
+def without_timing(headers):
+    return {k: v for (k, v) in headers.items() if k != 'server-timing'}
+
+
+def test_get_customers_fast_serialization(make_customers, client):
+    [customer_id, _] = make_customers(2)
+    fast = [client.get('/customers'), client.get(f'/customers/{customer_id}')]
+
+    with patch('controllers.responses.serialization_mode', 'pydantic'):
+        standard = [client.get('/customers'), client.get(f'/customers/{customer_id}')]
+
+    assert [r.content for r in fast] == [r.content for r in standard]
+    assert [without_timing(r.headers) for r in fast] == \
+        [without_timing(r.headers) for r in standard]
+
+
+def test_get_customers_etag(make_customers, client):
+    make_customers(2)
+    etag = client.get('/customers').headers['ETag']
+
+    response = client.get('/customers', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert client.get('/customers?limit=1', headers={'If-None-Match': etag}).status_code == 200
+
+
+@pytest.mark.parametrize('count', [1, 10])
+def test_get_customers_fields(count, make_customers, assert_max_queries, client):
+    make_customers(count)
+
+    with assert_max_queries(1) as stats:
+        response = client.get('/customers?fields=first_name,age')
+
+    assert 'address' not in stats.executed[0]
+    assert 'middle_name' not in stats.executed[0]
+    assert [set(c) for c in response.json()] == [{'id', 'first_name', 'age'}] * count
+    assert response.status_code == 200
+
+
+def test_get_customers_fields_ordered_by_other_column(make_customers, client):
+    make_customers(3)
+
+    first = client.get('/customers?fields=age&order_by=-first_name&limit=2')
+    second = client.get(f"/customers?fields=age&order_by=-first_name&limit=2"
+                        f"&cursor={first.headers['X-Next-Cursor']}")
+
+    assert [first.status_code, second.status_code] == [200, 200]
+    assert [set(c) for c in first.json() + second.json()] == [{'id', 'age'}] * 3
+    assert 'X-Next-Cursor' not in second.headers
+
+
+def test_get_customers_include_addresses(make_customers, assert_max_queries, client):
+    make_customers(3)
+
+    with assert_max_queries(2):
+        response = client.get('/customers?fields=last_name&include=addresses')
+
+    assert all(set(c) == {'id', 'last_name', 'addresses'} for c in response.json())
+    assert all(len(c['addresses']) == 2 for c in response.json())
+
+
+def test_get_customers_without_addresses(make_customers, client):
+    make_customers(1)
+
+    [customer] = client.get('/customers?include=').json()
+
+    assert 'addresses' not in customer
+    assert customer['first_name'] == "first name 0"
+
+
+@pytest.mark.parametrize('query, status', [
+    ('fields=first_name,addresses', 400),
+    ('fields=password', 400),
+    ('fields=first_name,', 422),
+    ('include=orders', 422)])
+def test_get_customers_invalid_selection(query, status, client):
+    response = client.get(f'/customers?{query}')
+
+    assert response.status_code == status
+
+
+def test_get_customers_fields_validated(make_customers, client):
+    [customer_id] = make_customers(1)
+    query = f'/customers/{customer_id}?fields=age,height&include=addresses'
+    fast = [client.get('/customers?fields=age,height&include=addresses'), client.get(query)]
+
+    with patch('controllers.responses.serialization_mode', 'pydantic'):
+        standard = [client.get('/customers?fields=age,height&include=addresses'),
+                    client.get(query)]
+
+    assert [r.json() for r in fast] == [r.json() for r in standard]
+    assert [r.headers['ETag'] for r in fast] == [r.headers['ETag'] for r in standard]
+
+
+def test_get_customer_fields(make_customers, assert_max_queries, client):
+    [customer_id] = make_customers(1)
+
+    with assert_max_queries(1):
+        response = client.get(f'/customers/{customer_id}?fields=middle_name')
+
+    assert response.json() == {'id': str(customer_id), 'middle_name': None}
+    assert client.get(f'/customers/{customer_id}?fields=height&include=addresses').\
+        json()['addresses'][0]['city'] == "city name"
+
+
+def test_get_customer_fields_etag(db_session, make_customers, assert_max_queries, client):
+    [customer_id] = make_customers(1)
+    etag = client.get(f'/customers/{customer_id}?fields=age').headers['ETag']
+
+    with assert_max_queries(1):
+        not_modified = client.get(f'/customers/{customer_id}?fields=age',
+                                  headers={'If-None-Match': etag})
+
+    assert not_modified.status_code == 304
+    assert etag != client.get(f'/customers/{customer_id}').headers['ETag']
+
+    session = db_session()
+    session.query(Address).filter_by(customer_id=customer_id).first().city = "other city"
+    session.commit()
+    entity_cache.clear()
+
+    assert client.get(f'/customers/{customer_id}?fields=age',
+                      headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_batch_get_customers(make_customers, assert_max_queries, client):
+    ids = [str(i) for i in make_customers(3)]
+    missing = "47dd46aa-2668-4fe6-a8db-e6a47dd63cde"
+    request = {'ids': [ids[2], missing, ids[0], ids[2]]}
+
+    with assert_max_queries(2):
+        response = client.post('/customers/batch-get', json=request)
+
+    assert list(response.json()['items']) == [ids[2], ids[0]]
+    assert all(len(c['addresses']) == 2 for c in response.json()['items'].values())
+    assert response.json()['not_found'] == [missing]
+    assert response.status_code == 200
+
+    # Only the missing id is looked up again.
+    with assert_max_queries(1) as stats:
+        assert client.post('/customers/batch-get', json=request).json() == response.json()
+    assert 'address' not in stats.executed[0]
+
+
+def test_batch_get_customers_too_many_ids(client):
+    response = client.post('/customers/batch-get',
+                           json={'ids': ["47dd46aa-2668-4fe6-a8db-e6a47dd63cde"] * 1001})
+
+    assert response.status_code == 422
+
+
 @patch('controllers.customer.Customer.insert')
 def test_add_customer(mock_insert, mock_customer_request_data, client):
     mock_insert.return_value = mock_customer_request_data.copy()
@@ -75,6 +386,25 @@ def test_add_customer(mock_insert, mock_customer_request_data, client):
     assert response.status_code == 201
 
 
+@patch('controllers.customer.Customer.bulk_upsert')
+def test_bulk_upsert_customers(mock_bulk_upsert, mock_customer_request_data, client):
+    item = mock_customer_request_data.copy()
+    del item['addresses']
+    invalid = item.copy()
+    del invalid['id']
+    del invalid['first_name']
+    mock_bulk_upsert.return_value = ([UUID(item['id'])], {1: 'duplicate'})
+
+    response = client.post('/customers/bulk', json=[item, invalid, item])
+
+    [rows] = mock_bulk_upsert.call_args[0]
+    assert [row['id'] for row in rows] == [UUID(item['id'])] * 2
+    assert response.json()['upserted'] == [item['id']]
+    assert [e['index'] for e in response.json()['errors']] == [1, 2]
+    assert response.json()['errors'][1]['detail'] == 'duplicate'
+    assert response.status_code == 200
+
+
 @patch('controllers.customer.Customer.update')
 def test_update_customer(mock_update, mock_customer_request_data, client):
     mock_update.return_value = mock_customer_request_data.copy()
@@ -126,3 +456,146 @@ def test_delete_customer_non_existent(mock_delete, mock_customer_request_data, c
     assert response.json()[
         'detail'] == f"Customer with id: {mock_customer_request_data['id']} not found"
     assert response.status_code == 404
+
+
+@patch('controllers.customer.Customer.update_where')
+def test_update_customers(mock_update_where, client):
+    mock_update_where.return_value = [UUID(int=1), UUID(int=2)]
+
+    response = client.patch('/customers/?last_name=testLastName&max_rows=5', json={'married': True})
+
+    mock_update_where.assert_called_with({'married': True}, max_rows=5, last_name='testLastName')
+    assert response.json() == {'count': 2, 'ids': [str(UUID(int=1)), str(UUID(int=2))],
+                               'dry_run': False}
+    assert response.status_code == 200
+
+
+@patch('controllers.customer.Customer.update_where')
+@patch('controllers.customer.Customer.count_where')
+def test_update_customers_dry_run(mock_count_where, mock_update_where, client):
+    mock_count_where.return_value = 7
+
+    response = client.patch('/customers/?age=50&dry_run=true', json={'married': True})
+
+    mock_count_where.assert_called_with(age=50)
+    mock_update_where.assert_not_called()
+    assert response.json() == {'count': 7, 'ids': None, 'dry_run': True}
+    assert response.status_code == 200
+
+
+@patch('controllers.customer.Customer.update_where')
+def test_update_customers_too_many_rows(mock_update_where, client):
+    mock_update_where.side_effect = TooManyRowsError("More than max_rows=1 rows match")
+
+    response = client.patch('/customers/?max_rows=1&age=50', json={'married': True})
+
+    assert response.json()['detail'] == "More than max_rows=1 rows match"
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('method', ['patch', 'delete'])
+@pytest.mark.parametrize('query', ['', '?dry_run=true'])
+@patch('controllers.customer.Customer.count_where')
+@patch('controllers.customer.Customer.delete_where')
+@patch('controllers.customer.Customer.update_where')
+def test_change_customers_without_filters(mock_update_where, mock_delete_where, mock_count_where,
+                                          query, method, client):
+    kwargs = {'json': {'married': True}} if method == 'patch' else {}
+
+    response = getattr(client, method)(f'/customers/{query}', **kwargs)
+
+    assert response.json()['detail'] == "At least one filter is required"
+    assert response.status_code == 400
+    mock_update_where.assert_not_called()
+    mock_delete_where.assert_not_called()
+    mock_count_where.assert_not_called()
+
+
+@pytest.mark.parametrize('query', ['max_rows=0', 'dry_run=maybe'])
+def test_update_customers_invalid_params(query, client):
+    response = client.patch(f'/customers/?{query}', json={'married': True})
+
+    assert response.status_code == 422
+
+
+@patch('controllers.customer.Customer.update_where')
+def test_update_customers_without_changes(mock_update_where, client):
+    response = client.patch('/customers/', json={})
+
+    mock_update_where.assert_not_called()
+    assert response.json()['detail'] == "No fields to update"
+    assert response.status_code == 400
+
+
+@patch('controllers.customer.Customer.delete_where')
+def test_delete_customers(mock_delete_where, client):
+    mock_delete_where.return_value = [UUID(int=1)]
+
+    response = client.delete('/customers/?married=false')
+
+    mock_delete_where.assert_called_with(max_rows=1000, married=False)
+    assert response.json() == {'count': 1, 'ids': [str(UUID(int=1))], 'dry_run': False}
+    assert response.status_code == 200
+
+
+def test_create_and_get_customer_in_process(app_database, mock_customer_request_data,
+                                            mock_address_request_data, assert_max_queries,
+                                            client):
+    customer = client.post('/customers/', json=mock_customer_request_data).json()
+    address = client.post('/addresses/', json=dict(mock_address_request_data,
+                                                   customer_id=customer['id'])).json()
+    del address['customer_id']
+    expected = dict(mock_customer_request_data, id=customer['id'], addresses=[address])
+
+    with assert_max_queries(2):
+        response = client.get(f"/customers/{customer['id']}")
+    assert response.json() == expected
+
+    assert client.get('/customers/').json() == [expected]
+    missing = mock_customer_request_data['id']
+    response = client.post('/customers/batch-get', json={'ids': [customer['id'], missing]})
+    assert response.json() == {'items': {customer['id']: expected}, 'not_found': [missing]}
+
+
+def test_change_customers_in_process(app_database, mock_customer_request_data,
+                                     mock_address_request_data, client):
+    data = dict(mock_customer_request_data, last_name="in process")
+    del data['id']
+    ids = [client.post('/customers/', json=data).json()['id'] for _ in range(3)]
+    address = client.post('/addresses/', json=dict(mock_address_request_data,
+                                                   customer_id=ids[0])).json()
+
+    response = client.patch(f"/customers/{ids[0]}", json={'age': 40})
+    assert response.status_code == 200
+    assert response.json()['age'] == 40
+    assert [a['id'] for a in response.json()['addresses']] == [address['id']]
+    assert client.patch(f"/customers/{ids[0]}", json={'age': 40}).json() == response.json()
+    assert client.patch(f"/customers/{UUID(int=0)}", json={'age': 40}).status_code == 404
+
+    response = client.post('/customers/bulk', json=[dict(data, id=ids[1], age=50), data])
+    assert response.status_code == 200
+    upserted = response.json()['upserted']
+    assert upserted[0] == ids[1] and response.json()['errors'] == []
+    assert client.get(f"/customers/{ids[1]}").json()['age'] == 50
+    assert client.get(f"/customers/{upserted[1]}").status_code == 200
+
+    response = client.patch('/customers/?last_name=in%20process&max_rows=3', json={'married': False})
+    assert response.status_code == 400
+    assert client.get(f"/customers/{ids[2]}").json()['married'] is True
+    response = client.patch('/customers/?last_name=in%20process', json={'married': False})
+    assert response.json()['count'] == 4
+    assert client.get(f"/customers/{ids[2]}").json()['married'] is False
+
+    response = client.delete(f"/customers/{ids[0]}")
+    assert response.status_code == 200
+    assert [a['id'] for a in response.json()['addresses']] == [address['id']]
+    assert client.get(f"/addresses/{address['id']}").status_code == 404
+    assert client.delete(f"/customers/{ids[0]}").status_code == 404
+    assert [h['operation'] for h in client.get(f"/customers/{ids[0]}/history").json()] == [
+        'INSERT', 'UPDATE', 'UPDATE', 'DELETE']
+    assert [h['operation'] for h in client.get(f"/addresses/{address['id']}/history").json()] == [
+        'INSERT', 'DELETE']
+
+    assert client.delete('/customers/?last_name=in%20process&max_rows=2').status_code == 400
+    assert client.delete('/customers/?last_name=in%20process').json()['count'] == 3
+    assert client.get('/customers/').json() == []
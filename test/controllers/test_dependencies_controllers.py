@@ -0,0 +1,48 @@
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+from controllers.dependencies import FieldParams, HistoryParams, get_session
+from models.pydanticmodels import Operation
+
+
+@patch('controllers.dependencies.Session')
+def test_get_session(MockSession):
+    dependency = get_session()
+
+    session = next(dependency)
+
+    assert session is MockSession.return_value
+    session.connection.assert_not_called()
+    session.close.assert_not_called()
+
+    with pytest.raises(StopIteration):
+        next(dependency)
+    session.close.assert_called()
+
+
+@patch('controllers.dependencies.Session')
+def test_get_session_closed_on_error(MockSession):
+    dependency = get_session()
+    session = next(dependency)
+
+    with pytest.raises(ValueError):
+        dependency.throw(ValueError())
+    session.close.assert_called()
+
+
+def test_history_params():
+    params = HistoryParams(limit=10, operation=Operation.DELETE, since=datetime(2021, 1, 1))
+
+    assert params.dict() == dict(limit=10, cursor=None, order_by='time', operation='DELETE',
+                                 since=datetime(2021, 1, 1), until=None)
+
+
+@pytest.mark.parametrize('fields, include, expected', [
+    (None, None, {}),
+    ('age,first_name,age', None, dict(fields=('age', 'first_name'), addresses=False)),
+    ('age', 'addresses', dict(fields=('age',), addresses=True)),
+    (None, '', dict(fields=None, addresses=False)),
+    (None, 'addresses', dict(fields=None, addresses=True))])
+def test_field_params(fields, include, expected):
+    assert FieldParams(fields=fields, include=include).dict() == expected
@@ -0,0 +1,76 @@
+import json
+import logging
+
+import pytest
+from controllers.instrumentation import (MetricsMiddleware,
+                                         QueryTimingMiddleware,
+                                         configure_request_log, logger)
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def request_log():
+    handlers, level, propagate = list(logger.handlers), logger.level, logger.propagate
+    yield
+    logger.handlers[:] = handlers
+    logger.setLevel(level)
+    logger.propagate = propagate
+
+
+def test_server_timing(make_customers, client, caplog):
+    make_customers(2)
+
+    with caplog.at_level(logging.INFO, logger='controllers.instrumentation'):
+        response = client.get('/customers/')
+
+    [db, slowest, app] = response.headers['Server-Timing'].split(', ')
+    assert db.startswith('db;dur=') and db.endswith(';desc="2 statements"')
+    assert slowest.startswith('db-slowest;dur=')
+    assert app.startswith('app;dur=')
+    record = json.loads(caplog.records[-1].getMessage())
+    assert {k: record[k] for k in ('method', 'path', 'status', 'db_statements')} == \
+        {'method': 'GET', 'path': '/customers/', 'status': 200, 'db_statements': 2}
+    assert record['db_slowest_statement'].startswith('SELECT')
+
+
+def test_server_timing_without_queries(client):
+    response = client.get('/')
+
+    assert response.headers['Server-Timing'].startswith('db;dur=0.00;desc="0 statements"')
+
+
+def test_logged_when_request_fails(caplog):
+    app = FastAPI()
+    app.add_middleware(QueryTimingMiddleware)
+
+    @app.get('/fail')
+    def fail():
+        raise RuntimeError()
+
+    with caplog.at_level(logging.INFO, logger='controllers.instrumentation'):
+        response = TestClient(app, raise_server_exceptions=False).get('/fail')
+
+    assert response.status_code == 500
+    assert json.loads(caplog.records[-1].getMessage())['status'] is None
+
+
+def test_configure_request_log(request_log, client, capsys):
+    logger.setLevel(logging.WARNING)
+
+    configure_request_log()
+    configure_request_log()
+    client.get('/')
+
+    assert len(logger.handlers) == 1
+    [line] = capsys.readouterr().out.splitlines()
+    assert json.loads(line)['path'] == '/'
+
+
+def test_non_http_scope_passed_through():
+    app = FastAPI()
+    app.add_middleware(QueryTimingMiddleware)
+    app.add_middleware(MetricsMiddleware)
+
+    with TestClient(app) as client:
+        assert client.get('/docs').status_code == 200
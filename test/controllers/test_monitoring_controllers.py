@@ -0,0 +1,121 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+import pytest
+
+from controllers.instrumentation import use_threadpool
+from models.metrics import metrics_store, threadpool
+
+
+@patch("controllers.monitoring.entity_cache.as_json")
+def test_get_cache_stats(mock_as_json, client):
+    mock_as_json.return_value = {'hits': 9, 'misses': 1}
+
+    response = client.get('/monitoring/cache')
+
+    assert response.json() == {'hits': 9, 'misses': 1}
+    assert response.status_code == 200
+
+
+def metric_lines(client):
+    response = client.get('/metrics')
+    assert response.headers['content-type'] == 'text/plain; version=0.0.4; charset=utf-8'
+    return response.text.splitlines()
+
+
+def sample(lines, prefix):
+    [value] = [float(line.rsplit(' ', 1)[1]) for line in lines if line.startswith(prefix + ' ')]
+    return value
+
+
+def test_get_metrics(client):
+    before = metric_lines(client)
+    client.get('/unknown')
+    client.get('/')
+
+    lines = metric_lines(client)
+
+    route = '{method="GET",route="/"'
+    assert sample(lines, 'http_requests_total' + route + ',status="200"}') == \
+        sample(before, 'http_requests_total' + route + ',status="200"}') + 1
+    assert any(line.startswith('http_requests_total{method="GET",route="unmatched",status="404"}')
+               for line in lines)
+    assert sample(lines, 'http_request_duration_seconds_bucket' + route + ',le="+Inf"}') == \
+        sample(lines, 'http_request_duration_seconds_count' + route + '}')
+    assert '# TYPE http_request_duration_seconds histogram' in lines
+    assert '# TYPE http_request_errors_total counter' in lines
+    for gauge in ('db_pool_size', 'db_pool_checked_out', 'db_pool_overflow',
+                  'db_pool_checkout_wait_seconds_count', 'threadpool_active',
+                  'threadpool_queued', 'threadpool_saturation'):
+        assert sample(lines, gauge) >= 0
+
+
+# What another worker wrote, summed with this worker's own counts.
+def test_get_metrics_across_workers(tmp_path, client):
+    route = 'http_requests_total{method="GET",route="/",status="200"}'
+    before = sample(metric_lines(client), route)
+    (tmp_path / '1.json').write_text(json.dumps({
+        'pid': 1, 'requests': [['GET', '/', 200, 5]], 'errors': [], 'latency': [],
+        'checkout': {'count': 0, 'total': 0.0, 'max': 0.0},
+        'pool': {'size': 0, 'checked_out': 0, 'overflow': 0},
+        'threadpool': {'max_workers': 0, 'active': 0, 'queued': 0}}))
+
+    with patch.object(metrics_store, 'directory', str(tmp_path)):
+        lines = metric_lines(client)
+
+    assert sample(lines, route) == before + 5
+
+
+@patch("controllers.monitoring.entity_cache.as_json")
+def test_get_metrics_errors(mock_as_json, client):
+    mock_as_json.side_effect = RuntimeError()
+    errors = 'http_request_errors_total{method="GET",route="/monitoring/cache"}'
+    before = [line for line in metric_lines(client) if line.startswith(errors)]
+
+    try:
+        client.get('/monitoring/cache')
+    except RuntimeError:
+        pass
+
+    assert sample(metric_lines(client), errors) == (sample(before, errors) if before else 0) + 1
+
+
+def test_use_threadpool():
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        use_threadpool()
+        completed = threadpool.as_json()['completed']
+        assert loop.run_until_complete(loop.run_in_executor(None, lambda: 1)) == 1
+        assert threadpool.as_json()['completed'] == completed + 1
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+@patch('controllers.monitoring.database_available', return_value=True)
+@patch('controllers.monitoring.lifecycle.as_json')
+def test_get_health(mock_as_json, mock_database_available, client):
+    mock_as_json.return_value = {'status': 'ready', 'startup_seconds': 1.5}
+
+    response = client.get('/health')
+
+    assert response.json() == {'status': 'ready', 'startup_seconds': 1.5, 'database': 'ok'}
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('status,available,database', [
+    ('starting', True, 'ok'), ('stopping', True, 'ok'), ('ready', False, 'unavailable')])
+@patch('controllers.monitoring.database_available')
+@patch('controllers.monitoring.lifecycle.as_json')
+def test_get_health_not_ready(mock_as_json, mock_database_available, status, available,
+                              database, client):
+    mock_as_json.return_value = {'status': status}
+    mock_database_available.return_value = available
+
+    response = client.get('/health')
+
+    assert response.json() == {'status': status, 'database': database}
+    assert response.status_code == 503
+
@@ -0,0 +1,234 @@
+import asyncio
+import json
+from datetime import datetime
+from typing import List
+from unittest.mock import AsyncMock, MagicMock, patch
+from uuid import UUID
+
+import pytest
+
+from controllers.responses import (NDJSONResponse, async_conditional_get,
+                                   batch_response, compile_encoder,
+                                   conditional_get, conditional_page,
+                                   etag_matches, ndjson_response, render,
+                                   wants_ndjson)
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from models.address import Address
+from models.etag import make_etag
+from models.pydanticmodels import (AddressOut, AuditOut, CustomerBatchOut,
+                                   CustomerOut)
+from pydantic import parse_obj_as
+
+ITEM_ID = UUID("47dd46aa-2668-4fe6-a8db-e6a47dd63cde")
+
+
+@pytest.fixture
+def pydantic_mode():
+    with patch('controllers.responses.serialization_mode', 'pydantic'):
+        yield
+
+
+def validated(model, content):
+    return JSONResponse(jsonable_encoder(parse_obj_as(model, content))).body
+
+
+def customer(**values):
+    return {'id': ITEM_ID, 'first_name': 'Zoë 名前 "quoted" \\ \n\x1f\u2028', 'middle_name': None,
+            'last_name': 'last name', 'age': 30, 'married': True, 'height': 170, 'weight': 0.1 + 0.2,
+            'last_updated': datetime(2021, 1, 1), 'created_at': datetime(2021, 1, 1),
+            'addresses': [{'id': ITEM_ID, 'customer_id': ITEM_ID, 'street': None,
+                           'city': 'city', 'country': 'country',
+                           'last_updated': datetime(2021, 1, 1)}],
+            **values}
+
+
+def test_wants_ndjson():
+    assert wants_ndjson(True, None)
+    assert wants_ndjson(False, 'application/x-ndjson, application/json')
+    assert not wants_ndjson(False, 'application/json')
+    assert not wants_ndjson(False, None)
+
+
+def test_ndjson_response(mock_address_request_data):
+    sent = []
+
+    async def receive():
+        await asyncio.sleep(1)
+
+    async def send(message):
+        sent.append(message)
+
+    response = ndjson_response(AddressOut, [mock_address_request_data])
+    asyncio.run(response(None, receive, send))
+
+    assert sent[0]['headers'] == [(b'content-type', b'application/x-ndjson')]
+    assert AddressOut.parse_raw(sent[1]['body']) == AddressOut(**mock_address_request_data)
+    assert sent[2] == {'type': 'http.response.body', 'body': b'', 'more_body': False}
+
+
+def test_ndjson_response_client_disconnect():
+    sent = []
+    background = AsyncMock()
+
+    async def rows():
+        while True:
+            yield '{}\n'
+            await asyncio.sleep(0)
+
+    async def receive():
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    response = NDJSONResponse(rows(), background=background)
+    asyncio.run(response(None, receive, send))
+
+    assert not any(m.get('more_body') is False for m in sent)
+    background.assert_awaited()
+
+
+def test_etag_matches():
+    assert etag_matches('W/"a"', 'W/"a"')
+    assert etag_matches('"b", "a"', 'W/"a"')
+    assert etag_matches('*', 'W/"a"')
+    assert not etag_matches('W/"b"', 'W/"a"')
+
+
+@pytest.mark.usefixtures('pydantic_mode')
+def test_conditional_get_not_modified():
+    model = MagicMock()
+    model.etag.return_value = 'W/"a"'
+
+    result = conditional_get(model, AddressOut, 1, 'W/"a"', Response())
+
+    model.get.assert_not_called()
+    assert result.status_code == 304
+    assert result.headers['ETag'] == 'W/"a"'
+
+
+@pytest.mark.usefixtures('pydantic_mode')
+def test_conditional_get_modified(mock_address_request_data):
+    model = MagicMock(versions=Address.versions)
+    model.etag.return_value = 'W/"b"'
+    model.get.return_value = mock_address_request_data
+    response = Response()
+
+    result = conditional_get(model, AddressOut, 1, 'W/"a"', response)
+
+    assert result == mock_address_request_data
+    assert response.headers['ETag'] == make_etag(Address.versions(mock_address_request_data))
+
+
+@pytest.mark.usefixtures('pydantic_mode')
+def test_conditional_get_without_if_none_match(mock_address_request_data):
+    model = MagicMock(versions=Address.versions)
+    model.get.return_value = mock_address_request_data
+
+    conditional_get(model, AddressOut, 1, None, Response())
+
+    model.etag.assert_not_called()
+
+
+@pytest.mark.usefixtures('pydantic_mode')
+def test_async_conditional_get(mock_address_request_data):
+    model = MagicMock(versions=Address.versions)
+    model.etag = AsyncMock(return_value='W/"a"')
+    model.get = AsyncMock(return_value=mock_address_request_data)
+    response = Response()
+
+    assert asyncio.run(async_conditional_get(model, AddressOut, 1, 'W/"a"', response)).status_code == 304
+    assert asyncio.run(async_conditional_get(model, AddressOut, 1, 'W/"b"', response)) == \
+        mock_address_request_data
+    assert asyncio.run(async_conditional_get(model, AddressOut, 1, None, response)) == \
+        mock_address_request_data
+    assert model.etag.await_count == 2
+
+
+@pytest.mark.usefixtures('pydantic_mode')
+def test_conditional_page(mock_address_request_data):
+    response = Response()
+
+    items = conditional_page(Address, AddressOut, [mock_address_request_data], 'next', None, response)
+    not_modified = conditional_page(Address, AddressOut, [mock_address_request_data], 'next',
+                                    response.headers['ETag'], Response())
+    other_page = conditional_page(Address, AddressOut, [mock_address_request_data], None,
+                                  response.headers['ETag'], Response())
+
+    assert items == [mock_address_request_data]
+    assert response.headers['X-Next-Cursor'] == 'next'
+    assert not_modified.status_code == 304
+    assert not_modified.headers['X-Next-Cursor'] == 'next'
+    assert other_page == [mock_address_request_data]
+
+
+@pytest.mark.parametrize('content', [
+    customer(),
+    customer(addresses=[], middle_name='middle'),
+    customer(addresses=None, height=1e15, weight=0.0001),
+    [customer(), customer(id=UUID(int=0))],
+    []])
+def test_render_matches_validated_response(content):
+    model = List[CustomerOut] if isinstance(content, list) else CustomerOut
+
+    rendered = render(CustomerOut, content, Response(headers={'ETag': 'W/"a"'}))
+
+    assert rendered.body == validated(model, content)
+    assert rendered.headers['ETag'] == 'W/"a"'
+    assert rendered.headers['content-type'] == 'application/json'
+
+
+def test_render_enums_and_datetimes():
+    content = {'id': ITEM_ID, 'table': 'customer', 'item_id': ITEM_ID,
+               'operation': 'DELETE', 'time': datetime(2021, 1, 2, 3, 4, 5, 6)}
+
+    assert render(AuditOut, content, Response()).body == validated(AuditOut, content)
+
+
+def test_render_objects():
+    content = Address(id=ITEM_ID, customer_id=ITEM_ID, city='city', country='country')
+
+    assert compile_encoder(AddressOut)(content) == {
+        'id': str(ITEM_ID), 'customer_id': str(ITEM_ID), 'street': None,
+        'city': 'city', 'country': 'country'}
+
+
+def test_render_mappings():
+    content = {'items': {ITEM_ID: customer(), UUID(int=0): customer(id=UUID(int=0))},
+               'not_found': [UUID(int=1)]}
+
+    assert render(CustomerBatchOut, content, Response()).body == \
+        validated(CustomerBatchOut, content)
+
+
+def test_batch_response():
+    found = {UUID(int=2): customer(id=UUID(int=2)), ITEM_ID: customer()}
+    ids = [ITEM_ID, UUID(int=1), UUID(int=2)]
+
+    rendered = json.loads(batch_response(CustomerBatchOut, ids, found, Response()).body)
+
+    assert list(rendered['items']) == [str(ITEM_ID), str(UUID(int=2))]
+    assert rendered['not_found'] == [str(UUID(int=1))]
+
+
+@pytest.mark.parametrize('value', [1e16, 1.5e-05, float('nan'), float('inf')])
+def test_render_falls_back_on_floats_json_writes_differently(value):
+    content = customer(height=value)
+
+    assert render(CustomerOut, content, Response()) is content
+
+
+@pytest.mark.parametrize('values', [dict(age='thirty'), dict(addresses=[{'street': object()}])])
+def test_render_falls_back_on_unencodable_values(values):
+    content = customer(**values)
+
+    assert render(CustomerOut, content, Response()) is content
+
+
+@pytest.mark.usefixtures('pydantic_mode')
+def test_render_pydantic_mode():
+    content = customer()
+
+    assert render(CustomerOut, content, Response()) is content
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+import pytest
+from models.stats import customer_stats, stats_refresh, views
+
+
+@pytest.fixture
+def stats(db_engine, db_session):
+    views.create_all(db_engine)
+    rows = [
+        dict(rolled_up=0b1111, customers=3, avg_age=30.0, avg_height=170.0, avg_weight=80.0),
+        dict(rolled_up=0b0011, country="Atadom", city="Fairpool", customers=2, avg_age=25.0,
+             avg_height=160.0, avg_weight=70.0)]
+    db_engine.execute(customer_stats.insert(),
+                      [{**dict.fromkeys(customer_stats.c.keys()), **row} for row in rows])
+    return db_engine
+
+
+def test_get_customer_stats(stats, client):
+    stats.execute(stats_refresh.insert().values(view='customer_stats',
+                                                refreshed_at=datetime.now() - timedelta(minutes=1)))
+
+    response = client.get('/stats/customers')
+
+    assert response.status_code == 200
+    assert 60 <= response.json()['age_seconds'] < 70
+    assert response.json()['groups'] == [
+        dict(customers=3, avg_age=30.0, avg_height=170.0, avg_weight=80.0)]
+
+
+def test_get_customer_stats_group_by(stats, client):
+    response = client.get('/stats/customers?group_by=city,country')
+
+    assert response.json() == {
+        'refreshed_at': None,
+        'age_seconds': None,
+        'groups': [dict(country="Atadom", city="Fairpool", customers=2, avg_age=25.0,
+                        avg_height=160.0, avg_weight=70.0)]}
+
+
+@pytest.mark.parametrize('group_by', ['planet', 'country,', 'country;city'])
+def test_get_customer_stats_invalid_group_by(group_by, client):
+    response = client.get(f'/stats/customers?group_by={group_by}')
+
+    assert response.status_code == 422
@@ -0,0 +1,40 @@
+from datetime import datetime
+from unittest.mock import patch
+from uuid import UUID
+
+from models.audit_entry import AuditEntry
+from sqlalchemy.dialects import postgresql
+
+ITEM_ID = UUID("47dd46aa-2668-4fe6-a8db-e6a47dd63cde")
+
+
+def render(clause):
+    return str(clause.compile(dialect=postgresql.dialect()))
+
+
+@patch('models.audit_entry.AuditEntry.get_page')
+def test_history(mock_get_page):
+    mock_get_page.return_value = ([], None)
+
+    result = AuditEntry().history(10, 'cursor', '-time', since=datetime(2021, 1, 1),
+                                  until=datetime(2021, 2, 1), item_id=ITEM_ID)
+
+    (limit, cursor, order_by, where), criteria = mock_get_page.call_args
+    assert (limit, cursor, order_by) == (10, 'cursor', '-time')
+    assert [render(w) for w in where] == ['audit.time >= %(time_1)s', 'audit.time < %(time_1)s']
+    assert criteria == dict(item_id=ITEM_ID)
+    assert result == ([], None)
+
+
+@patch('models.audit_entry.AuditEntry.get_page')
+def test_history_without_range(mock_get_page):
+    AuditEntry().history(10)
+
+    mock_get_page.assert_called_with(10, None, 'time', [])
+
+
+def test_as_json():
+    entry = dict(id=ITEM_ID, table='customer', item_id=ITEM_ID,
+                 operation='INSERT', time=datetime(2021, 1, 1))
+
+    assert AuditEntry(**entry).as_json() == entry
@@ -0,0 +1,215 @@
+import asyncio
+import threading
+from unittest.mock import MagicMock, patch
+from uuid import UUID
+
+import models
+import pytest
+from models.address import Address
+from models.audit import (AuditWriter, audit, audit_event, audit_writer,
+                          record, statement_events)
+from models.customer import Customer
+
+ITEM_ID = UUID("47dd46aa-2668-4fe6-a8db-e6a47dd63cde")
+OTHER_ID = UUID("77e2c1f3-68f8-483b-bc30-fef0b1fe0d2a")
+
+
+def summary(events):
+    return [(e['table'], e['item_id'], e['operation']) for e in events]
+
+
+@pytest.fixture
+def audited_session(db_engine):
+    bind = models.Session.kw['bind']
+    models.Session.configure(bind=db_engine)
+    with patch.object(audit_writer, 'submit') as mock_submit:
+        yield models.Session(), mock_submit
+    models.Session.configure(bind=bind)
+
+
+def test_audit_event():
+    event = audit_event('customer', ITEM_ID, 'INSERT')
+
+    assert summary([event]) == [('customer', ITEM_ID, 'INSERT')]
+    assert isinstance(event['id'], UUID)
+    assert event['time'] is not None
+
+
+def test_writer_writes_inline_when_not_started():
+    engine = MagicMock()
+    writer = AuditWriter(engine, audit)
+
+    writer.submit([])
+    engine.execute.assert_not_called()
+
+    writer.submit([audit_event('customer', ITEM_ID, 'INSERT')])
+    engine.execute.assert_called_once()
+
+
+def test_writer_batches_in_background():
+    engine = MagicMock()
+    writer = AuditWriter(engine, audit, batch_size=2, flush_interval=0.01)
+    events = [audit_event('customer', ITEM_ID, 'UPDATE') for _ in range(5)]
+
+    writer.start()
+    writer.start()
+    assert writer.running
+    writer.submit(events)
+    writer.stop()
+    writer.stop()
+
+    assert not writer.running
+    written = [c[0][0].parameters for c in engine.execute.call_args_list]
+    assert sum(len(p) for p in written) == 5
+    assert all(len(p) <= 2 for p in written)
+
+
+def test_writer_take_timeout():
+    writer = AuditWriter(MagicMock(), audit, flush_interval=0.01)
+
+    assert writer.take(10) == []
+
+
+def test_writer_drops_when_queue_full(caplog):
+    writer = AuditWriter(MagicMock(), audit, max_queue=1)
+    writer.thread = MagicMock()
+
+    writer.submit([audit_event('customer', ITEM_ID, 'INSERT')] * 3)
+
+    assert writer.queue.qsize() == 1
+    assert writer.dropped == 2
+    assert 'Audit queue full, dropped 2 events' in caplog.text
+
+
+def test_writer_submit_async_queues_when_started():
+    engine = MagicMock()
+    writer = AuditWriter(engine, audit)
+    writer.thread = MagicMock()
+
+    asyncio.run(writer.submit_async([audit_event('customer', ITEM_ID, 'INSERT')]))
+
+    assert writer.queue.qsize() == 1
+    engine.execute.assert_not_called()
+
+
+def test_writer_submit_async_writes_in_executor_when_not_started():
+    engine = MagicMock()
+    writer = AuditWriter(engine, audit)
+    threads = []
+
+    async def submit():
+        threads.append(threading.get_ident())
+        await writer.submit_async([audit_event('customer', ITEM_ID, 'INSERT')])
+
+    engine.execute.side_effect = lambda statement: threads.append(threading.get_ident())
+    asyncio.run(submit())
+
+    assert len(threads) == 2 and threads[0] != threads[1]
+
+
+def test_writer_logs_failed_writes(caplog):
+    engine = MagicMock()
+    engine.execute.side_effect = Exception()
+
+    AuditWriter(engine, audit).write([audit_event('customer', ITEM_ID, 'INSERT')])
+
+    assert 'Failed to write 1 audit events' in caplog.text
+
+
+@pytest.mark.parametrize('mode, pending, executed', [
+    ('async', 1, False), ('transaction', 0, True), ('off', 0, False)])
+def test_record(mode, pending, executed):
+    session = MagicMock()
+    session.info = {}
+
+    with patch('models.audit.audit_mode', mode):
+        record(session, [audit_event('customer', ITEM_ID, 'INSERT')])
+        record(session, [])
+
+    assert len(session.info.get('audit', [])) == pending
+    assert session.connection.return_value.execute.called == executed
+
+
+def test_orm_writes_are_audited_after_commit(audited_session):
+    session, mock_submit = audited_session
+
+    customer = Customer(id=ITEM_ID, first_name="first name", last_name="last name",
+                        addresses=[Address(id=OTHER_ID, city="city", country="country")])
+    session.add(customer)
+    session.flush()
+    mock_submit.assert_not_called()
+    session.commit()
+    assert sorted(summary(mock_submit.call_args[0][0])) == [
+        ('address', OTHER_ID, 'INSERT'), ('customer', ITEM_ID, 'INSERT')]
+
+    customer.first_name = "new name"
+    customer.addresses[0].city = customer.addresses[0].city
+    session.commit()
+    assert summary(mock_submit.call_args[0][0]) == [('customer', ITEM_ID, 'UPDATE')]
+
+    # The addresses are left to the database's ON DELETE CASCADE.
+    session.delete(customer)
+    session.commit()
+    assert summary(mock_submit.call_args[0][0]) == [('customer', ITEM_ID, 'DELETE')]
+
+
+def test_rolled_back_writes_are_not_audited(audited_session):
+    session, mock_submit = audited_session
+
+    session.add(Customer(id=ITEM_ID, first_name="first name", last_name="last name"))
+    session.flush()
+    session.rollback()
+    session.commit()
+
+    mock_submit.assert_called_once_with([])
+
+
+def test_orm_writes_audited_in_transaction(audited_session, db_engine):
+    session, mock_submit = audited_session
+
+    with patch('models.audit.audit_mode', 'transaction'):
+        session.add(Customer(id=ITEM_ID, first_name="first name", last_name="last name"))
+        session.commit()
+
+    rows = db_engine.execute(audit.select()).fetchall()
+    assert [(r.table, UUID(r.item_id) if isinstance(r.item_id, str) else r.item_id,
+             r.operation) for r in rows] == [('customer', ITEM_ID, 'INSERT')]
+    mock_submit.assert_called_once_with([])
+
+
+def execute(db_engine, statement):
+    return db_engine.execute(statement).context
+
+
+def test_statement_events_insert(db_engine):
+    table = Customer.__table__
+    context = execute(db_engine, table.insert().values(
+        id=ITEM_ID, first_name="first name", last_name="last name"))
+
+    assert summary(statement_events(context)) == [('customer', ITEM_ID, 'INSERT')]
+
+
+def test_statement_events_update(db_engine):
+    table = Customer.__table__
+
+    by_where = execute(db_engine, table.update().where(table.c.id == ITEM_ID).values(age=3))
+    by_values = execute(db_engine, table.update().where(table.c.id == ITEM_ID).
+                        values(id=ITEM_ID, age=3))
+
+    assert summary(statement_events(by_where)) == [('customer', ITEM_ID, 'UPDATE')]
+    assert summary(statement_events(by_values)) == [('customer', ITEM_ID, 'UPDATE')]
+
+
+def test_statement_events_delete(db_engine):
+    table = Address.__table__
+
+    context = execute(db_engine, table.delete().where(table.c.id.in_([ITEM_ID, OTHER_ID])))
+
+    assert summary(statement_events(context)) == [
+        ('address', ITEM_ID, 'DELETE'), ('address', OTHER_ID, 'DELETE')]
+
+
+def test_statement_events_skip_audit_table(db_engine):
+    context = execute(db_engine, audit.insert().values(audit_event('customer', ITEM_ID, 'INSERT')))
+
+    assert statement_events(context) == []
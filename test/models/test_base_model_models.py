@@ -1,35 +1,54 @@
 import pytest
 from unittest.mock import patch
-from models.base_model import BaseModel
+from uuid import UUID
+from models.address import Address
+from models.base_model import BaseModel, TooManyRowsError
+from models.customer import Customer
+from models.etag import make_etag
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import NoResultFound
 
+@patch('models.base_model.Keyset')
 @patch('models.base_model.BaseModel.as_json')
 @patch('models.base_model.Session')
-def test_get_all(MockSession, mock_as_json, mock_address_request_data):
+def test_get_page(MockSession, mock_as_json, MockKeyset, mock_address_request_data):
     query_call = MockSession.return_value.query
-    filter_call = query_call.return_value.filter_by
+    filter_by_call = query_call.return_value.filter_by
+    filter_call = filter_by_call.return_value.filter
+    order_by_call = filter_call.return_value.order_by
+    limit_call = order_by_call.return_value.limit
 
-    filter_call.return_value.all.return_value = [BaseModel()]
+    objs = [BaseModel(), BaseModel(), BaseModel()]
+    limit_call.return_value.all.return_value = objs
     mock_as_json.return_value = mock_address_request_data
+    keyset = MockKeyset.return_value
+    keyset.next_cursor.return_value = 'next'
 
-    result = BaseModel().get_all(**mock_address_request_data)
+    result = BaseModel().get_page(2, cursor='current', order_by='-id', city='city')
 
+    MockKeyset.assert_called_with(BaseModel, '-id', 'current')
     query_call.assert_called_with(BaseModel)
-    filter_call.assert_called_with(**mock_address_request_data)
-    assert result == [mock_address_request_data]
-    
+    filter_by_call.assert_called_with(city='city')
+    filter_call.assert_called_with(*keyset.where)
+    order_by_call.assert_called_with(*keyset.order_by)
+    limit_call.assert_called_with(3)
+    keyset.next_cursor.assert_called_with(objs, 2)
+    assert result == ([mock_address_request_data] * 2, 'next')
 
-@patch('models.base_model.BaseModel.as_json')
+
+@patch('models.address.Address.as_json')
 @patch('models.base_model.Session')
 def test_get(MockSession, mock_as_json, mock_address_request_data):
     query_call = MockSession.return_value.query
     filter_call = query_call.return_value.filter_by
 
-    filter_call.return_value.one.return_value = BaseModel()
+    filter_call.return_value.one.return_value = Address()
     mock_as_json.return_value = mock_address_request_data
 
-    result = BaseModel().get(123)
+    result = Address().get(123)
 
-    query_call.assert_called_with(BaseModel)
+    query_call.assert_called_with(Address)
     filter_call.assert_called_with(id=123)
     assert result == mock_address_request_data
 
@@ -49,45 +68,336 @@ def test_insert(MockSession, mock_as_json, mock_address_request_data):
     assert result == mock_address_request_data
 
 
-@patch('models.base_model.BaseModel.as_json')
+@patch('models.base_model.record')
 @patch('models.base_model.Session')
-def test_update(MockSession, mock_as_json, mock_address_request_data):
-    query_call = MockSession.return_value.query
-    filter_call = query_call.return_value.filter_by
-    commit_call = MockSession.return_value.commit
+def test_update(MockSession, mock_record, mock_address_request_data):
+    session = MockSession.return_value
+    [row] = address_rows(mock_address_request_data, 1)
+    session.execute.return_value.first.return_value = row
 
-    filter_call.return_value.one.return_value = BaseModel()
-    mock_as_json.return_value = mock_address_request_data
+    result = Address().update(UUID(int=0), city='new city')
 
-    result = BaseModel().update(id=123, name="test")
+    statement = str(session.execute.call_args[0][0].compile(dialect=postgresql.dialect()))
+    assert statement.startswith('UPDATE address SET city=%(city)s, last_updated=%(last_updated)s '
+                                'WHERE address.id = %(id_1)s AND address.city IS DISTINCT FROM %(city_1)s '
+                                'RETURNING address.id, address.customer_id, address.street')
+    session.query.assert_not_called()
+    session.commit.assert_called_once()
+    assert result == row
+    [events] = mock_record.call_args[0][1:]
+    assert [(e['item_id'], e['operation']) for e in events] == [(UUID(int=0), 'UPDATE')]
 
-    query_call.assert_called_with(BaseModel)
-    filter_call.assert_called_with(id=123)
-    commit_call.assert_called()
+
+@pytest.mark.parametrize('attr', [{}, {'city': 'same city'}])
+@patch('models.base_model.BaseModel.get')
+@patch('models.base_model.record')
+@patch('models.base_model.Session')
+def test_update_without_changes(MockSession, mock_record, mock_get, attr, mock_address_request_data):
+    session = MockSession.return_value
+    session.execute.return_value.first.return_value = None
+    mock_get.return_value = mock_address_request_data
+
+    result = Address().update(UUID(int=0), **attr)
+
+    mock_get.assert_called_with(UUID(int=0))
+    mock_record.assert_not_called()
+    session.commit.assert_not_called()
     assert result == mock_address_request_data
 
 
-@patch('models.base_model.BaseModel.as_json')
+@patch('models.base_model.BaseModel.get')
 @patch('models.base_model.Session')
-def test_delete(MockSession, mock_as_json, mock_address_request_data):
-    query_call = MockSession.return_value.query
-    filter_call = query_call.return_value.filter_by
-    commit_call = MockSession.return_value.commit
-    delete_call = MockSession.return_value.delete
+def test_update_non_existent(MockSession, mock_get):
+    MockSession.return_value.execute.return_value.first.return_value = None
+    mock_get.side_effect = NoResultFound()
 
-    model = BaseModel()
+    with pytest.raises(NoResultFound):
+        Address().update(UUID(int=0), city='city name')
+    MockSession.return_value.commit.assert_not_called()
 
-    filter_call.return_value.one.return_value = model
-    mock_as_json.return_value = mock_address_request_data
 
-    result = BaseModel().delete(id=123)
+def test_update_on_postgres(pg_session, pg_customers, pg_audited):
+    [customer_id] = pg_customers(1, addresses=1)
+    address = pg_session.query(Address).filter_by(customer_id=customer_id).one().as_json()
+    pg_session.rollback()
+    model = Address(pg_session)
+
+    assert model.update(address['id'], city=address['city']) == address
+    assert pg_audited(address['id']) == []
+
+    result = model.update(address['id'], city='new city')
+    assert result['city'] == 'new city'
+    assert result['last_updated'] > address['last_updated']
+    assert pg_audited(address['id']) == ['UPDATE']
+
+    with pytest.raises(NoResultFound):
+        model.update(UUID(int=0), city='new city')
+    assert pg_session.query(Address).filter_by(id=address['id']).one().as_json() == result
+
+
+@patch('models.base_model.record')
+@patch('models.base_model.Session')
+def test_delete(MockSession, mock_record, mock_address_request_data):
+    session = MockSession.return_value
+    [row] = address_rows(mock_address_request_data, 1)
+    session.execute.return_value.first.return_value = row
+
+    result = Address().delete(UUID(int=0))
+
+    statement = str(session.execute.call_args[0][0].compile(dialect=postgresql.dialect()))
+    assert statement.startswith('DELETE FROM address WHERE address.id = %(id_1)s '
+                                'RETURNING address.id, address.customer_id, address.street')
+    session.query.assert_not_called()
+    session.commit.assert_called_once()
+    assert result == row
+    [events] = mock_record.call_args[0][1:]
+    assert [(e['item_id'], e['operation']) for e in events] == [(UUID(int=0), 'DELETE')]
+
+
+@patch('models.base_model.Session')
+def test_delete_non_existent(MockSession):
+    MockSession.return_value.execute.return_value.first.return_value = None
+
+    with pytest.raises(NoResultFound):
+        Address().delete(UUID(int=0))
+    MockSession.return_value.commit.assert_not_called()
 
-    query_call.assert_called_with(BaseModel)
-    filter_call.assert_called_with(id=123)
-    delete_call.assert_called_with(model)
-    commit_call.assert_called()
-    assert result == mock_address_request_data
 
 def test_as_json():
     with pytest.raises(Exception):
-        BaseModel().as_json()
\ No newline at end of file
+        BaseModel().as_json()
+
+@patch('models.base_model.Session')
+def test_session(MockSession):
+    assert BaseModel().session is MockSession.return_value
+    MockSession.reset_mock()
+
+    session = object()
+    assert BaseModel(session).session is session
+    MockSession.assert_not_called()
+
+
+@patch('models.base_model.Session')
+def test_bulk_upsert(MockSession, mock_address_request_data):
+    execute_call = MockSession.return_value.execute
+    commit_call = MockSession.return_value.commit
+    execute_call.return_value = []
+    row = mock_address_request_data.copy()
+    del row['id']
+
+    ids, errors = Address().bulk_upsert(
+        [row, {**row, 'id': UUID(mock_address_request_data['id'])}, row], chunk_size=2)
+
+    assert execute_call.call_count == 2
+    assert commit_call.call_count == 2
+    statement = str(execute_call.call_args_list[0][0][0].compile(
+        dialect=postgresql.dialect()))
+    assert 'ON CONFLICT (id) DO UPDATE SET' in statement
+    assert 'last_updated = excluded.last_updated' in statement
+    assert 'created_at = excluded' not in statement
+    assert 'RETURNING address.id, xmax = 0 AS inserted' in statement
+    assert len(ids) == 3
+    assert ids[1] == UUID(mock_address_request_data['id'])
+    assert errors == {}
+
+
+@patch('models.base_model.Session')
+def test_bulk_upsert_duplicate_ids(MockSession, mock_address_request_data):
+    execute_call = MockSession.return_value.execute
+    execute_call.return_value = []
+    row = {**mock_address_request_data, 'id': UUID(mock_address_request_data['id'])}
+
+    ids, errors = Address().bulk_upsert([row, row, row], chunk_size=1)
+
+    assert execute_call.call_count == 1
+    assert ids == [row['id']]
+    assert errors == {1: f"Duplicate id: {row['id']}", 2: f"Duplicate id: {row['id']}"}
+
+
+@patch('models.base_model.Session')
+def test_bulk_upsert_isolates_failing_rows(MockSession, mock_address_request_data):
+    session = MockSession.return_value
+    failure = IntegrityError('INSERT', {}, Exception('violates foreign key constraint\n'))
+    session.execute.side_effect = [failure, [], failure]
+    row = mock_address_request_data.copy()
+    del row['id']
+
+    ids, errors = Address().bulk_upsert([row, row])
+
+    session.rollback.assert_called_once()
+    assert session.begin_nested.call_count == 2
+    session.commit.assert_called_once()
+    assert len(ids) == 1
+    assert errors == {1: 'violates foreign key constraint'}
+
+
+# One statement for the batch, or, with the failing row, one per row after
+# the batch is rolled back.
+@pytest.mark.parametrize('failing', [[], [2]])
+def test_bulk_upsert_on_postgres(failing, pg_engine, pg_session, pg_customers, pg_audited):
+    [existing_id] = pg_customers(1, addresses=0)
+    table = Customer.__table__
+    existing = dict(pg_engine.execute(table.select().where(table.c.id == existing_id)).first())
+    row = dict(first_name="first name", last_name="last name", age=30, married=False)
+    rows = [dict(row, id=existing_id, age=40), row, *[dict(row, first_name=None)] * len(failing),
+            row]
+
+    ids, errors = Customer(pg_session).bulk_upsert(rows)
+
+    try:
+        assert ids[0] == existing_id and len(ids) == 3
+        assert list(errors) == failing
+        assert all('not-null constraint' in e for e in errors.values())
+        assert [pg_audited(id) for id in ids] == [['UPDATE'], ['INSERT'], ['INSERT']]
+        stored = {r['id']: r for r in pg_engine.execute(table.select().where(table.c.id.in_(ids)))}
+        assert stored[existing_id]['age'] == 40
+        assert stored[existing_id]['created_at'] == existing['created_at']
+        assert stored[existing_id]['last_updated'] > existing['last_updated']
+        assert len(stored) == 3
+    finally:
+        pg_engine.execute(table.delete().where(table.c.id.in_(ids[1:])))
+
+
+@patch('models.address.Address.as_json')
+@patch('models.base_model.Session')
+def test_stream(MockSession, mock_as_json, mock_address_request_data):
+    query_call = MockSession.return_value.query
+    filter_call = query_call.return_value.filter_by
+    options_call = filter_call.return_value.order_by.return_value.execution_options
+    yield_per_call = options_call.return_value.yield_per
+
+    yield_per_call.return_value = iter([Address(), Address()])
+    mock_as_json.return_value = mock_address_request_data
+
+    result = Address().stream(batch_size=10, city='city')
+
+    filter_call.assert_called_with(city='city')
+    options_call.assert_called_with(stream_results=True)
+    yield_per_call.assert_called_with(10)
+    assert list(result) == [mock_address_request_data] * 2
+
+
+@patch('models.base_model.record')
+@patch('models.base_model.Session')
+def test_upsert_records_audit_events(MockSession, mock_record, mock_address_request_data):
+    inserted = UUID(mock_address_request_data['id'])
+    updated = UUID(mock_address_request_data['customer_id'])
+    MockSession.return_value.execute.return_value = [(inserted, True), (updated, False)]
+
+    Address().upsert([mock_address_request_data])
+
+    [events] = mock_record.call_args[0][1:]
+    assert [(e['table'], e['item_id'], e['operation']) for e in events] == [
+        ('address', inserted, 'INSERT'), ('address', updated, 'UPDATE')]
+
+
+def test_etag(db_session, make_customers):
+    make_customers(1, addresses=1)
+    session = db_session()
+    address = session.query(Address).one()
+
+    etag = Address(session).etag(address.id)
+    Address(session).get(address.id)
+    with patch.object(session, 'query') as mock_query:
+        cached_etag = Address(session).etag(address.id)
+
+    mock_query.assert_not_called()
+    assert etag == cached_etag == make_etag([(address.id, address.last_updated)])
+
+
+def test_get_fields(db_session, make_customers):
+    make_customers(1, addresses=1)
+    session = db_session()
+    address = session.query(Address).one()
+
+    projected = Address(session).get(address.id, fields=('city',))
+    Address(session).get(address.id)
+    with patch.object(session, 'query') as mock_query:
+        cached = Address(session).get(address.id, fields=('city',))
+
+    mock_query.assert_not_called()
+    assert projected == cached == {'id': address.id, 'last_updated': address.last_updated,
+                                   'city': "city name"}
+
+
+def test_get_many(db_session, make_customers):
+    ids = make_customers(2, addresses=1)
+    session = db_session()
+    Address(session).get_many([a.id for a in session.query(Address)])
+    address_ids = [a.id for a in session.query(Address)]
+
+    with patch.object(session, 'query') as mock_query:
+        cached = Address(session).get_many(address_ids)
+
+    mock_query.assert_not_called()
+    assert sorted(a['customer_id'] for a in cached.values()) == sorted(ids)
+    assert Address(session).get_many([UUID(int=0)]) == {}
+
+
+def address_rows(mock_address_request_data, count):
+    return [{'id': UUID(int=i), 'customer_id': UUID(mock_address_request_data['customer_id'])}
+            for i in range(count)]
+
+
+@patch('models.base_model.record')
+@patch('models.base_model.Session')
+def test_update_where(MockSession, mock_record, mock_address_request_data):
+    session = MockSession.return_value
+    session.execute.return_value.fetchall.return_value = address_rows(mock_address_request_data, 2)
+
+    ids = Address().update_where({'city': 'new city'}, 2, city='city name')
+
+    statement = str(session.execute.call_args[0][0].compile(dialect=postgresql.dialect()))
+    assert statement.startswith('UPDATE address SET city=%(city)s, last_updated=%(last_updated)s '
+                                'WHERE address.id IN (SELECT address.id \nFROM address \n'
+                                'WHERE address.city = %(city_1)s \n LIMIT %(param_1)s) '
+                                'RETURNING address.id, address.customer_id')
+    assert session.execute.call_args[0][0].compile().params['param_1'] == 3
+    session.commit.assert_called_once()
+    assert ids == [UUID(int=0), UUID(int=1)]
+    [events] = mock_record.call_args[0][1:]
+    assert [(e['table'], e['item_id'], e['operation']) for e in events] == [
+        ('address', UUID(int=0), 'UPDATE'), ('address', UUID(int=1), 'UPDATE')]
+    assert session.info.setdefault.return_value.update.call_args[0][0] == [
+        'address:00000000-0000-0000-0000-000000000000', f"customer:{mock_address_request_data['customer_id']}",
+        'address:00000000-0000-0000-0000-000000000001', f"customer:{mock_address_request_data['customer_id']}"]
+
+
+@patch('models.base_model.record')
+@patch('models.base_model.Session')
+def test_delete_where_too_many_rows(MockSession, mock_record, mock_address_request_data):
+    session = MockSession.return_value
+    session.execute.return_value.fetchall.return_value = address_rows(mock_address_request_data, 3)
+
+    with pytest.raises(TooManyRowsError, match='More than max_rows=2 rows match'):
+        Address().delete_where(2, country='country name')
+
+    statement = str(session.execute.call_args[0][0].compile(dialect=postgresql.dialect()))
+    assert statement.startswith('DELETE FROM address WHERE address.id IN (SELECT address.id \n'
+                                'FROM address \nWHERE address.country = %(country_1)s \n'
+                                ' LIMIT %(param_1)s) RETURNING address.id')
+    session.rollback.assert_called_once()
+    session.commit.assert_not_called()
+    mock_record.assert_not_called()
+
+
+@pytest.mark.parametrize('change', [
+    lambda model: model.update_where({'city': 'new city'}, 2),
+    lambda model: model.delete_where(2)])
+@patch('models.base_model.Session')
+def test_change_where_without_criteria(MockSession, change):
+    with pytest.raises(TooManyRowsError, match='No filter criteria given'):
+        change(Address())
+
+    MockSession.return_value.execute.assert_not_called()
+
+
+@patch('models.base_model.Session')
+def test_count_where(MockSession):
+    session = MockSession.return_value
+    session.execute.return_value.scalar.return_value = 5
+
+    assert Address().count_where(city='city name', country='country name') == 5
+    assert str(session.execute.call_args[0][0].compile(dialect=postgresql.dialect())) == \
+        'SELECT count(*) AS count_1 \nFROM address \n' \
+        'WHERE address.city = %(city_1)s AND address.country = %(country_1)s'
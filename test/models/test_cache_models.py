@@ -0,0 +1,262 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+from uuid import UUID
+
+import models
+import pytest
+from models.address import Address, AsyncAddress
+from models.cache import (CacheListener, EntityCache, cache_key, cached,
+                          entity_cache, entity_keys, invalidate,
+                          notify_statements)
+from models.customer import AsyncCustomer, Customer
+from sqlalchemy.dialects import postgresql
+
+ITEM_ID = UUID("47dd46aa-2668-4fe6-a8db-e6a47dd63cde")
+OTHER_ID = UUID("77e2c1f3-68f8-483b-bc30-fef0b1fe0d2a")
+
+
+def render(query):
+    return str(query.compile(dialect=postgresql.dialect()))
+
+
+@pytest.fixture
+def cached_session(db_engine):
+    bind = models.Session.kw['bind']
+    models.Session.configure(bind=db_engine)
+    with patch('models.audit.audit_writer'):
+        yield models.Session()
+    models.Session.configure(bind=bind)
+
+
+def test_entity_keys():
+    address = dict(id=OTHER_ID, customer_id=ITEM_ID)
+
+    assert entity_keys(Customer.__table__, Customer(id=ITEM_ID)) == [f'customer:{ITEM_ID}']
+    assert entity_keys(Address.__table__, address) == [
+        f'address:{OTHER_ID}', f'customer:{ITEM_ID}']
+    assert entity_keys(Address.__table__, dict(id=OTHER_ID)) == [f'address:{OTHER_ID}']
+
+
+def test_notify_statements():
+    with patch('models.cache.NOTIFY_BATCH_SIZE', 2):
+        statements = notify_statements(['c', 'a', 'b', 'a'])
+
+    assert [set(s.compile().params.values()) for s in statements] == [
+        {'entity_cache', 'a,b'}, {'entity_cache', 'c'}]
+    assert render(statements[0]).startswith('SELECT pg_notify(')
+
+
+def test_cache_hit_and_miss():
+    cache = EntityCache(max_size=10, ttl=60)
+
+    assert cache.get('customer:1') is None
+    cache.set('customer:1', {'id': 1}, cache.generation)
+
+    assert cache.get('customer:1') == {'id': 1}
+    assert cache.as_json()['hits'] == 1
+    assert cache.as_json()['misses'] == 1
+    assert cache.as_json()['hit_ratio'] == 0.5
+
+
+def test_cached():
+    entity_cache.set('customer:2', 'customer 2', entity_cache.generation)
+
+    assert cached('customer', [1, 2, 3]) == ({2: 'customer 2'}, [1, 3])
+
+
+def test_cache_expires():
+    cache = EntityCache(max_size=10, ttl=-1)
+    cache.set('customer:1', {'id': 1}, cache.generation)
+
+    assert cache.get('customer:1') is None
+    assert cache.as_json()['size'] == 0
+
+
+def test_cache_evicts_least_recently_used():
+    cache = EntityCache(max_size=2, ttl=60)
+    for key in ('a', 'b'):
+        cache.set(key, key, cache.generation)
+    cache.get('a')
+    cache.set('c', 'c', cache.generation)
+
+    assert [cache.get(k) for k in ('a', 'b', 'c')] == ['a', None, 'c']
+    assert cache.as_json()['evictions'] == 1
+
+
+def test_cache_disabled():
+    cache = EntityCache(max_size=0)
+    cache.set('a', 'a', cache.generation)
+
+    assert not cache.enabled
+    assert cache.get('a') is None
+
+
+def test_cache_skips_values_loaded_before_an_invalidation():
+    cache = EntityCache()
+    generation = cache.generation
+    cache.invalidate(['a'])
+    cache.set('a', 'stale', generation)
+
+    assert cache.get('a') is None
+
+
+def test_cache_invalidates_dependents():
+    cache = EntityCache()
+    cache.set('customer:1', 'customer', cache.generation, ['address:1', 'address:2'])
+    cache.set('customer:1', 'customer', cache.generation, ['address:1'])
+
+    cache.invalidate(['address:2'])
+    assert cache.get('customer:1') == 'customer'
+
+    cache.invalidate(['address:1'])
+    assert cache.get('customer:1') is None
+    assert cache.dependents == {}
+    assert cache.as_json()['invalidations'] == 0
+
+    cache.set('customer:1', 'customer', cache.generation)
+    cache.clear()
+    assert cache.get('customer:1') is None
+
+
+def test_get_reads_through(db_session, make_customers):
+    [customer_id] = make_customers(1)
+    session = db_session()
+
+    first = Customer(session).get(customer_id)
+    with patch.object(session, 'query') as mock_query:
+        second = Customer(session).get(customer_id)
+
+    mock_query.assert_not_called()
+    assert second is first
+    assert entity_cache.dependents[cache_key('address', first['addresses'][0]['id'])] == {
+        cache_key('customer', customer_id)}
+
+
+def test_commit_invalidates_entity_and_parent(cached_session):
+    customer = Customer(first_name="first", last_name="last", age=30, height=1, weight=1)
+    cached_session.add(customer)
+    cached_session.commit()
+    Customer(cached_session).get(customer.id)
+
+    cached_session.add(Address(customer_id=customer.id, city="city", country="country"))
+    cached_session.flush()
+    assert cached_session.info['cache']
+    assert entity_cache.get(cache_key('customer', customer.id)) is not None
+
+    cached_session.commit()
+    assert 'cache' not in cached_session.info
+    assert entity_cache.get(cache_key('customer', customer.id)) is None
+
+
+def test_rollback_discards_pending_invalidations(cached_session):
+    cached_session.add(Customer(first_name="first", last_name="last", age=30, height=1, weight=1))
+    cached_session.flush()
+    cached_session.rollback()
+
+    assert 'cache' not in cached_session.info
+
+
+def test_invalidate_notifies_on_postgres():
+    session = MagicMock()
+    session.info = {}
+    session.connection.return_value.dialect.name = 'postgresql'
+
+    invalidate(session, [])
+    session.connection.assert_not_called()
+
+    invalidate(session, ['customer:1'])
+    assert render(session.connection.return_value.execute.call_args[0][0]).startswith(
+        'SELECT pg_notify(')
+    assert session.info['cache'] == {'customer:1'}
+
+
+def test_async_get_reads_through(mock_address_request_data):
+    row = {**mock_address_request_data, 'id': OTHER_ID}
+    db = MagicMock()
+    db.fetch_one = AsyncMock(return_value=row)
+
+    first = asyncio.run(AsyncAddress(db).get(OTHER_ID))
+    second = asyncio.run(AsyncAddress(db).get(OTHER_ID))
+
+    db.fetch_one.assert_called_once()
+    assert first is second
+
+
+@pytest.mark.parametrize('dialect, notified', [('postgresql', True), ('sqlite', False)])
+def test_async_writes_invalidate(dialect, notified, mock_address_request_data):
+    db = MagicMock()
+    db.execute = AsyncMock()
+    db.url.dialect = dialect
+    entity_cache.set(cache_key('customer', ITEM_ID), {}, entity_cache.generation)
+
+    with patch('models.async_base_model.audit_writer'):
+        asyncio.run(AsyncCustomer(db).invalidate([dict(id=OTHER_ID, customer_id=ITEM_ID)],
+                                                 Address.__table__))
+
+    assert entity_cache.get(cache_key('customer', ITEM_ID)) is None
+    assert db.execute.called == notified
+    if notified:
+        assert render(db.execute.call_args[0][0]).startswith('SELECT pg_notify(')
+
+
+def test_listener_applies_notifications():
+    cache = EntityCache()
+    cache.set('customer:1', 'customer', cache.generation)
+    cache.set('customer:2', 'customer', cache.generation)
+    engine = MagicMock()
+    connection = engine.raw_connection.return_value
+    dbapi_connection = connection.connection
+    listener = CacheListener(engine, cache, poll_interval=0.01)
+
+    def notify(*args):
+        cache.set('customer:1', 'customer', cache.generation)
+        dbapi_connection.notifies = [MagicMock(payload='customer:1,address:1')]
+        listener.stopping.set()
+        return [dbapi_connection], [], []
+
+    with patch('models.cache.wait_readable', side_effect=notify):
+        listener.listen()
+
+    connection.detach.assert_called()
+    dbapi_connection.cursor.return_value.execute.assert_called_with('LISTEN entity_cache')
+    connection.close.assert_called()
+    assert cache.get('customer:1') is None
+    assert cache.get('customer:2') is None
+
+
+def test_listener_reconnects():
+    engine = MagicMock()
+    engine.raw_connection.side_effect = Exception()
+    listener = CacheListener(engine, EntityCache(), poll_interval=0.01)
+
+    def wait(timeout):
+        if engine.raw_connection.call_count == 2:
+            listener.stopping.set()
+
+    with patch.object(listener.stopping, 'wait', side_effect=wait):
+        listener.run()
+
+    assert engine.raw_connection.call_count == 2
+
+
+def test_listener_start_and_stop():
+    engine = MagicMock()
+    engine.dialect.name = 'postgresql'
+    engine.raw_connection.side_effect = Exception()
+    listener = CacheListener(engine, EntityCache(), poll_interval=0.01)
+
+    listener.start()
+    listener.start()
+    assert listener.running
+    listener.stop()
+    listener.stop()
+    assert not listener.running
+
+    disabled = CacheListener(engine, EntityCache(max_size=0))
+    disabled.start()
+    assert not disabled.running
+
+    engine.dialect.name = 'sqlite'
+    sqlite = CacheListener(engine, EntityCache())
+    sqlite.start()
+    assert not sqlite.running
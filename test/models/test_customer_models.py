@@ -1,5 +1,18 @@
-from unittest.mock import patch
-from models.customer import Customer
+from unittest.mock import MagicMock, patch
+from uuid import UUID, uuid4
+
+import pytest
+from models.address import Address
+from models.base_model import TooManyRowsError
+from models.customer import Customer, search_clauses
+from models.pagination import decode_cursor
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm.exc import NoResultFound
+
+
+def render(clause):
+    return str(clause.compile(dialect=postgresql.dialect()))
+
 
 @patch('models.engine')
 def test_as_json(mockEngine, mock_customer_request_data):
@@ -10,4 +23,165 @@ def test_as_json(mockEngine, mock_customer_request_data):
     request_data['created_at'] = None
     request_data['last_updated'] = None
     
-    assert customer.as_json() == request_data
\ No newline at end of file
+    assert customer.as_json() == request_data
+
+def test_search_clauses():
+    matches, rank = search_clauses('jo_')
+
+    matches, rank = render(matches), render(rank)
+    assert 'customer.first_name %%> %(first_name_1)s' in matches
+    assert 'address.city ILIKE %(city_2)s' in matches
+    assert 'UNION' in matches
+    assert 'word_similarity(%(word_similarity_1)s, customer.first_name)' in rank
+    assert 'WHERE address.customer_id = customer.id' in rank
+
+
+@pytest.mark.parametrize('q, prefix', [('jo', 'jo%'), ('j_o%', 'j\\_o\\%%'), ('a\\b', 'a\\\\b%')])
+def test_search_prefix_is_escaped(q, prefix):
+    matches, _ = search_clauses(q)
+
+    assert prefix in matches.compile().params.values()
+
+
+def test_search(mock_customer_request_data):
+    session = MagicMock()
+    customers = [Customer(**mock_customer_request_data) for _ in range(3)]
+    query = session.query.return_value.filter.return_value.order_by.return_value.limit
+    query.return_value.all.return_value = [(c, 1.5 - i) for (i, c) in enumerate(customers)]
+
+    items, cursor = Customer(session).search('jo', 2)
+
+    query.assert_called_with(3)
+    assert items == [c.as_json() for c in customers[:2]]
+    assert decode_cursor(cursor, [search_clauses('jo')[1], Customer.__table__.c.id]) == \
+        [0.5, UUID(mock_customer_request_data['id'])]
+
+
+@patch('models.base_model.record')
+@patch('models.customer.record')
+def test_delete_where_audits_addresses(mock_record, mock_base_record):
+    session = MagicMock()
+    session.execute.return_value.fetchall.return_value = [
+        {'id': UUID(int=1), 'address_ids': [UUID(int=2), UUID(int=3)]},
+        {'id': UUID(int=4), 'address_ids': None}]
+
+    ids = Customer(session).delete_where(10, last_name='last name')
+
+    statement = render(session.execute.call_args[0][0])
+    assert statement.startswith('DELETE FROM customer WHERE customer.id IN (SELECT customer.id \n'
+                                'FROM customer \nWHERE customer.last_name = %(last_name_1)s \n'
+                                ' LIMIT %(param_1)s) RETURNING customer.id, (SELECT array_agg(address.id)')
+    assert ids == [UUID(int=1), UUID(int=4)]
+    [customers] = mock_base_record.call_args[0][1:]
+    [addresses] = mock_record.call_args[0][1:]
+    assert [(e['table'], e['item_id']) for e in customers + addresses] == [
+        ('customer', UUID(int=1)), ('customer', UUID(int=4)),
+        ('address', UUID(int=2)), ('address', UUID(int=3))]
+    session.commit.assert_called_once()
+
+
+@patch('models.base_model.record')
+def test_update_embeds_addresses(mock_record, mock_customer_request_data):
+    session = MagicMock()
+    row = {'id': UUID(int=1), 'age': 42}
+    session.execute.return_value.first.return_value = row
+    session.query.return_value.filter.return_value = []
+
+    result = Customer(session).update(UUID(int=1), age=42)
+
+    assert render(session.execute.call_args[0][0]).startswith('UPDATE customer SET age=%(age)s')
+    assert result == {'id': UUID(int=1), 'age': 42, 'addresses': []}
+    session.commit.assert_called_once()
+
+
+@patch('models.base_model.record')
+@patch('models.customer.record')
+def test_delete_returns_addresses(mock_record, mock_base_record, mock_customer_request_data):
+    session = MagicMock()
+    customer_row = dict.fromkeys(Customer.__table__.c.keys(), None)
+    address_row = {f'address_{k}': None for k in Address.__table__.c.keys()}
+    session.execute.return_value.fetchall.return_value = [
+        {**customer_row, 'id': UUID(int=1), **address_row, 'address_id': UUID(int=2)},
+        {**customer_row, 'id': UUID(int=1), **address_row, 'address_id': UUID(int=3)}]
+
+    result = Customer(session).delete(UUID(int=1))
+
+    statement = render(session.execute.call_args[0][0])
+    assert statement.startswith('WITH deleted_customer AS \n(DELETE FROM customer '
+                                'WHERE customer.id = %(id_1)s RETURNING customer.id')
+    assert 'FROM deleted_customer LEFT OUTER JOIN address ' \
+        'ON address.customer_id = deleted_customer.id' in statement
+    assert [a['id'] for a in result['addresses']] == [UUID(int=2), UUID(int=3)]
+    [customers] = mock_base_record.call_args[0][1:]
+    [addresses] = mock_record.call_args[0][1:]
+    assert [(e['table'], e['item_id']) for e in customers + addresses] == [
+        ('customer', UUID(int=1)), ('address', UUID(int=2)), ('address', UUID(int=3))]
+    session.commit.assert_called_once()
+
+
+def test_delete_without_addresses():
+    session = MagicMock()
+    session.execute.return_value.fetchall.return_value = [
+        {**dict.fromkeys(Customer.__table__.c.keys(), None), 'id': UUID(int=1), 'address_id': None}]
+
+    with patch('models.base_model.record'):
+        result = Customer(session).delete(UUID(int=1))
+
+    assert result['addresses'] == []
+
+
+def test_delete_non_existent():
+    session = MagicMock()
+    session.execute.return_value.fetchall.return_value = []
+
+    with pytest.raises(NoResultFound):
+        Customer(session).delete(UUID(int=1))
+    session.commit.assert_not_called()
+
+
+def test_delete_on_postgres(pg_engine, pg_session, pg_customers, pg_audited):
+    [customer_id] = pg_customers(1, addresses=3)
+    address = Address.__table__
+    address_ids = sorted(id for (id,) in pg_engine.execute(
+        address.select().with_only_columns([address.c.id]).
+        where(address.c.customer_id == customer_id)))
+
+    value = Customer(pg_session).delete(customer_id)
+
+    assert value['id'] == customer_id
+    assert sorted(a['id'] for a in value['addresses']) == address_ids
+    assert all(a['customer_id'] == customer_id for a in value['addresses'])
+    assert pg_audited(customer_id) == ['DELETE']
+    assert all(pg_audited(id) == ['DELETE'] for id in address_ids)
+    assert pg_engine.execute(Customer.__table__.select().
+                             where(Customer.__table__.c.id == customer_id)).first() is None
+    assert pg_engine.execute(address.select().where(address.c.id.in_(address_ids))).first() is None
+
+
+def test_change_where_on_postgres(pg_engine, pg_session, pg_customers, pg_audited):
+    last_name = uuid4().hex
+    customer_ids = sorted(pg_customers(3, addresses=2, last_name=last_name))
+    address = Address.__table__
+    address_ids = [id for (id,) in pg_engine.execute(
+        address.select().with_only_columns([address.c.id]).
+        where(address.c.customer_id.in_(customer_ids)))]
+    model = Customer(pg_session)
+
+    with pytest.raises(TooManyRowsError):
+        model.update_where({'age': 40}, 2, last_name=last_name)
+    assert model.count_where(last_name=last_name, age=30) == 3
+    assert all(pg_audited(id) == [] for id in customer_ids)
+
+    assert sorted(model.update_where({'age': 40}, 3, last_name=last_name)) == customer_ids
+    assert model.count_where(last_name=last_name, age=40) == 3
+    assert all(pg_audited(id) == ['UPDATE'] for id in customer_ids)
+
+    with pytest.raises(TooManyRowsError):
+        model.delete_where(2, last_name=last_name)
+    assert model.count_where(last_name=last_name) == 3
+
+    assert sorted(model.delete_where(3, last_name=last_name)) == customer_ids
+    assert model.count_where(last_name=last_name) == 0
+    assert Address(pg_session).count_where(customer_id=customer_ids[0]) == 0
+    assert all(pg_audited(id) == ['UPDATE', 'DELETE'] for id in customer_ids)
+    assert all(pg_audited(id) == ['DELETE'] for id in address_ids)
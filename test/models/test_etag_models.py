@@ -0,0 +1,15 @@
+from datetime import datetime
+from uuid import UUID
+
+from models.etag import make_etag
+
+ITEM_ID = UUID("47dd46aa-2668-4fe6-a8db-e6a47dd63cde")
+
+
+def test_make_etag():
+    etag = make_etag([(ITEM_ID, datetime(2021, 1, 1))])
+
+    assert etag.startswith('W/"') and etag.endswith('"')
+    assert etag == make_etag([(str(ITEM_ID), '2021-01-01 00:00:00')])
+    assert etag != make_etag([(ITEM_ID, datetime(2021, 1, 2))])
+    assert etag != make_etag([(ITEM_ID, datetime(2021, 1, 1)), (ITEM_ID, None)])
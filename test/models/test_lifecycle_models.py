@@ -0,0 +1,39 @@
+from unittest.mock import MagicMock, patch
+
+from models.lifecycle import Lifecycle, database_available, warm_up
+
+
+def test_lifecycle():
+    lifecycle = Lifecycle()
+    assert lifecycle.as_json()['status'] == 'starting'
+    assert lifecycle.as_json()['startup_seconds'] is None
+
+    lifecycle.ready()
+    health = lifecycle.as_json()
+    assert health['status'] == 'ready'
+    assert 0 <= health['startup_seconds'] <= health['uptime_seconds']
+
+    lifecycle.stop()
+    assert lifecycle.as_json()['status'] == 'stopping'
+
+
+@patch('models.lifecycle.configure_mappers')
+def test_warm_up(mock_configure_mappers):
+    engine = MagicMock()
+
+    warm_up(engine, 3)
+
+    mock_configure_mappers.assert_called_once()
+    assert engine.connect.call_count == 3
+    assert engine.connect.return_value.close.call_count == 3
+
+
+def test_database_available(db_engine):
+    assert database_available(db_engine)
+
+
+def test_database_unavailable():
+    engine = MagicMock()
+    engine.connect.side_effect = ConnectionError()
+
+    assert not database_available(engine)
@@ -0,0 +1,152 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from unittest.mock import MagicMock, patch
+
+from models.metrics import (LATENCY_BUCKETS, Histogram, InstrumentedThreadPool,
+                            MetricsStore, ShardedCounter, merge,
+                            observe_request, pool_stats, request_counts,
+                            request_errors, request_latency, worker_snapshot)
+
+
+def test_sharded_counter_across_threads():
+    counter = ShardedCounter()
+
+    def count(_):
+        for _ in range(1000):
+            counter.add('a')
+        counter.add('b', 2)
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(count, range(8)))
+
+    assert counter.values() == {'a': 8000, 'b': 16}
+    assert 1 <= len(counter.shards) <= 4
+
+
+def test_histogram():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        histogram.observe(('GET',), value)
+
+    [(labels, (counts, total))] = histogram.collect().items()
+    assert labels == ('GET',)
+    assert counts == [2, 3, 4]
+    assert total == 5.65
+
+
+def test_observe_request():
+    observe_request('GET', '/test-route', 200, 0.01)
+    observe_request('GET', '/test-route', 503, 0.2)
+
+    assert request_counts.values()[('GET', '/test-route', 200)] >= 1
+    assert request_errors.values()[('GET', '/test-route')] >= 1
+    counts, _ = request_latency.collect()[('GET', '/test-route')]
+    assert len(counts) == len(LATENCY_BUCKETS) + 1
+
+
+def test_instrumented_thread_pool():
+    pool = InstrumentedThreadPool(1)
+    running, release = Event(), Event()
+
+    def block():
+        running.set()
+        release.wait()
+
+    futures = [pool.submit(block), pool.submit(lambda: 1)]
+    running.wait()
+    busy = pool.as_json()
+    release.set()
+    futures[1].result()
+    pool.shutdown()
+
+    assert busy == {'max_workers': 1, 'active': 1, 'queued': 1, 'completed': 0}
+    assert pool.as_json() == {'max_workers': 1, 'active': 0, 'queued': 0, 'completed': 2}
+
+
+def test_pool_stats():
+    pool = MagicMock()
+    pool.size.return_value = 5
+    pool.checkedout.return_value = 3
+    pool.overflow.return_value = -2
+
+    assert pool_stats(pool) == {'size': 5, 'checked_out': 3, 'overflow': 0}
+
+
+def other_worker(pid, requests=1):
+    return {
+        'pid': pid,
+        'requests': [['GET', '/', 200, requests]],
+        'errors': [['GET', '/', 1]],
+        'latency': [['GET', '/', 0, requests], ['GET', '/', 'sum', 0.5]],
+        'checkout': {'count': 2, 'total': 1.0, 'max': 0.75},
+        'pool': {'size': 5, 'checked_out': 1, 'overflow': 0},
+        'threadpool': {'max_workers': 8, 'active': 2, 'queued': 0}
+    }
+
+
+def test_merge():
+    running, exited = os.getppid(), 2 ** 22 + 1
+
+    merged = merge([other_worker(running, 2), other_worker(exited, 3)])
+
+    assert merged['requests'] == {('GET', '/', 200): 5}
+    assert merged['errors'] == {('GET', '/'): 2}
+    assert merged['latency'] == {(('GET', '/'), 0): 5, (('GET', '/'), 'sum'): 1.0}
+    assert merged['checkout'] == {'count': 4, 'total': 2.0, 'max': 0.75}
+    assert merged['pool'] == {'size': 5, 'checked_out': 1, 'overflow': 0}
+    assert merged['threadpool'] == {'max_workers': 8, 'active': 2, 'queued': 0}
+
+
+# Another user's process is still a process.
+@patch('models.metrics.os.kill', side_effect=PermissionError())
+def test_merge_worker_of_other_user(mock_kill):
+    assert merge([other_worker(1)])['pool']['size'] == 5
+
+
+def test_worker_snapshot_round_trip():
+    observe_request('GET', '/snapshot-route', 200, 0.02)
+
+    merged = merge([json.loads(json.dumps(worker_snapshot()))])
+
+    assert merged['requests'][('GET', '/snapshot-route', 200)] >= 1
+    counts, _ = request_latency.collect(merged['latency'])[('GET', '/snapshot-route')]
+    assert counts == request_latency.collect()[('GET', '/snapshot-route')][0]
+
+
+def test_metrics_store(tmp_path):
+    store = MetricsStore(str(tmp_path / 'metrics'), interval=60)
+    store.start()
+    store.start()
+    assert store.running
+    (tmp_path / 'metrics' / '1.json').write_text(json.dumps(other_worker(2 ** 22 + 1, 7)))
+    (tmp_path / 'metrics' / '2.json').write_text('{')
+
+    requests = store.collect()['requests'].get(('GET', '/', 200), 0)
+    store.stop()
+    store.stop()
+
+    assert requests == request_counts.values().get(('GET', '/', 200), 0) + 7
+    assert not store.running
+    written = json.loads((tmp_path / 'metrics' / f'{os.getpid()}.json').read_text())
+    assert written['pid'] == os.getpid()
+    assert set(os.listdir(tmp_path / 'metrics')) == {'1.json', '2.json', f'{os.getpid()}.json'}
+
+
+def test_metrics_store_write_failure(tmp_path):
+    store = MetricsStore(str(tmp_path), interval=60)
+
+    with patch.object(store, 'write', side_effect=OSError()) as mock_write, \
+            patch.object(store.stopping, 'wait', side_effect=lambda timeout: store.stopping.set()):
+        store.run()
+
+    assert mock_write.call_count == 2
+
+
+def test_metrics_store_disabled():
+    store = MetricsStore(None)
+    store.start()
+
+    assert not store.running
+    assert store.collect()['pool'] == worker_snapshot()['pool']
@@ -0,0 +1,103 @@
+import json
+from base64 import urlsafe_b64encode
+from datetime import datetime
+from uuid import UUID
+
+import pytest
+from models.address import Address
+from models.audit_entry import AuditEntry
+from models.customer import Customer
+from models.pagination import (Keyset, PaginationError, RankedKeyset,
+                               decode_cursor, encode_cursor)
+from sqlalchemy import Float, cast, func
+from sqlalchemy.dialects import postgresql
+
+CUSTOMER_ID = UUID("47dd46aa-2668-4fe6-a8db-e6a47dd63cde")
+
+
+def render(clause):
+    return str(clause.compile(dialect=postgresql.dialect()))
+
+
+def test_cursor_round_trip():
+    columns = [Customer.__table__.c.last_name, Customer.__table__.c.id]
+
+    cursor = encode_cursor(['last name', CUSTOMER_ID])
+
+    assert '=' not in cursor
+    assert decode_cursor(cursor, columns) == ['last name', CUSTOMER_ID]
+
+
+def raw_cursor(values):
+    return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+@pytest.mark.parametrize('cursor', ['%%%', encode_cursor(['a']), 'eyJhIjogMX0',
+                                    raw_cursor(['a', 1]), raw_cursor(['a', None]),
+                                    raw_cursor([['a'], {}])])
+def test_decode_invalid_cursor(cursor):
+    with pytest.raises(PaginationError):
+        decode_cursor(cursor, [Customer.__table__.c.last_name,
+                               Customer.__table__.c.id])
+
+
+def test_keyset_first_page():
+    keyset = Keyset(Customer)
+
+    assert keyset.where == []
+    assert [render(c) for c in keyset.order_by] == ['customer.id ASC']
+
+
+def test_keyset_after_cursor():
+    keyset = Keyset(Customer, 'last_name', encode_cursor(['b', CUSTOMER_ID]))
+
+    assert [render(c) for c in keyset.order_by] == [
+        'customer.last_name ASC', 'customer.id ASC']
+    assert render(keyset.where[0]) == \
+        '(customer.last_name, customer.id) > (%(param_1)s, %(param_2)s)'
+
+
+
+def test_cursor_round_trip_datetime():
+    columns = [AuditEntry.__table__.c.time, AuditEntry.__table__.c.id]
+    time = datetime(2021, 1, 2, 3, 4, 5, 678)
+
+    cursor = encode_cursor([time, CUSTOMER_ID])
+
+    assert decode_cursor(cursor, columns) == [time, CUSTOMER_ID]
+
+def test_keyset_descending():
+    keyset = Keyset(Address, '-id', encode_cursor([CUSTOMER_ID]))
+
+    assert [render(c) for c in keyset.order_by] == ['address.id DESC']
+    assert render(keyset.where[0]) == '(address.id) < (%(param_1)s)'
+
+
+def test_keyset_unsortable_column():
+    with pytest.raises(PaginationError):
+        Keyset(Address, 'street')
+
+
+def test_next_cursor():
+    keyset = Keyset(Customer, 'last_name')
+    rows = [Customer(id=CUSTOMER_ID, last_name='a'),
+            dict(id=CUSTOMER_ID, last_name='b'),
+            dict(id=CUSTOMER_ID, last_name='c')]
+
+    assert keyset.next_cursor(rows, 3) is None
+    assert decode_cursor(keyset.next_cursor(rows, 1), keyset.columns) == [
+        'a', CUSTOMER_ID]
+    assert decode_cursor(keyset.next_cursor(rows, 2), keyset.columns) == [
+        'b', CUSTOMER_ID]
+
+
+def test_ranked_keyset():
+    rank = cast(func.similarity('q', Customer.__table__.c.last_name), Float).label('rank')
+
+    keyset = RankedKeyset(rank, Customer.__table__.c.id, encode_cursor([0.5, CUSTOMER_ID]))
+
+    assert keyset.columns[0] is rank
+    assert [render(c)[-5:] for c in keyset.order_by] == [' DESC', ' DESC']
+    assert keyset.where[0].right.clauses[0].value == 0.5
+    assert decode_cursor(keyset.next_cursor([dict(rank=0.25, id=CUSTOMER_ID)] * 2, 1),
+                         keyset.columns) == [0.25, CUSTOMER_ID]
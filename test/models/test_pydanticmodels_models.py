@@ -0,0 +1,37 @@
+import pytest
+from models.pydanticmodels import (AddressBulkIn, BulkItemError, CustomerOut, SparseModel,
+                                   customer_out, parse_items)
+from pydantic import ValidationError
+
+
+def test_parse_items(mock_address_request_data):
+    invalid = mock_address_request_data.copy()
+    del invalid['city']
+
+    parsed, errors = parse_items(AddressBulkIn, [mock_address_request_data, invalid, 'street'])
+
+    assert parsed == [(0, AddressBulkIn(**mock_address_request_data))]
+    assert errors == [
+        BulkItemError(index=1, detail=[{'loc': ('city',), 'msg': 'field required',
+                                        'type': 'value_error.missing'}]),
+        BulkItemError(index=2, detail=[{'loc': ('__root__',),
+                                        'msg': 'AddressBulkIn expected dict not str',
+                                        'type': 'type_error'}])]
+
+
+def test_customer_out():
+    sparse = customer_out(('age',), True)
+
+    assert customer_out() is CustomerOut
+    assert customer_out(('age',), True) is sparse
+    assert issubclass(sparse, SparseModel)
+    assert list(sparse.__fields__) == ['id', 'age', 'addresses']
+    assert list(customer_out(None, False).__fields__) == \
+        [name for name in CustomerOut.__fields__ if name != 'addresses']
+    with pytest.raises(ValidationError):
+        sparse(id="47dd46aa-2668-4fe6-a8db-e6a47dd63cde", age=100)
+
+
+def test_customer_out_unknown_fields():
+    with pytest.raises(ValueError, match="Unknown fields: addresses, street"):
+        customer_out(('age', 'street', 'addresses'), False)
@@ -0,0 +1,96 @@
+import os
+from uuid import uuid4
+
+import pytest
+from models.address import Address
+from models.customer import Customer
+from models.pagination import Keyset, encode_cursor
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+database_url = os.environ.get('TEST_DATABASE_URL')
+
+pytestmark = pytest.mark.skipif(
+    not database_url, reason="TEST_DATABASE_URL is not set to a disposable Postgres database")
+
+CUSTOMER_ID = uuid4()
+CUSTOMER = dict(id=CUSTOMER_ID, first_name="first name", middle_name="middle name",
+                last_name="last name", age=30, married=True, height=170.5, weight=85.8)
+ADDRESS = dict(id=uuid4(), customer_id=CUSTOMER_ID, street="street name",
+               city="city name", country="country name")
+
+
+@pytest.fixture(scope='module')
+def pg_engine(pg_engine):
+    pg_engine.execute(Customer.__table__.insert().values(CUSTOMER))
+    pg_engine.execute(Address.__table__.insert().values(ADDRESS))
+    yield pg_engine
+    pg_engine.execute(Customer.__table__.delete().where(Customer.__table__.c.id == CUSTOMER_ID))
+
+
+# With sequential scans priced out, the planner only picks one when no index
+# can answer the query, however small the table is.
+def plans(engine, run):
+    executed = []
+    session = sessionmaker(bind=engine)()
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        executed.append((statement, parameters))
+
+    try:
+        run(session)
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+        session.close()
+
+    with engine.connect() as connection:
+        connection.execute('SET enable_seqscan = off')
+        return {statement: '\n'.join(r[0] for r in connection.execute(f'EXPLAIN {statement}',
+                                                                      parameters))
+                for (statement, parameters) in executed}
+
+
+MODELS = [(Customer, CUSTOMER), (Address, ADDRESS)]
+
+
+def page_plans(engine, model, **kwargs):
+    return plans(engine, lambda s: model(s).get_page(10, **kwargs))
+
+
+def assert_no_seq_scan(plans):
+    for (statement, plan) in plans.items():
+        assert 'Seq Scan' not in plan, f"{statement}\n{plan}"
+
+
+# The list endpoints' query: a filter, ORDER BY id and LIMIT, plus for
+# customers the selectin load of their addresses.
+@pytest.mark.parametrize('model, values', MODELS)
+def test_get_page_filters_use_indexes(model, values, pg_engine):
+    for (column, value) in values.items():
+        assert_no_seq_scan(page_plans(pg_engine, model, **{column: value}))
+
+
+def test_get_page_loads_addresses_by_index(pg_engine):
+    [(statement, plan)] = [(statement, plan) for (statement, plan)
+                           in page_plans(pg_engine, Customer).items()
+                           if 'address.customer_id IN' in statement]
+
+    assert 'Seq Scan' not in plan, f"{statement}\n{plan}"
+
+
+# Every page, the first and those after a cursor, is read in order off the
+# (column, id) index: no sort, and the row-value seek is an index condition.
+@pytest.mark.parametrize('model, values, order_by', [
+    (model, values, order_by) for (model, values) in MODELS
+    for name in model.__sortable__ for order_by in (name, f'-{name}')])
+def test_get_page_keyset_uses_index(model, values, order_by, pg_engine):
+    cursor = encode_cursor([values[c.key] for c in Keyset(model, order_by).columns])
+
+    for kwargs in (dict(order_by=order_by), dict(order_by=order_by, cursor=cursor)):
+        page = {statement: plan for (statement, plan)
+                in page_plans(pg_engine, model, **kwargs).items() if 'LIMIT' in statement}
+        assert len(page) == 1
+        for (statement, plan) in page.items():
+            assert 'Seq Scan' not in plan, f"{statement}\n{plan}"
+            assert 'Sort' not in plan, f"{statement}\n{plan}"
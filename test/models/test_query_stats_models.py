@@ -0,0 +1,49 @@
+import pytest
+from models.query_stats import QueryStats, current_query_stats, track_queries
+
+
+def test_track_queries(db_engine):
+    with track_queries(record=True) as stats:
+        db_engine.execute('SELECT 1')
+        db_engine.execute('SELECT 2')
+
+    assert stats.count == 2
+    assert stats.executed == ['SELECT 1', 'SELECT 2']
+    assert stats.slowest_statement in stats.executed
+    assert 0 < stats.slowest <= stats.total
+    assert current_query_stats.get() == ()
+
+
+def test_track_queries_nested(db_engine):
+    with track_queries() as outer:
+        db_engine.execute('SELECT 1')
+        with track_queries() as inner:
+            db_engine.execute('SELECT 2')
+
+    assert (outer.count, inner.count) == (2, 1)
+    assert inner.executed is None
+
+
+def test_untracked_queries(db_engine):
+    db_engine.execute('SELECT 1')
+
+    assert 'query_started' not in db_engine.raw_connection().info
+
+
+def test_failed_query_not_counted(db_engine):
+    with track_queries() as stats:
+        with pytest.raises(Exception):
+            db_engine.execute('SELECT * FROM missing')
+        db_engine.execute('SELECT 1')
+
+    assert (stats.count, stats.slowest_statement) == (1, 'SELECT 1')
+
+
+def test_query_stats_output():
+    stats = QueryStats()
+    stats.observe('SELECT 1', 0.002)
+    stats.observe('SELECT 2', 0.0005)
+
+    assert stats.server_timing() == ['db;dur=2.50;desc="2 statements"', 'db-slowest;dur=2.00']
+    assert stats.as_json() == {'db_statements': 2, 'db_ms': 2.5, 'db_slowest_ms': 2.0,
+                               'db_slowest_statement': 'SELECT 1'}
@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+import pytest
+from models.stats import (CustomerStats, StatsRefresher, customer_stats, rolled_up,
+                          stats_refresh, views)
+from sqlalchemy.dialects import postgresql
+
+
+def render(statement):
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+@pytest.fixture
+def stats_session(db_engine, db_session):
+    views.create_all(db_engine)
+    rows = [
+        dict(rolled_up=0b1111, customers=3, avg_age=30.0),
+        dict(rolled_up=0b0111, country="Atadom", customers=2, avg_age=25.0),
+        dict(rolled_up=0b0111, country=None, customers=1, avg_age=40.0),
+        dict(rolled_up=0b0101, country="Atadom", married=True, customers=2, avg_age=25.0)]
+    db_engine.execute(customer_stats.insert(),
+                      [{**dict.fromkeys(customer_stats.c.keys()), **row} for row in rows])
+    return db_session()
+
+
+@pytest.mark.parametrize('group_by, expected', [
+    ((), 0b1111),
+    ({'country'}, 0b0111),
+    ({'age_bucket', 'city'}, 0b1010),
+    ({'country', 'city', 'married', 'age_bucket'}, 0)])
+def test_rolled_up(group_by, expected):
+    assert rolled_up(group_by) == expected
+
+
+def test_customer_stats(stats_session):
+    stats = CustomerStats(stats_session)
+
+    assert stats.get() == [dict(customers=3, avg_age=30.0, avg_height=None, avg_weight=None)]
+    assert [(g['country'], g['customers']) for g in stats.get({'country'})] == \
+        [(None, 1), ("Atadom", 2)]
+    assert [(g['country'], g['married']) for g in stats.get({'married', 'country'})] == \
+        [("Atadom", True)]
+
+
+def test_customer_stats_refreshed_at(stats_session):
+    assert CustomerStats(stats_session).refreshed_at() is None
+
+    stats_session.execute(stats_refresh.insert().values(view='customer_stats',
+                                                        refreshed_at=datetime(2021, 1, 1)))
+
+    assert CustomerStats(stats_session).refreshed_at() == datetime(2021, 1, 1)
+
+
+def refresher(locked=True, refreshed_at=None):
+    engine = MagicMock()
+    connection = engine.begin.return_value.__enter__.return_value
+    connection.execute.return_value.scalar.side_effect = [locked, refreshed_at]
+    return StatsRefresher(engine, interval=60), connection
+
+
+def executed(connection):
+    return [c[0][0] if isinstance(c[0][0], str) else render(c[0][0])
+            for c in connection.execute.call_args_list]
+
+
+def test_refresh_if_stale():
+    stats_refresher, connection = refresher()
+
+    assert stats_refresher.refresh_if_stale() == 0.0
+
+    statements = executed(connection)
+    assert 'pg_try_advisory_xact_lock' in statements[0]
+    assert statements[2] == 'REFRESH MATERIALIZED VIEW CONCURRENTLY customer_stats'
+    assert statements[3].startswith('INSERT INTO stats_refresh')
+    assert 'ON CONFLICT (view) DO UPDATE SET refreshed_at = excluded.refreshed_at' in statements[3]
+
+
+def test_refresh_if_stale_when_fresh():
+    stats_refresher, connection = refresher(refreshed_at=datetime.now() - timedelta(seconds=10))
+
+    assert 10 <= stats_refresher.refresh_if_stale() < 60
+    assert len(executed(connection)) == 2
+
+    stats_refresher, connection = refresher(refreshed_at=datetime.now() - timedelta(seconds=61))
+
+    assert stats_refresher.refresh_if_stale() == 0.0
+    assert len(executed(connection)) == 4
+
+
+def test_refresh_if_stale_while_locked():
+    stats_refresher, connection = refresher(locked=False)
+
+    assert stats_refresher.refresh_if_stale() == 0.0
+    assert len(executed(connection)) == 1
+
+
+def test_refresher_run():
+    stats_refresher = StatsRefresher(MagicMock(), interval=60)
+    waits = []
+
+    def wait(timeout):
+        waits.append(timeout)
+        if len(waits) == 3:
+            stats_refresher.stopping.set()
+
+    with patch.object(stats_refresher, 'refresh_if_stale', side_effect=[0.0, 59.5, Exception()]), \
+            patch.object(stats_refresher.stopping, 'wait', side_effect=wait):
+        stats_refresher.run()
+
+    assert waits == [60.0, 1.0, 60.0]
+
+
+def test_refresher_start_and_stop():
+    engine = MagicMock()
+    engine.dialect.name = 'postgresql'
+    engine.begin.side_effect = Exception()
+    stats_refresher = StatsRefresher(engine, interval=60)
+
+    stats_refresher.start()
+    stats_refresher.start()
+    assert stats_refresher.running
+    stats_refresher.stop()
+    stats_refresher.stop()
+    assert not stats_refresher.running
+
+    disabled = StatsRefresher(engine, interval=0)
+    disabled.start()
+    assert not disabled.running
+
+    engine.dialect.name = 'sqlite'
+    sqlite = StatsRefresher(engine, interval=60)
+    sqlite.start()
+    assert not sqlite.running
@@ -0,0 +1,32 @@
+from uuid import UUID
+
+import pytest
+from models.types import GUID
+from sqlalchemy import Column, MetaData, Table, create_engine, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+ID = UUID('47dd46aa-2668-4fe6-a8db-e6a47dd63cde')
+
+
+@pytest.mark.parametrize('dialect, expected', [
+    (postgresql.dialect(), 'UUID'), (sqlite.dialect(), 'CHAR(36)')])
+def test_guid_column_type(dialect, expected):
+    assert GUID().dialect_impl(dialect).compile(dialect=dialect) == expected
+
+
+def test_guid_binds():
+    assert GUID().process_bind_param(ID, postgresql.dialect()) is ID
+    assert GUID().process_bind_param(ID, sqlite.dialect()) == str(ID)
+    assert GUID().process_bind_param(str(ID), sqlite.dialect()) == str(ID)
+    assert GUID().process_bind_param(None, sqlite.dialect()) is None
+
+
+def test_guid_round_trip():
+    engine = create_engine('sqlite://')
+    table = Table('t', MetaData(), Column('id', GUID))
+    table.create(engine)
+
+    engine.execute(table.insert(), [{'id': ID}, {'id': None}])
+
+    assert [row.id for row in engine.execute(select([table.c.id]))] == [ID, None]
+    assert engine.execute(select([table.c.id]).where(table.c.id == str(ID))).scalar() == ID
@@ -0,0 +1,61 @@
+import pytest
+from seed.coremetadata import customer
+from seed.seeddb import (CUSTOMER_COLUMNS, chunks, copy_rows, generate_chunk,
+                         parse_args)
+
+
+def test_chunks():
+    assert chunks(25, 10) == [(0, 10), (10, 10), (20, 5)]
+    assert chunks(0, 10) == []
+
+
+def generated(*args):
+    return [[{k: v for (k, v) in row.items() if k not in ('last_updated', 'created_at')}
+             for row in rows] for rows in generate_chunk(*args)]
+
+
+def test_generate_chunk_is_deterministic():
+    customers, addresses = generate_chunk(1, 0, 50, 0, 3)
+
+    assert generated(1, 0, 50, 0, 3) == generated(1, 0, 50, 0, 3)
+    assert generated(2, 0, 50, 0, 3) != generated(1, 0, 50, 0, 3)
+    assert generated(1, 50, 50, 0, 3) != generated(1, 0, 50, 0, 3)
+    assert len(customers) == 50
+    assert {c['id'] for c in customers} >= {a['customer_id'] for a in addresses}
+
+
+@pytest.mark.parametrize('min_addresses, max_addresses', [(0, 0), (2, 2), (1, 4)])
+def test_generate_chunk_address_fan_out(min_addresses, max_addresses):
+    customers, addresses = generate_chunk(0, 0, 20, min_addresses, max_addresses)
+
+    for c in customers:
+        count = sum(a['customer_id'] == c['id'] for a in addresses)
+        assert min_addresses <= count <= max_addresses
+
+
+def test_generate_chunk_fits_the_schema():
+    customers, _ = generate_chunk(0, 0, 100, 0, 0)
+
+    assert all(set(c) == set(CUSTOMER_COLUMNS) for c in customers)
+    assert all(0 < c['age'] < 100 for c in customers)
+    assert all(len(c['first_name']) <= customer.c.first_name.type.length for c in customers)
+
+
+def test_copy_rows_escapes():
+    rows = [{'a': 'tab\there', 'b': None}, {'a': 'back\\slash\n', 'b': 1}]
+
+    assert copy_rows(rows, ['a', 'b']).read() == 'tab\\there\t\\N\nback\\\\slash\\n\t1\n'
+
+
+def test_parse_args():
+    args = parse_args(['--customers', '1000', '--seed', '7', '--skip-if-exists'])
+
+    assert (args.customers, args.seed, args.skip_if_exists) == (1000, 7, True)
+    assert args.method == 'copy'
+
+
+@pytest.mark.parametrize('argv', [['--customers', '-1'], ['--chunk-size', '0'],
+                                  ['--min-addresses', '3', '--max-addresses', '2']])
+def test_parse_args_invalid(argv):
+    with pytest.raises(SystemExit):
+        parse_args(argv)
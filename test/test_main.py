@@ -1,5 +1,52 @@
+import importlib
+from unittest.mock import patch
+
+import main
+from controllers.instrumentation import configure_request_log, use_threadpool
+from models import engine
+from models.async_base_model import database
+from models.audit import audit_writer
+from models.cache import cache_listener
+from models.lifecycle import lifecycle, warm_up
+from models.metrics import metrics_store
+from models.stats import stats_refresher
+
+
 def test_home(client):
     response = client.get('/')
 
     assert response.json() == "Hello"
-    assert response.status_code == 200
\ No newline at end of file
+    assert response.status_code == 200
+
+
+def route_modules(app, path):
+    return [r.endpoint.__module__ for r in app.routes if r.path == path]
+
+
+def test_sync_mode():
+    assert route_modules(main.app, '/customers/') == ['controllers.customer'] * 4
+    assert main.app.router.on_startup == [configure_request_log, use_threadpool, warm_up,
+                                          audit_writer.start, cache_listener.start,
+                                          stats_refresher.start, metrics_store.start,
+                                          lifecycle.ready]
+    assert main.app.router.on_shutdown == [lifecycle.stop, audit_writer.stop, cache_listener.stop,
+                                           stats_refresher.stop, metrics_store.stop,
+                                           engine.dispose]
+
+
+def test_async_mode():
+    try:
+        with patch('models.db_mode', 'async'):
+            app = importlib.reload(main).app
+    finally:
+        importlib.reload(main)
+
+    assert route_modules(app, '/customers/') == [
+        'controllers.async_customer'] * 4 + ['controllers.customer'] * 4
+    assert app.router.on_startup == [configure_request_log, use_threadpool, warm_up,
+                                     audit_writer.start, cache_listener.start,
+                                     stats_refresher.start, metrics_store.start, database.connect,
+                                     lifecycle.ready]
+    assert app.router.on_shutdown == [lifecycle.stop, audit_writer.stop, cache_listener.stop,
+                                      stats_refresher.stop, metrics_store.stop,
+                                      database.disconnect, engine.dispose]